@@ -0,0 +1,163 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+LOG_FILE = "app.log"
+# disk use is bounded by MAX_BYTES * (BACKUP_COUNT + 1)
+MAX_BYTES = 1024 * 1024
+BACKUP_COUNT = 5
+ROTATE_EVERY = 24 * 3600
+# records waiting for the writer; when it falls this far behind, new records are dropped
+QUEUE_SIZE = 10000
+
+_listener = None
+_handler = None
+_queue_handler = None
+_lock = threading.Lock()
+
+
+# ---------------------------
+# Structured records
+# ---------------------------
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, thread, msg, uptime_ms
+    (since the process started logging), plus exc for tracebacks and any
+    `fields` passed as extra={'fields': {...}} (timed() adds duration_ms).
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+            'uptime_ms': round(record.relativeCreated, 1),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    # never blocks the caller (the UI thread, usually): a full queue drops the record
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # render message and traceback now: args and frames may change before the writer runs
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# ---------------------------
+# Rotating writer
+# ---------------------------
+class SizeAndTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotates when the file would exceed maxBytes or is older than `interval` seconds."""
+
+    def __init__(self, filename, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, interval=ROTATE_EVERY):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, encoding='utf-8', delay=True)
+        self.interval = interval
+        try:
+            # a file left by an earlier run counts from when it was last written
+            self._opened_at = os.path.getmtime(filename)
+        except OSError:
+            self._opened_at = time.time()
+
+    def shouldRollover(self, record):
+        if self.interval and time.time() - self._opened_at >= self.interval and os.path.exists(self.baseFilename):
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self._opened_at = time.time()
+
+
+# ---------------------------
+# Setup
+# ---------------------------
+def setup(log_dir, level=logging.INFO, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, interval=ROTATE_EVERY):
+    """
+    Send every log record (Kivy's Logger included) to `log_dir`/app.log as
+    JSON lines. Callers only put records on a bounded queue; a background
+    thread formats, writes and rotates. Returns the log file path.
+    """
+    global _listener, _handler, _queue_handler
+    with _lock:
+        if _listener is not None:
+            return _handler.baseFilename
+        os.makedirs(log_dir, exist_ok=True)
+        handler = SizeAndTimeRotatingFileHandler(
+            os.path.join(log_dir, LOG_FILE), maxBytes=max_bytes, backupCount=backup_count, interval=interval,
+        )
+        handler.setFormatter(JsonFormatter())
+        log_queue = queue.Queue(QUEUE_SIZE)
+        queue_handler = _DroppingQueueHandler(log_queue)
+        queue_handler.setLevel(level)
+        listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=False)
+        listener.start()
+        logging.getLogger().addHandler(queue_handler)
+        _listener, _handler, _queue_handler = listener, handler, queue_handler
+    return handler.baseFilename
+
+
+def shutdown():
+    """Write out what is still queued and close the file (App.on_stop)."""
+    global _listener, _handler, _queue_handler
+    with _lock:
+        if _listener is None:
+            return
+        if _queue_handler.dropped:
+            log.warning(f"Log: dropped {_queue_handler.dropped} records, the writer could not keep up")
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        _handler.close()
+        _listener = _handler = _queue_handler = None
+
+
+def log_path():
+    """The current log file, or None before setup()."""
+    return _handler.baseFilename if _handler is not None else None
+
+
+@contextmanager
+def timed(logger, event, level=logging.INFO, **fields):
+    """Log `event` once the block finishes, with its duration_ms and `fields`."""
+    started = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        fields['error'] = repr(e)
+        raise
+    finally:
+        fields['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        logger.log(level, event, extra={'fields': fields})
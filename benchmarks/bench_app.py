@@ -0,0 +1,192 @@
+"""
+Headless startup / navigation benchmarks for the Health app.
+
+Runs Kivy without a display (SDL offscreen video driver, null video
+provider) against generated databases of 1k, 10k and 100k patients and
+times: app build, splash -> main transition, patient list render, patient
+details render and add-patient insert. Results are written as JSON so runs
+can be compared over time.
+
+    python benchmarks/bench_app.py
+    python benchmarks/bench_app.py --sizes 1000 10000 --repeat 20 --output results.json
+
+Set SDL_VIDEODRIVER / KIVY_WINDOW / KIVY_GL_BACKEND yourself to use another
+headless setup (e.g. KIVY_GL_BACKEND=mock where the SDL build supports it).
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchutil import (
+    DEFAULT_SIZES, ROOT, generate_patients, new_report, print_results, summarize, write_report,
+)
+
+
+def _setup_headless_env(work_dir):
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+    # keep stderr ours: in the default KIVY mode Kivy reroutes it into its logger
+    os.environ.setdefault('KIVY_LOG_MODE', 'MIXED')
+    os.environ.setdefault('SDL_VIDEODRIVER', 'offscreen')
+    os.environ.setdefault('KIVY_WINDOW', 'sdl2')
+    os.environ.setdefault('KIVY_VIDEO', 'null')
+    os.environ.setdefault('KIVY_AUDIO', 'sdl2')
+    os.environ['KIVY_HOME'] = os.path.join(work_dir, 'kivy_home')
+    os.makedirs(os.environ['KIVY_HOME'], exist_ok=True)
+
+
+class Harness:
+    def __init__(self, main):
+        from kivy.base import EventLoop
+        from kivy.core.window import Window
+
+        self.main = main
+        self.EventLoop = EventLoop
+        self.Window = Window
+        EventLoop.ensure_window()
+
+    def frame(self):
+        self.EventLoop.idle()
+
+    def run_until(self, condition, timeout=30.0):
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise TimeoutError("benchmark step did not finish in time")
+            self.frame()
+        # one more frame so layout and drawing of the result are included
+        self.frame()
+
+    def timed(self, start, condition, timeout=30.0):
+        started = time.perf_counter()
+        start()
+        self.run_until(condition, timeout)
+        return (time.perf_counter() - started) * 1000
+
+
+def prepare_database(main, home, size):
+    """Create the app's DB for `home` through the app's own schema setup and fill it."""
+    os.environ['HOME'] = home
+    app = main.Health()
+    main.close_db_pool()
+    main.get_patients().add_many(generate_patients(size))
+    return app
+
+
+def bench_size(main, harness, home, size, repeat):
+    results = {}
+    Window = harness.Window
+
+    app = prepare_database(main, home, size)
+
+    # --- app build ---
+    samples = []
+    for _ in range(repeat):
+        for child in list(Window.children):
+            Window.remove_widget(child)
+        started = time.perf_counter()
+        root = app.build()
+        Window.add_widget(root)
+        harness.frame()
+        samples.append((time.perf_counter() - started) * 1000)
+    results['app_build'] = summarize(samples)
+    sm = root
+    app.root = root
+    # splash would otherwise leave on its own timer mid-measurement
+    sm.get_screen('splash').go_next = lambda: None
+
+    # --- splash -> main transition (includes building 'main' on first use) ---
+    samples = []
+    for _ in range(repeat):
+        sm.current = 'splash'
+        harness.run_until(lambda: not sm.transition.is_active)
+        samples.append(harness.timed(
+            lambda: setattr(sm, 'current', 'main'),
+            lambda: sm.current_screen.name == 'main' and not sm.transition.is_active,
+        ))
+    results['splash_to_main'] = summarize(samples)
+
+    # --- patient list render ---
+    sm.transition.duration = 0
+    record = sm.get_screen('record')
+    sm.current = 'record'
+    harness.run_until(lambda: record._pending is None)
+    samples = []
+    for _ in range(repeat):
+        samples.append(harness.timed(record.load_patients, lambda: record._pending is None))
+    results['list_render'] = summarize(samples)
+
+    # --- patient details render ---
+    details = sm.get_screen('patient_details')
+    ids = [random.Random(i).randint(1, size) for i in range(repeat)]
+    samples = []
+    for pid in ids:
+        samples.append(harness.timed(lambda: details.load_patient_data(pid), lambda: details._pending is None))
+    results['details_render'] = summarize(samples)
+
+    # --- add-patient insert ---
+    samples = []
+    for i in range(repeat):
+        popup = main.AddPatientPopup(parent_screen=record)
+        values = {
+            "Name": f"Bench Patient {i}", "Age": "40", "Contact": "9000000000",
+            "Last Visit (YYYY-MM-DD)": "2024-06-01",
+        }
+        for key, value in values.items():
+            popup.fields[key].text = value
+        samples.append(harness.timed(lambda: popup.add_patient(None), lambda: not popup._saving))
+        # close the success message opened by the popup
+        for child in list(Window.children):
+            if child is not sm:
+                Window.remove_widget(child)
+    results['insert'] = summarize(samples)
+
+    main.shutdown_db_executor()
+    main.close_db_pool()
+    return results
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help="JSON results file (default: benchmarks/results/app-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='vhr-bench-')
+    _setup_headless_env(work_dir)
+    os.chdir(ROOT)
+
+    # imported late: the environment above must be in place before Kivy loads
+    import kivy
+    import main
+
+    harness = Harness(main)
+    from kivy.graphics.opengl import GL_RENDERER, glGetString
+    report = new_report(
+        'app',
+        kivy=kivy.__version__,
+        # software GL (llvmpipe etc.) makes draw-heavy steps slower and noisier
+        gl_renderer=glGetString(GL_RENDERER).decode(errors='replace'),
+        repeat=args.repeat,
+    )
+    try:
+        for size in args.sizes:
+            home = os.path.join(work_dir, f"home-{size}")
+            os.makedirs(os.path.join(home, ".config"), exist_ok=True)
+            print(f"[bench] {size} patients...", file=sys.stderr)
+            report['results'][str(size)] = bench_size(main, harness, home, size, args.repeat)
+            print_results(report['results'][str(size)])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    write_report(report, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
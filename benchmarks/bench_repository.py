@@ -0,0 +1,162 @@
+"""
+Micro-benchmarks for every PatientRepository operation, without Kivy or a
+display. Each size gets a fresh DB in a temp dir (schema via migrations);
+every operation is timed `--repeat` times and summarised as median / p95.
+
+    python benchmarks/bench_repository.py
+    python benchmarks/bench_repository.py --sizes 100000 --repeat 200 --output repo.json
+    python benchmarks/bench_repository.py --db /path/to/health_records.db   # read ops on a copy of a real DB
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchutil import (
+    DEFAULT_SIZES, copy_db, generate_patients, new_report, print_results, summarize, write_report,
+)
+
+from patient_repository import open_repository
+from record_cache import LRUCache
+
+
+def _time(fn, repeat):
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def _count_like(repo, condition):
+    # the pre-v7 cohort count: a substring scan over every patient's conditions text
+    with repo.pool.reader() as conn:
+        return conn.execute(
+            'SELECT COUNT(*) FROM patients WHERE conditions LIKE ?', (f"%{condition}%",)
+        ).fetchone()[0]
+
+
+def bench_reads(repo, repeat, rng):
+    total = repo.count()
+    with repo.pool.reader() as conn:
+        max_id = conn.execute('SELECT MAX(id) FROM patients').fetchone()[0] or 1
+        # a cursor half-way down the list: a deep page should cost the same as the first
+        row = conn.execute(
+            'SELECT name, id FROM patients ORDER BY name, id LIMIT 1 OFFSET ?', (total // 2,)
+        ).fetchone()
+    cursor = tuple(row) if row else (None, 0)
+    results = {}
+
+    results['get'] = _time(lambda i: repo.get(rng.randint(1, max_id)), repeat)
+    results['get_miss'] = _time(lambda i: repo.get(-1 - i), repeat)
+    results['get_many_100'] = _time(
+        lambda i: repo.get_many(rng.randint(1, max_id) for _ in range(100)), repeat)
+    results['count'] = _time(lambda i: repo.count(), repeat)
+    results['page_first'] = _time(lambda i: repo.page(), repeat)
+    results['page_deep'] = _time(lambda i: repo.page(after=cursor), repeat)
+    results['page_before'] = _time(lambda i: repo.page(before=cursor), repeat)
+
+    results['search_common'] = _time(lambda i: repo.search('diabetes'), repeat)
+    results['search_prefix'] = _time(lambda i: repo.search('Kun Pat'), repeat)
+    results['search_none'] = _time(lambda i: repo.search('zzzzqx'), repeat)
+
+    # cohorts over the condition / medication terms (patient_terms), against the LIKE scan they replace
+    results['cohort'] = _time(lambda i: repo.cohort('diabetes'), repeat)
+    results['cohort_doctor'] = _time(lambda i: repo.cohort('diabetes', doctor='Dr. Rao'), repeat)
+    results['count_cohort'] = _time(lambda i: repo.count_cohort('diabetes'), repeat)
+    results['count_cohort_medication'] = _time(
+        lambda i: repo.count_cohort('diabetes', medication='metformin'), repeat)
+    results['count_cohort_like_scan'] = _time(lambda i: _count_like(repo, 'diabetes'), repeat)
+
+    # detail lookups through the LRU record cache, over a working set that fits it
+    repo.cache = LRUCache(256)
+    hot = [rng.randint(1, max_id) for _ in range(200)]
+    results['get_cached'] = _time(lambda i: repo.get(hot[i % len(hot)]), max(repeat, 2 * len(hot)))
+    results['get_cached']['cache'] = repo.cache.stats()
+    repo.cache = None
+    return results
+
+
+def bench_writes(repo, repeat):
+    results = {}
+    new_rows = list(generate_patients(repeat, seed=7))
+    added = []
+    results['add'] = _time(lambda i: added.append(repo.add(new_rows[i])), repeat)
+
+    batch = list(generate_patients(1000, seed=8))
+    results['add_many_1000'] = _time(lambda i: repo.add_many(batch), max(1, repeat // 10))
+
+    # a plain column, then conditions, which also rewrites the patient's terms
+    results['update'] = _time(lambda i: repo.update(added[i], {'notes': f"bench note {i}"}), repeat)
+    results['update_conditions'] = _time(
+        lambda i: repo.update(added[i], {'conditions': 'Diabetes, Hypertension (I10)' if i % 2 else 'Asthma'}), repeat)
+
+    results['delete'] = _time(lambda i: repo.delete(added[i]), repeat)
+    # delete 100 of the rows add_many just created per sample
+    with repo.pool.reader() as conn:
+        recent = [r[0] for r in conn.execute(
+            'SELECT id FROM patients ORDER BY id DESC LIMIT ?', (100 * max(1, repeat // 10),))]
+    results['delete_many_100'] = _time(
+        lambda i: repo.delete_many(recent[i * 100:(i + 1) * 100]), max(1, repeat // 10))
+    return results
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--db', help="benchmark read operations against a copy of this existing DB instead")
+    parser.add_argument('--output', help="JSON results file (default: benchmarks/results/repository-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    report = new_report('repository', repeat=args.repeat)
+
+    if args.db:
+        if not os.path.exists(args.db):
+            parser.error(f"database not found: {args.db}")
+        work_dir = tempfile.mkdtemp(prefix='vhr-bench-repo-')
+        try:
+            repo = open_repository(copy_db(args.db, work_dir))
+            try:
+                print(f"[bench] {args.db} (read operations, on a copy)...", file=sys.stderr)
+                results = bench_reads(repo, args.repeat, rng)
+                report['results'][os.path.basename(args.db)] = results
+                print_results(results)
+            finally:
+                repo.close()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        write_report(report, args.output)
+        return 0
+
+    work_dir = tempfile.mkdtemp(prefix='vhr-bench-repo-')
+    try:
+        for size in args.sizes:
+            repo = open_repository(os.path.join(work_dir, f"patients-{size}.db"))
+            try:
+                print(f"[bench] {size} patients...", file=sys.stderr)
+                started = time.perf_counter()
+                repo.add_many(generate_patients(size))
+                load_s = time.perf_counter() - started
+                results = {'load': {'rows': size, 'seconds': round(load_s, 3),
+                                    'rows_per_sec': round(size / load_s) if load_s else 0}}
+                results.update(bench_reads(repo, args.repeat, rng))
+                results.update(bench_writes(repo, args.repeat))
+                report['results'][str(size)] = results
+                print_results({k: v for k, v in results.items() if k != 'load'})
+            finally:
+                repo.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    write_report(report, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,90 @@
+"""
+Shared helpers for the benchmark scripts: sample summaries, seeded patient
+data (synthetic_data) and the JSON report format.
+"""
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def summarize(samples):
+    """median / p90 / p95 / p99 / min / max of a list of millisecond timings."""
+    ordered = sorted(samples)
+    return {
+        'n': len(samples),
+        'median_ms': round(statistics.median(samples), 3),
+        'p90_ms': round(percentile(ordered, 90), 3),
+        'p95_ms': round(percentile(ordered, 95), 3),
+        'p99_ms': round(percentile(ordered, 99), 3),
+        'min_ms': round(ordered[0], 3),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+
+def generate_patients(n, seed=42):
+    """Yield `n` seeded synthetic patient rows (INSERT_PATIENT_SQL column order)."""
+    from synthetic_data import iter_patients
+    return iter_patients(n, seed=seed)
+
+
+def copy_db(path, work_dir):
+    """
+    Snapshot the DB at `path` into `work_dir` through a read-only connection
+    (WAL included) and return the copy's path. Benchmarks run on the copy:
+    opening a DB migrates it and backfills its terms, and load runs write,
+    so a real health_records.db is never touched.
+    """
+    copy = os.path.join(work_dir, os.path.basename(path))
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    target = sqlite3.connect(copy)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return copy
+
+
+def new_report(benchmark, **extra):
+    report = {
+        'benchmark': benchmark,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+    report.update(extra)
+    report['results'] = {}
+    return report
+
+
+def print_results(results):
+    for name, stats in results.items():
+        print(f"  {name:<20} median {stats['median_ms']:9.3f} ms   p95 {stats['p95_ms']:9.3f} ms",
+              file=sys.stderr)
+
+
+def write_report(report, output=None):
+    """Write `report` as JSON (default: benchmarks/results/<name>-<timestamp>.json)."""
+    output = output or os.path.join(
+        ROOT, 'benchmarks', 'results',
+        f"{report['benchmark']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] results written to {output}", file=sys.stderr)
+    return output
@@ -0,0 +1,285 @@
+"""
+Load test for the app's DB layer (db_pool + PatientRepository), no Kivy.
+
+Replays a seeded mix of reads, inserts and deletes from several threads
+against one shared ConnectionPool, the way the app's DB executor and
+background jobs share it, then reports throughput and latency percentiles
+per operation. The same --seed replays the same operation sequence.
+
+    python benchmarks/load_test.py --rows 1000000 --threads 4 --duration 30
+    python benchmarks/load_test.py --db /path/to/health_records.db --mix get=70,page=20,search=10
+    python benchmarks/load_test.py --rows 100000 --ops 50000 --mix get=50,page=15,search=10,add=15,delete=10
+
+Operations: get (detail lookup), get_many (100 ids), page (list page at a
+random cursor), search (FTS), add (single insert), delete (deletes a row
+this run inserted). With --db the run works on a copy of that DB, which
+is removed afterwards: the original is never written.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from benchutil import copy_db, new_report, percentile, write_report
+
+from patient_repository import open_repository
+from synthetic_data import CONDITIONS, FIRST_NAMES, LAST_NAMES, PatientGenerator, populate
+
+DEFAULT_MIX = 'get=50,get_many=5,page=20,search=10,add=10,delete=5'
+SEARCH_TERMS = FIRST_NAMES + LAST_NAMES + [c for c, _ in CONDITIONS] + ['Kun', 'Pat', 'Dia']
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"unknown operation '{name}' (choose from {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("the workload mix needs at least one operation with a positive weight")
+    return mix
+
+
+# ---------------------------
+# Operations
+# ---------------------------
+class Workload:
+    """Shared state of one run: id range, rows inserted by the run, generator."""
+
+    def __init__(self, repo, seed):
+        self.repo = repo
+        with repo.pool.reader() as conn:
+            self.max_id = conn.execute('SELECT MAX(id) FROM patients').fetchone()[0] or 1
+        self._generator = PatientGenerator(seed + 1000)
+        self._generator_lock = threading.Lock()
+        self._inserted = []
+        self._inserted_lock = threading.Lock()
+
+    def new_row(self):
+        with self._generator_lock:
+            return self._generator.batch(1)[0]
+
+    def remember(self, patient_id):
+        with self._inserted_lock:
+            self._inserted.append(patient_id)
+
+    def take_inserted(self, rng):
+        with self._inserted_lock:
+            if not self._inserted:
+                return None
+            i = rng.randrange(len(self._inserted))
+            self._inserted[i], self._inserted[-1] = self._inserted[-1], self._inserted[i]
+            return self._inserted.pop()
+
+    def cleanup(self):
+        # leave an existing DB as we found it
+        with self._inserted_lock:
+            ids, self._inserted = self._inserted, []
+        return self.repo.delete_many(ids)
+
+
+def op_get(w, rng):
+    w.repo.get(rng.randint(1, w.max_id))
+
+
+def op_get_many(w, rng):
+    w.repo.get_many([rng.randint(1, w.max_id) for _ in range(100)])
+
+
+def op_page(w, rng):
+    # a cursor somewhere in the alphabet, like a user who has scrolled a while
+    w.repo.page(after=(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", rng.randint(1, w.max_id)))
+
+
+def op_search(w, rng):
+    w.repo.search(rng.choice(SEARCH_TERMS))
+
+
+def op_add(w, rng):
+    w.remember(w.repo.add(w.new_row()))
+
+
+def op_delete(w, rng):
+    patient_id = w.take_inserted(rng)
+    if patient_id is None:
+        # nothing of ours to delete yet: insert instead, keeping the write load
+        op_add(w, rng)
+        return
+    w.repo.delete(patient_id)
+
+
+OPERATIONS = {
+    'get': op_get,
+    'get_many': op_get_many,
+    'page': op_page,
+    'search': op_search,
+    'add': op_add,
+    'delete': op_delete,
+}
+
+
+# ---------------------------
+# Runner
+# ---------------------------
+def run(repo, mix, threads, duration=None, ops=None, seed=0):
+    """
+    Run the workload on `threads` threads until `duration` seconds pass or
+    `ops` operations complete. Returns (per-op latencies in ms, errors, elapsed).
+    """
+    workload = Workload(repo, seed)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    remaining = [ops]
+    start_barrier = threading.Barrier(threads + 1)
+    deadline = [None]
+
+    def next_op_allowed():
+        if remaining[0] is None:
+            return time.perf_counter() < deadline[0]
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(index):
+        rng = random.Random(seed * 7919 + index)
+        local = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        start_barrier.wait()
+        while next_op_allowed():
+            name = rng.choices(names, weights=weights)[0]
+            started = time.perf_counter()
+            try:
+                OPERATIONS[name](workload, rng)
+            except Exception:
+                local_errors[name] += 1
+                continue
+            local[name].append((time.perf_counter() - started) * 1000)
+        with lock:
+            for name in names:
+                latencies[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    workers = [threading.Thread(target=worker, args=(i,), name=f'load-{i}', daemon=True) for i in range(threads)]
+    for t in workers:
+        t.start()
+    deadline[0] = time.perf_counter() + (duration or 0)
+    started = time.perf_counter()
+    start_barrier.wait()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    workload.cleanup()
+    return latencies, errors, elapsed
+
+
+def summarize_run(latencies, errors, elapsed):
+    results = {}
+    all_samples = []
+    for name, samples in latencies.items():
+        all_samples.extend(samples)
+        results[name] = _op_stats(samples, errors[name], elapsed)
+    results['total'] = _op_stats(all_samples, sum(errors.values()), elapsed)
+    return results
+
+
+def _op_stats(samples, errors, elapsed):
+    ordered = sorted(samples)
+    stats = {
+        'ops': len(samples),
+        'errors': errors,
+        'ops_per_sec': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+    }
+    if ordered:
+        stats.update({
+            'p50_ms': round(percentile(ordered, 50), 3),
+            'p90_ms': round(percentile(ordered, 90), 3),
+            'p99_ms': round(percentile(ordered, 99), 3),
+            'max_ms': round(ordered[-1], 3),
+        })
+    return stats
+
+
+def print_run(results):
+    print(f"  {'op':<10}{'ops':>9}{'ops/s':>11}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'err':>6}",
+          file=sys.stderr)
+    for name, s in results.items():
+        print(f"  {name:<10}{s['ops']:>9}{s['ops_per_sec']:>11.1f}{s.get('p50_ms', 0):>10.3f}"
+              f"{s.get('p90_ms', 0):>10.3f}{s.get('p99_ms', 0):>10.3f}{s.get('max_ms', 0):>10.3f}{s['errors']:>6}",
+              file=sys.stderr)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--db', help="run against a copy of this existing DB")
+    source.add_argument('--rows', type=int, default=100000, help="generate a temporary DB of this many patients")
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=None, help="pool reader connections (default: --threads)")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to run (ignored with --ops)")
+    parser.add_argument('--ops', type=int, help="stop after this many operations instead")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"operation weights (default: {DEFAULT_MIX})")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="JSON results file (default: benchmarks/results/load-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.db and not os.path.exists(args.db):
+        parser.error(f"database not found: {args.db}")
+
+    readers = args.readers or args.threads
+    work_dir = tempfile.mkdtemp(prefix='vhr-load-')
+    try:
+        db_path = copy_db(args.db, work_dir) if args.db else os.path.join(work_dir, 'health_records.db')
+        repo = open_repository(db_path, readers=readers)
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    try:
+        if not args.db:
+            print(f"[load] generating {args.rows} patients...", file=sys.stderr)
+            stats = populate(repo, args.rows, seed=args.seed)
+            print(f"[load] generated in {stats['elapsed']:.1f}s", file=sys.stderr)
+
+        print(f"[load] {args.threads} threads, mix {args.mix}, "
+              f"{f'{args.ops} ops' if args.ops else f'{args.duration:g}s'}...", file=sys.stderr)
+        latencies, errors, elapsed = run(repo, mix, args.threads, duration=args.duration,
+                                         ops=args.ops, seed=args.seed)
+        results = summarize_run(latencies, errors, elapsed)
+        print_run(results)
+
+        report = new_report(
+            'load',
+            db=args.db or f"synthetic:{args.rows}",
+            patients=repo.count(),
+            threads=args.threads,
+            readers=readers,
+            mix=mix,
+            seed=args.seed,
+            elapsed_s=round(elapsed, 3),
+            pool=repo.pool.stats(),
+        )
+        report['results'] = results
+    finally:
+        repo.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    write_report(report, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
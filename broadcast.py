@@ -0,0 +1,260 @@
+import logging
+import string
+import threading
+import time
+import uuid
+
+from patient_repository import Patient
+
+log = logging.getLogger(__name__)
+
+# placeholders a broadcast template may use, e.g. "Dear {first_name}, ..."
+TEMPLATE_FIELDS = list(Patient._fields) + ['first_name']
+
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+CANCELLED = 'cancelled'
+
+
+# ---------------------------
+# Message templates
+# ---------------------------
+def check_template(template):
+    """Raise ValueError if `template` is empty, malformed or uses an unknown placeholder."""
+    if not template or not template.strip():
+        raise ValueError("The message is empty.")
+    try:
+        parsed = list(string.Formatter().parse(template))
+    except ValueError as e:
+        raise ValueError(f"Bad template: {e}")
+    for _, field, _, _ in parsed:
+        if field is not None and field not in TEMPLATE_FIELDS:
+            raise ValueError(f"Unknown placeholder {{{field}}}. Use one of: "
+                             + ", ".join(f"{{{f}}}" for f in TEMPLATE_FIELDS))
+
+
+def render(template, patient):
+    """The message for one Patient, with empty values for missing fields."""
+    values = {field: ("" if value is None else value) for field, value in zip(Patient._fields, patient)}
+    values['first_name'] = (patient.name or "").split(" ")[0]
+    return template.format_map(values)
+
+
+# ---------------------------
+# Cohort broadcast
+# ---------------------------
+class Broadcast:
+    """
+    Sends one templated message to every patient matching a cohort filter
+    (see PatientRepository.cohort). A feeder thread pages through the cohort
+    and hands messages to the SMS outbox, whose workers do the actual
+    sending with their retries and rate limit. At most `window` messages of
+    this broadcast are in the outbox at a time, so pause() and cancel() take
+    effect within a window rather than after the whole cohort was queued.
+
+    Messages carry the broadcast's `tag`, so the outbox keeps the
+    per-recipient outcome after the app restarts; `results` holds it for
+    this run ({patient id: (status, error)}, names in `names`).
+    `on_progress(progress())` is called from background threads on every
+    change.
+    """
+
+    def __init__(self, repo, outbox, template, condition=None, doctor=None,
+                 window=20, page_size=200, priority=-1, on_progress=None, medication=None):
+        check_template(template)
+        self.repo = repo
+        self.outbox = outbox
+        self.template = template
+        self.condition = condition
+        self.doctor = doctor
+        self.medication = medication
+        self.window = max(1, window)
+        self.page_size = page_size
+        # below one-off messages, so a big broadcast never delays them
+        self.priority = priority
+        self.on_progress = on_progress
+        self.tag = f"broadcast:{uuid.uuid4().hex[:12]}"
+        self.results = {}
+        self.names = {}
+        self.total = None
+        self.state = RUNNING
+        self.started_at = None
+        self.finished_at = None
+        self._counts = {'queued': 0, 'sending': 0, 'sent': 0, 'failed': 0, 'skipped': 0}
+        self._submitted = 0
+        self._in_flight = threading.BoundedSemaphore(self.window)
+        self._resume = threading.Event()
+        self._resume.set()
+        self._cancelled = threading.Event()
+        self._fed = threading.Event()
+        self._lock = threading.Lock()
+        # held by cancel() and around each enqueue: nothing is queued after cancel() has run
+        self._enqueue_lock = threading.Lock()
+        self._thread = None
+
+    # --- control ---
+    def start(self):
+        if self._thread is not None:
+            return
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._feed, name='broadcast', daemon=True)
+        self._thread.start()
+
+    def pause(self):
+        if self.state == RUNNING:
+            self.state = PAUSED
+            self._resume.clear()
+            self._report()
+
+    def resume(self):
+        if self.state == PAUSED:
+            self.state = RUNNING
+            self._resume.set()
+            self._report()
+
+    def cancel(self):
+        """Stop feeding and fail the messages still waiting in the outbox."""
+        with self._enqueue_lock:
+            if self.state in (DONE, CANCELLED):
+                return
+            self.state = CANCELLED
+            self._cancelled.set()
+            self._resume.set()
+        # an enqueue in progress finished before the lock was ours, so this catches it
+        self.outbox.cancel(self.tag)
+        self._finish_if_done()
+        self._report()
+
+    def wait(self, timeout=None):
+        """Block until the broadcast is done or cancelled; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.state not in (DONE, CANCELLED) or self.finished_at is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.02)
+        return True
+
+    # --- status ---
+    def progress(self):
+        with self._lock:
+            counts = self._counts
+            return {
+                'state': self.state,
+                'total': self.total,
+                'queued': self._submitted,
+                'sent': counts['sent'],
+                'failed': counts['failed'],
+                'skipped': counts['skipped'],
+                'pending': counts['queued'] + counts['sending'],
+                'elapsed': round((self.finished_at or time.time()) - self.started_at, 3)
+                if self.started_at else 0.0,
+            }
+
+    def _report(self):
+        if self.on_progress is not None:
+            try:
+                self.on_progress(self.progress())
+            except Exception:
+                log.exception("Broadcast: progress callback failed")
+
+    # --- feeder ---
+    def _feed(self):
+        try:
+            self.total = self.repo.count_cohort(self.condition, self.doctor, medication=self.medication)
+            log.info(f"Broadcast: {self.tag} to {self.total} patients")
+            self._report()
+            after_id = 0
+            while not self._cancelled.is_set():
+                patients = self.repo.cohort(self.condition, self.doctor, after_id=after_id, limit=self.page_size,
+                                            medication=self.medication)
+                if not patients:
+                    break
+                after_id = patients[-1].id
+                for patient in patients:
+                    if not self._send(patient):
+                        break
+        except Exception:
+            log.exception(f"Broadcast: {self.tag} stopped")
+            self.state = CANCELLED
+            self.outbox.cancel(self.tag, reason="broadcast stopped")
+        finally:
+            self._fed.set()
+            self._finish_if_done()
+            self._report()
+
+    def _send(self, patient):
+        # blocks while paused or while `window` messages are still in the outbox
+        self._resume.wait()
+        while not self._in_flight.acquire(timeout=0.2):
+            if self._cancelled.is_set():
+                return False
+        if self._cancelled.is_set():
+            self._in_flight.release()
+            return False
+        self._resume.wait()
+
+        self.names[patient.id] = patient.name
+        if not patient.contact:
+            self._skip(patient, "no contact number")
+            return True
+        try:
+            body = render(self.template, patient)
+        except Exception as e:
+            self._skip(patient, f"template error: {e}")
+            return True
+        with self._enqueue_lock:
+            # cancel() may have run since the checks above
+            if self._cancelled.is_set():
+                self._in_flight.release()
+                return False
+            with self._lock:
+                self._set_result(patient.id, 'queued', None)
+                self._submitted += 1
+            try:
+                self.outbox.enqueue(
+                    patient.contact, body, priority=self.priority, patient_id=patient.id, tag=self.tag,
+                    on_status=self._on_status,
+                )
+            except Exception as e:
+                with self._lock:
+                    self._set_result(patient.id, 'failed', f"could not queue ({e})")
+                self._in_flight.release()
+                raise
+        self._report()
+        return True
+
+    def _skip(self, patient, reason):
+        self._in_flight.release()
+        with self._lock:
+            self._set_result(patient.id, 'skipped', reason)
+        self._report()
+
+    def _on_status(self, message):
+        with self._lock:
+            previous = self._set_result(message.patient_id, message.status, message.last_error)
+        # frees a window slot once per message, whatever a later retry() does
+        if previous in ('queued', 'sending') and message.status in ('sent', 'failed'):
+            self._in_flight.release()
+            self._finish_if_done()
+        self._report()
+
+    def _set_result(self, patient_id, status, error):
+        # call with self._lock held; returns the previous status
+        previous = self.results.get(patient_id, (None, None))[0]
+        if previous is not None:
+            self._counts[previous] -= 1
+        self._counts[status] += 1
+        self.results[patient_id] = (status, error)
+        return previous
+
+    def _finish_if_done(self):
+        with self._lock:
+            if self.finished_at is not None or not self._fed.is_set():
+                return
+            if self._counts['queued'] or self._counts['sending']:
+                return
+            if self.state != CANCELLED:
+                self.state = DONE
+            self.finished_at = time.time()
+        log.info(f"Broadcast: {self.tag} finished, {self.progress()}")
@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ---------------------------
+# Background DB executor
+# ---------------------------
+class DBTask:
+    """
+    Handle for one submitted query. Wraps the concurrent.futures.Future and
+    adds a cancel flag that also suppresses callbacks for queries that have
+    already started or finished (Future.cancel() only stops queued work).
+    """
+
+    def __init__(self, future):
+        self.future = future
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+        self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class DBExecutor:
+    """
+    Runs DB work on worker threads and delivers results through `dispatch`,
+    which the app sets to a Clock.schedule_once trampoline so callbacks run
+    on the UI thread.
+    """
+
+    def __init__(self, workers=2, dispatch=None):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='db')
+        self._dispatch = dispatch or (lambda callback: callback())
+
+    def submit(self, fn, *args, on_result=None, on_error=None, **kwargs):
+        task = DBTask(self._pool.submit(fn, *args, **kwargs))
+
+        def _deliver(future):
+            if task.cancelled or future.cancelled():
+                return
+            exc = future.exception()
+            if exc is not None:
+                callback, value = on_error, exc
+            else:
+                callback, value = on_result, future.result()
+            if callback is None:
+                return
+
+            def _run():
+                # re-check: the task may be cancelled while the callback is queued
+                if not task.cancelled:
+                    callback(value)
+
+            self._dispatch(_run)
+
+        task.future.add_done_callback(_deliver)
+        return task
+
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,131 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+# ---------------------------
+# Shared SQLite connection pool
+# ---------------------------
+class ConnectionPool:
+    """
+    One long-lived writer connection plus a small pool of reader connections.
+    All connections run in WAL mode so readers never block on the writer.
+    Every connection keeps a cache of prepared statements (sqlite3's
+    cached_statements), so repeated queries skip the SQL compile step.
+    """
+
+    def __init__(self, path, readers=3, timeout=10, cached_statements=256):
+        self.path = path
+        self.max_readers = max(1, readers)
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+
+        self._writer = None
+        self._write_lock = threading.RLock()
+        self._readers = queue.LifoQueue()
+        self._readers_created = 0
+        self._readers_lock = threading.Lock()
+        self._closed = False
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'connections_opened': 0,
+            'writer_checkouts': 0,
+            'writer_reuses': 0,
+            'reader_checkouts': 0,
+            'reader_reuses': 0,
+            'reader_waits': 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _connect(self, readonly=False):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON;")
+        self._count('connections_opened')
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """Serialised access to the writer; commits on success, rolls back on error."""
+        with self._write_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("connection pool is closed")
+            if self._writer is None:
+                self._writer = self._connect()
+            else:
+                self._count('writer_reuses')
+            self._count('writer_checkouts')
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection, opening one if the pool is not full yet."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("connection pool is closed")
+        conn = None
+        try:
+            conn = self._readers.get_nowait()
+            self._count('reader_reuses')
+        except queue.Empty:
+            with self._readers_lock:
+                if self._readers_created < self.max_readers:
+                    self._readers_created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect(readonly=True)
+                except Exception:
+                    with self._readers_lock:
+                        self._readers_created -= 1
+                    raise
+            else:
+                self._count('reader_waits')
+                conn = self._readers.get(timeout=self.timeout)
+                self._count('reader_reuses')
+        self._count('reader_checkouts')
+        try:
+            yield conn
+        finally:
+            if self._closed:
+                conn.close()
+            else:
+                self._readers.put(conn)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['readers_open'] = self._readers_created
+        stats['readers_idle'] = self._readers.qsize()
+        return stats
+
+    def close(self):
+        self._closed = True
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,304 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+
+log = logging.getLogger(__name__)
+
+Recipient = namedtuple('Recipient', ['name', 'number'])
+# recipients of a tier are alerted together; the next tier is alerted if nobody
+# acknowledges within ack_timeout seconds
+Tier = namedtuple('Tier', ['name', 'recipients', 'ack_timeout'])
+
+DEFAULT_ACK_TIMEOUT = 120.0
+DEFAULT_ESCALATION = [
+    Tier("Emergency contact", [Recipient("Emergency contact", "+919876543210")], DEFAULT_ACK_TIMEOUT),
+]
+
+# alert status
+SENDING = 'sending'
+WAITING = 'waiting'
+ACKNOWLEDGED = 'acknowledged'
+UNANSWERED = 'unanswered'
+
+# delivery status
+DELIVERED = 'sent'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+
+EmergencyAlert = namedtuple('EmergencyAlert', [
+    'id', 'triggered_by', 'message', 'status', 'tier', 'created_at',
+    'dispatch_ms', 'first_delivery_ms', 'ack_ms', 'acknowledged_by', 'finished_at',
+])
+Delivery = namedtuple('Delivery', ['tier', 'recipient', 'number', 'status', 'error', 'latency_ms'])
+
+_SELECT_ALERT = f"SELECT {', '.join(EmergencyAlert._fields)} FROM emergency_alerts"
+
+
+# ---------------------------
+# Escalation list
+# ---------------------------
+def load_escalation(path):
+    """
+    Escalation tiers from a JSON file, alerted in file order:
+
+        {"tiers": [
+            {"name": "On-call doctors", "ack_timeout": 120,
+             "recipients": [{"name": "Dr. Mehta", "number": "+919800000001"},
+                            {"name": "Dr. Rao", "number": "+919800000002"}]},
+            {"name": "Ward desk and family",
+             "recipients": [{"name": "Ward 3 desk", "number": "+919800000003"}]}
+        ]}
+
+    Returns DEFAULT_ESCALATION if the file does not exist; raises ValueError
+    if it cannot be used.
+    """
+    if not os.path.exists(path):
+        return list(DEFAULT_ESCALATION)
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        tiers = []
+        for i, tier in enumerate(data['tiers']):
+            recipients = [Recipient(r.get('name') or r['number'], str(r['number'])) for r in tier['recipients']]
+            if not recipients:
+                raise ValueError(f"tier {i + 1} has no recipients")
+            tiers.append(Tier(tier.get('name') or f"Tier {i + 1}", recipients,
+                              float(tier.get('ack_timeout', DEFAULT_ACK_TIMEOUT))))
+    except (OSError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"bad escalation list {path}: {e}")
+    if not tiers:
+        raise ValueError(f"bad escalation list {path}: no tiers")
+    return tiers
+
+
+# ---------------------------
+# Fan-out dispatcher
+# ---------------------------
+class EmergencyDispatcher:
+    """
+    Sends an emergency alert to every recipient of a tier at once on a
+    thread pool, so dispatch takes about as long as the slowest single send
+    rather than the sum of them. A send that has not finished within
+    `send_timeout` seconds is recorded as timed out and does not hold the
+    alert up; it cannot be cancelled, so its delivery row is updated with
+    the real outcome when it does finish. If nobody acknowledges within the
+    tier's ack_timeout (or no message of the tier got out in time), the
+    next tier is alerted.
+
+    Every alert and delivery is logged in emergency_alerts /
+    emergency_deliveries with latencies in ms since the trigger: per
+    delivery, to the first delivery, to the end of the first fan-out
+    (dispatch_ms) and to the acknowledgement. `fallback(recipient, message,
+    alert_id)`, if given, is called for every send that failed, including
+    timed-out sends once they fail (the app queues those in the SMS outbox
+    for retries); a late success is never sent twice. A send that never
+    returns keeps its worker, so transports must bound their own calls.
+    """
+
+    def __init__(self, pool, transport, send_timeout=15.0, max_parallel=16, fallback=None):
+        self.pool = pool
+        self.transport = transport
+        self.send_timeout = send_timeout
+        self.fallback = fallback
+        self._executor = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix='emergency')
+        self._acks = {}
+        self._acked = {}
+        self._lock = threading.Lock()
+
+    def trigger(self, message, tiers=None, triggered_by=None, on_update=None):
+        """
+        Record a new alert and start alerting `tiers` (default
+        DEFAULT_ESCALATION) in the background; returns the alert id at once.
+        `on_update(alert, deliveries)` is called from a background thread
+        after every step.
+        """
+        tiers = list(tiers or DEFAULT_ESCALATION)
+        started = time.monotonic()
+        with self.pool.writer() as conn:
+            alert_id = conn.execute(
+                'INSERT INTO emergency_alerts (triggered_by, message, status, tier, created_at) '
+                'VALUES (?, ?, ?, 0, ?)',
+                (triggered_by, message, SENDING, time.time()),
+            ).lastrowid
+        with self._lock:
+            self._acks[alert_id] = threading.Event()
+        threading.Thread(
+            target=self._run, args=(alert_id, message, tiers, started, on_update),
+            name=f'emergency-alert-{alert_id}', daemon=True,
+        ).start()
+        return alert_id
+
+    def acknowledge(self, alert_id, by=None):
+        """Stop escalating `alert_id`; returns False if it had already finished."""
+        with self._lock:
+            ack = self._acks.get(alert_id)
+            if ack is None or ack.is_set():
+                return False
+            self._acked[alert_id] = (by, time.monotonic())
+        ack.set()
+        return True
+
+    def get(self, alert_id):
+        with self.pool.reader() as conn:
+            row = conn.execute(f"{_SELECT_ALERT} WHERE id = ?", (alert_id,)).fetchone()
+        return EmergencyAlert._make(row) if row else None
+
+    def deliveries(self, alert_id):
+        with self.pool.reader() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(Delivery._fields)} FROM emergency_deliveries WHERE alert_id = ? ORDER BY id",
+                (alert_id,),
+            ).fetchall()
+        return [Delivery._make(r) for r in rows]
+
+    def recent(self, limit=20):
+        with self.pool.reader() as conn:
+            rows = conn.execute(f"{_SELECT_ALERT} ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [EmergencyAlert._make(r) for r in rows]
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- alert lifecycle ---
+    def _run(self, alert_id, message, tiers, started, on_update):
+        with self._lock:
+            ack = self._acks[alert_id]
+        try:
+            for index, tier in enumerate(tiers):
+                if ack.is_set():
+                    break
+                self._update(alert_id, status=SENDING, tier=index)
+                self._notify(alert_id, on_update)
+                delivered = self._fan_out(alert_id, index, tier, message, started, on_update)
+                if index == 0:
+                    self._update(alert_id, dispatch_ms=self._ms_since(started))
+                self._update(alert_id, status=WAITING)
+                self._notify(alert_id, on_update)
+                if not delivered and index + 1 < len(tiers):
+                    # nobody in this tier could even be reached: escalate right away
+                    log.warning(f"Emergency: alert {alert_id} reached nobody in '{tier.name}', escalating")
+                    continue
+                if ack.wait(tier.ack_timeout):
+                    break
+                log.warning(f"Emergency: alert {alert_id} not acknowledged by '{tier.name}'")
+        except Exception:
+            log.exception(f"Emergency: alert {alert_id} failed")
+        finally:
+            # closes the alert to acknowledge() before its final status is written
+            with self._lock:
+                self._acks.pop(alert_id, None)
+                acked = self._acked.pop(alert_id, None)
+            if acked is not None:
+                by, at = acked
+                self._update(alert_id, status=ACKNOWLEDGED, ack_ms=round((at - started) * 1000, 1),
+                             acknowledged_by=by, finished_at=time.time())
+            else:
+                self._update(alert_id, status=UNANSWERED, finished_at=time.time())
+            self._notify(alert_id, on_update)
+
+    def _fan_out(self, alert_id, tier_index, tier, message, started, on_update=None):
+        """Send to every recipient of `tier` in parallel; returns True if any message got out in time."""
+        futures = {self._executor.submit(self._send, recipient.number, message): recipient
+                   for recipient in tier.recipients}
+        done, _ = wait(futures, timeout=self.send_timeout)
+        outcomes = []
+        for future, recipient in futures.items():
+            if future not in done:
+                status, error, latency = TIMEOUT, f"no response within {self.send_timeout:g}s", None
+            else:
+                status, error, latency = self._outcome(future, started)
+            outcomes.append((future, recipient, status, error, latency))
+
+        latencies = [latency for _, _, status, _, latency in outcomes if status == DELIVERED]
+        with self.pool.writer() as conn:
+            delivery_ids = [
+                conn.execute(
+                    'INSERT INTO emergency_deliveries (alert_id, tier, recipient, number, status, error, latency_ms) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (alert_id, tier_index, recipient.name, recipient.number, status, error, latency),
+                ).lastrowid
+                for _, recipient, status, error, latency in outcomes
+            ]
+            if latencies:
+                conn.execute(
+                    'UPDATE emergency_alerts SET first_delivery_ms = ? WHERE id = ? AND first_delivery_ms IS NULL',
+                    (min(latencies), alert_id),
+                )
+        log.info(f"Emergency: alert {alert_id} tier '{tier.name}': "
+                 f"{len(latencies)}/{len(outcomes)} sent in {self._ms_since(started):.0f} ms")
+
+        for delivery_id, (future, recipient, status, _, _) in zip(delivery_ids, outcomes):
+            if status == FAILED:
+                self._fall_back(recipient, message, alert_id)
+            elif status == TIMEOUT:
+                # the send cannot be cancelled and may still get through: record
+                # how it really ends, and only retry it through the fallback if it fails
+                future.add_done_callback(
+                    lambda f, d=delivery_id, r=recipient: self._late_outcome(
+                        f, d, r, alert_id, message, started, on_update))
+        return bool(latencies)
+
+    @staticmethod
+    def _outcome(future, started):
+        # (status, error, latency_ms) of a finished send
+        if future.cancelled():
+            return FAILED, "cancelled", None
+        if future.exception() is not None:
+            return FAILED, str(future.exception()), None
+        return DELIVERED, None, round((future.result() - started) * 1000, 1)
+
+    def _late_outcome(self, future, delivery_id, recipient, alert_id, message, started, on_update):
+        status, error, latency = self._outcome(future, started)
+        if error is not None:
+            error = f"{error} (after the {self.send_timeout:g}s timeout)"
+        try:
+            with self.pool.writer() as conn:
+                conn.execute(
+                    'UPDATE emergency_deliveries SET status = ?, error = ?, latency_ms = ? WHERE id = ?',
+                    (status, error, latency, delivery_id),
+                )
+                if status == DELIVERED:
+                    conn.execute(
+                        'UPDATE emergency_alerts SET first_delivery_ms = MIN(COALESCE(first_delivery_ms, ?), ?) '
+                        'WHERE id = ?',
+                        (latency, latency, alert_id),
+                    )
+        except Exception:
+            log.exception(f"Emergency: could not record the late outcome of delivery {delivery_id}")
+        log.info(f"Emergency: alert {alert_id} send to {recipient.number} finished late: {status}")
+        if status == FAILED:
+            self._fall_back(recipient, message, alert_id)
+        self._notify(alert_id, on_update)
+
+    def _fall_back(self, recipient, message, alert_id):
+        if self.fallback is None:
+            return
+        try:
+            self.fallback(recipient, message, alert_id)
+        except Exception:
+            log.exception("Emergency: fallback failed")
+
+    def _send(self, number, message):
+        self.transport.send(number, message)
+        return time.monotonic()
+
+    @staticmethod
+    def _ms_since(started):
+        return round((time.monotonic() - started) * 1000, 1)
+
+    def _update(self, alert_id, **fields):
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self.pool.writer() as conn:
+            conn.execute(f"UPDATE emergency_alerts SET {assignments} WHERE id = ?", (*fields.values(), alert_id))
+
+    def _notify(self, alert_id, on_update):
+        if on_update is None:
+            return
+        try:
+            on_update(self.get(alert_id), self.deliveries(alert_id))
+        except Exception:
+            log.exception("Emergency: update callback failed")
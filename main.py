@@ -1,19 +1,32 @@
 # health_app.py
+import startup_profile
+startup_profile.start()
+
 from kivy.config import Config
 Config.set('graphics', 'width', '1024')
 
 from kivy.logger import Logger
 Logger.info("Main: Starting MyApp")
+startup_profile.reset_origin()
+startup_profile.mark('logger_ready')
 
 from kivy.utils import platform
 import os
-import traceback
 from datetime import datetime
 import sqlite3
 import threading
-import qrcode
-from kivy.storage.jsonstore import JsonStore
-from kivy.app import App
+import app_log
+from db_pool import ConnectionPool
+from migrations import migrate
+from db_executor import DBExecutor
+from patient_import import PATIENT_FIELDS, validate_patient
+from patient_repository import PAGE_SIZE, PatientRepository
+from patient_terms import backfill, backfill_pending
+from record_cache import LRUCache
+from session_store import SessionStore
+from staff_accounts import MIN_PASSWORD_LENGTH, StaffDirectory
+from emergency_alert import DEFAULT_ESCALATION, EmergencyDispatcher, load_escalation
+from sms_outbox import IntentTransport, LocalTransport, Outbox, OutboxMessage
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.floatlayout import FloatLayout
@@ -25,63 +38,203 @@ from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.anchorlayout import AnchorLayout
 from kivy.core.window import Window
 from kivy.uix.popup import Popup
+from kivy.uix.progressbar import ProgressBar
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.gridlayout import GridLayout
-from kivy.uix.video import Video
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.properties import NumericProperty, ObjectProperty, BooleanProperty
+from kivy.event import EventDispatcher
+from kivy.graphics.texture import Texture
 from kivy.metrics import dp, sp
 from kivy.uix.widget import Widget
 from kivy.clock import Clock
+# QR (qrcode/PIL), the SMS bridge, video playback and export are imported on first use
+
+startup_profile.mark('imports_done')
+
+
+# ---------------------------
+# Outgoing SMS (persistent outbox, delivered in the background)
+# ---------------------------
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def _sms_transport():
+    # VHR_SMS_TRANSPORT=local|intent overrides; only Android can start the WhatsApp intent
+    choice = os.environ.get('VHR_SMS_TRANSPORT') or ('intent' if platform == 'android' else 'local')
+    return IntentTransport() if choice == 'intent' else LocalTransport()
+
+
+def get_outbox():
+    """
+    The process-wide sms_outbox.Outbox, with its dispatcher running. Opens
+    the DB, so call it from the background executor, not the UI thread.
+    """
+    global _outbox
+    if _outbox is None:
+        pool = get_db_pool()
+        with _outbox_lock:
+            if _outbox is None:
+                outbox = Outbox(pool, _sms_transport())
+                outbox.start()
+                _outbox = outbox
+    return _outbox
+
+
+def stop_outbox():
+    global _outbox
+    with _outbox_lock:
+        if _outbox is not None:
+            _outbox.stop()
+            _outbox = None
+
+
+def describe_sms(message):
+    """One-line delivery status for the UI."""
+    if message.status == 'sent':
+        return "SMS sent."
+    if message.status == 'failed':
+        return f"SMS failed: {message.last_error or 'unknown error'}"
+    if message.status == 'sending':
+        return "Sending SMS..."
+    if message.attempts:
+        return f"SMS not delivered yet, retrying (attempt {message.attempts + 1})."
+    return "SMS queued."
+
+
+def send_sms(number, message, on_status=None, priority=0, patient_id=None, tag=None):
+    """
+    Queue an SMS in the outbox and return immediately; delivery, retries and
+    rate limiting happen on the outbox's dispatcher thread. `on_status` is
+    called on the UI thread with an OutboxMessage: right away as queued, then
+    on every change until the message is sent or has failed for good.
+    """
+    def status(state, error=None):
+        return OutboxMessage(None, number, message, state, priority, 0, None, None, None, error, patient_id, tag)
+
+    def on_change(outbox_message):
+        # dispatcher thread -> UI thread
+        Clock.schedule_once(lambda dt: on_status(outbox_message), 0)
+
+    def failed(e):
+        Logger.error(f"SMS: could not queue message to {number}: {e}")
+        if on_status is not None:
+            on_status(status('failed', f"could not queue ({e})"))
+
+    if on_status is not None:
+        on_status(status('queued'))
+    get_db_executor().submit(
+        lambda: get_outbox().enqueue(number, message, priority=priority, patient_id=patient_id, tag=tag,
+                                     on_status=on_change if on_status is not None else None),
+        on_error=failed,
+    )
 
-# Optional sms_alert: make sure sms_alert.send_sms exists in your project
-try:
-    from sms_alert import send_sms
-except Exception:
-    # Fallback stub so app won't crash if sms_alert missing during development
-    def send_sms(number, message):
-        Logger.info(f"SMS: would send to {number}: {message}")
 
 Window.softinput_mode = "below_target"
-db_lock = threading.Lock()
+
+
+# ---------------------------
+# Emergency alerts
+# ---------------------------
+# escalation tiers (see emergency_alert.load_escalation), in the app storage dir
+ESCALATION_FILE = "escalation.json"
+
+_emergency = None
+_emergency_lock = threading.Lock()
+
+
+def _retry_emergency_sms(recipient, message, alert_id):
+    # sends that failed or timed out during the fan-out get the outbox's retries
+    get_outbox().enqueue(recipient.number, message, priority=10, tag=f"emergency:{alert_id}")
+
+
+def get_emergency_dispatcher():
+    """The process-wide EmergencyDispatcher. Opens the DB: call it off the UI thread."""
+    global _emergency
+    if _emergency is None:
+        pool = get_db_pool()
+        with _emergency_lock:
+            if _emergency is None:
+                _emergency = EmergencyDispatcher(pool, _sms_transport(), fallback=_retry_emergency_sms)
+    return _emergency
+
+
+def close_emergency_dispatcher():
+    global _emergency
+    with _emergency_lock:
+        if _emergency is not None:
+            _emergency.close()
+            _emergency = None
+
+
+def get_escalation_tiers():
+    """The configured escalation list; a broken file must not stop an alert, so fall back to the default."""
+    path = os.path.join(get_app_storage_dir(), ESCALATION_FILE)
+    try:
+        return load_escalation(path)
+    except ValueError as e:
+        Logger.error(f"Emergency: {e}; using the default contact")
+        return list(DEFAULT_ESCALATION)
+
+
+def describe_alert(alert, deliveries):
+    """One-line alert status for the UI."""
+    tier = [d for d in deliveries if d.tier == alert.tier]
+    sent = sum(1 for d in tier if d.status == 'sent')
+    if alert.status == 'acknowledged':
+        return f"Acknowledged by {alert.acknowledged_by or 'staff'} after {alert.ack_ms / 1000:.1f} s."
+    if alert.status == 'unanswered':
+        return "Nobody acknowledged the alert. Call the helpline."
+    if alert.status == 'waiting':
+        return f"Tier {alert.tier + 1}: {sent}/{len(tier)} alerted. Waiting for acknowledgement..."
+    return f"Alerting tier {alert.tier + 1}..."
 
 
 # ---------------------------
 # File / storage helpers
 # ---------------------------
-def get_log_path():
+def get_app_storage_dir():
+    # choose storage directory per platform
     if platform == 'android':
-        # import inside function to avoid import errors on desktop
         from android.storage import app_storage_path
-        app_path = app_storage_path()
-        log_path = os.path.join(app_path, "myapp_start.log")
-    else:
-        log_path = os.path.expanduser("~/kivy_projects/my_health_app/myapp_start.log")
+        return app_storage_path()
+    return os.path.expanduser("~/kivy_projects/my_health_app")
+
 
-    os.makedirs(os.path.dirname(log_path), exist_ok=True)
-    return log_path
+def get_log_dir():
+    return os.path.join(get_app_storage_dir(), "logs")
 
 
+# every record (Kivy's included) goes to rotating JSON-lines files, written by a
+# background thread; see app_log
 try:
-    log_path = get_log_path()
-    with open(log_path, "w", encoding="utf-8") as f:
-        f.write("Starting app\n")
+    app_log.setup(get_log_dir())
 except Exception as e:
-    print(f"Error writing log file: {e}")
+    Logger.warning(f"Log: file logging disabled: {e}")
 
 
-def generate_qr_code(data, filename):
-    img = qrcode.make(data)
-    if not filename.lower().endswith('.png'):
-        filename += '.png'
-    # choose storage directory per platform
-    if platform == 'android':
-        from android.storage import app_storage_path
-        save_dir = app_storage_path()
-    else:
-        save_dir = os.path.expanduser("~/kivy_projects/my_health_app")
-    os.makedirs(save_dir, exist_ok=True)
-    full_path = os.path.join(save_dir, filename)
-    img.save(full_path)
-    return full_path
+_qr_cache = None
+
+
+def get_qr_cache():
+    global _qr_cache
+    if _qr_cache is None:
+        from qr_cache import QRCache
+        _qr_cache = QRCache(os.path.join(get_app_storage_dir(), "qr_cache"))
+    return _qr_cache
+
+
+def generate_qr_code(data):
+    """
+    Export path: return the path of a PNG QR code for `data`, encoding it only
+    if the content-addressed cache does not already hold it. On-screen QR
+    codes are rendered in memory (qr_render); this is only for file export.
+    Slow on a miss, so call it from the background executor.
+    """
+    return get_qr_cache().get_or_create(data)
 
 def get_db_path():
     """
@@ -112,68 +265,253 @@ def get_db_path():
     return os.path.join(base, "health_records.db")
 
 
-# --- create_db() function (no top-level call) ---
-def create_db():
-    db_path = get_db_path()
-    # Ensure parent dir exists
-    db_dir = os.path.dirname(db_path)
-    if db_dir and not os.path.exists(db_dir):
-        os.makedirs(db_dir, exist_ok=True)
+# ---------------------------
+# Shared DB connection pool
+# ---------------------------
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    """
+    Return the process-wide ConnectionPool, creating it (and the schema) on
+    first use. The DB path is resolved once here instead of on every query.
+    """
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                with app_log.timed(Logger, "DB: opened", path=get_db_path()):
+                    pool = ConnectionPool(get_db_path())
+                    # publish the pool only once the schema is current, so no query can race it
+                    try:
+                        migrate_db(pool)
+                    except Exception:
+                        pool.close()
+                        raise
+                _db_pool = pool
+                _start_backfill(pool)
+    return _db_pool
+
+
+def close_db_pool():
+    global _db_pool, _patients, _staff
+    with _db_pool_lock:
+        if _patients is not None and _patients.cache is not None:
+            Logger.info(f"DB: patient cache stats {_patients.cache.stats()}")
+        _patients = None
+        _staff = None
+        if _db_pool is not None:
+            _stop_backfill()
+            Logger.info(f"DB: pool stats {_db_pool.stats()}")
+            _db_pool.close()
+            _db_pool = None
+
+
+# ---------------------------
+# Condition / medication term backfill (see patient_terms.backfill)
+# ---------------------------
+_backfill_thread = None
+_backfill_stop = threading.Event()
+
+
+def _start_backfill(pool):
+    """
+    Index the terms of patients from before the term tables, on a thread of
+    its own: one short write per batch, so the app stays usable meanwhile.
+    """
+    global _backfill_thread
+    with pool.reader() as conn:
+        if not backfill_pending(conn):
+            return
+    _backfill_stop.clear()
+    _backfill_thread = threading.Thread(target=_run_backfill, args=(pool,), name='terms-backfill', daemon=True)
+    _backfill_thread.start()
 
-    # Create table(s) safely
+
+def _run_backfill(pool):
     try:
-        with sqlite3.connect(db_path, timeout=10) as conn:
-            cursor = conn.cursor()
-            # Use WAL mode for better concurrency on Android
-            cursor.execute("PRAGMA journal_mode=WAL;")
-
-            # Create table if it does not exist
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS patients (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT,
-                    age INTEGER,
-                    gender TEXT,
-                    contact TEXT,
-                    address TEXT,
-                    conditions TEXT,
-                    medications TEXT,
-                    doctor_name TEXT,
-                    last_visit TEXT,
-                    notes TEXT
-                )
-            ''')
-            conn.commit()
-    except Exception:
-        # Write a helpful error_log inside the app data dir (if available)
-        try:
-            base = App.get_running_app().user_data_dir if App.get_running_app() else os.path.expanduser("~/.my_health_app")
-            os.makedirs(base, exist_ok=True)
-            with open(os.path.join(base, "error_log.txt"), "a", encoding="utf-8") as f:
-                f.write("create_db() exception:\n")
-                f.write(traceback.format_exc())
-        except Exception:
-            # If logging also fails, just re-raise the original exception
-            raise
-def get_store():
-    # Use App.user_data_dir once app is running; else fallback to home folder
-    app = App.get_running_app()
-    base = app.user_data_dir if (app and hasattr(app, "user_data_dir")) else os.path.expanduser("~/.my_health_app")
-    os.makedirs(base, exist_ok=True)
-    return JsonStore(os.path.join(base, "user_store.json"))
-from kivy.uix.screenmanager import Screen
-from kivy.uix.floatlayout import FloatLayout
-from kivy.uix.image import Image
-from kivy.uix.video import Video
-from kivy.clock import Clock
-from kivy.core.window import Window
+        with app_log.timed(Logger, "DB: term backfill") as fields:
+            fields['patients'] = backfill(pool, stop=_backfill_stop)
+    except sqlite3.ProgrammingError:
+        pass  # pool closed under it: the high-water mark is committed, the next start resumes
+    except Exception as e:
+        Logger.error("DB: term backfill failed; it resumes on the next start", exc_info=e)
+
+
+def _stop_backfill():
+    # finish the batch in flight before the pool goes away
+    global _backfill_thread
+    if _backfill_thread is not None:
+        _backfill_stop.set()
+        _backfill_thread.join(timeout=5)
+        _backfill_thread = None
+
+
+_db_executor = None
+_db_executor_lock = threading.Lock()
+
+
+def _dispatch_on_ui_thread(callback):
+    Clock.schedule_once(lambda dt: callback(), 0)
+
+
+def get_db_executor():
+    """
+    Return the shared background DB executor. Work submitted here runs off
+    the Kivy main thread; callbacks are delivered back via Clock.
+    """
+    global _db_executor
+    if _db_executor is None:
+        with _db_executor_lock:
+            if _db_executor is None:
+                _db_executor = DBExecutor(workers=2, dispatch=_dispatch_on_ui_thread)
+    return _db_executor
 
+
+def shutdown_db_executor():
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is not None:
+            _db_executor.shutdown()
+            _db_executor = None
+
+
+# ---------------------------
+# Patient data access (run on the DB executor, never on the UI thread)
+# ---------------------------
+# patient records kept in memory for the details screen; see record_cache.LRUCache
+PATIENT_CACHE_SIZE = 256
+
+_patients = None
+_patients_lock = threading.Lock()
+
+
+def get_patients():
+    """
+    The PatientRepository over the shared pool; all patient SQL lives there.
+    It owns the patient record cache, so there must be exactly one.
+    """
+    global _patients
+    if _patients is None:
+        pool = get_db_pool()
+        with _patients_lock:
+            if _patients is None:
+                _patients = PatientRepository(pool, cache=LRUCache(PATIENT_CACHE_SIZE))
+    return _patients
+
+
+def peek_patient(patient_id):
+    """Cached record for `patient_id` or None. Safe on the UI thread: no DB access."""
+    repo = _patients
+    return repo.get_cached(patient_id) if repo is not None else None
+
+
+# --- migrate_db() function (no top-level call) ---
+def migrate_db(pool):
+    """
+    Bring the schema up to date (all DDL lives in migrations.py). Errors
+    propagate: get_db_pool() then publishes no pool, and the startup task
+    reports them through Health._on_db_init_failed.
+    """
+    with pool.writer() as conn:
+        migrate(conn, log=lambda msg: Logger.info(f"DB: {msg}"))
+
+
+# ---------------------------
+# Staff accounts (staff_users table)
+# ---------------------------
+_staff = None
+_staff_lock = threading.Lock()
+
+
+def _in_use_before_accounts():
+    # patients on record or a saved login: staff have been signing in with the old K/k logins
+    session = get_session()
+    return session.exists('user') or session.exists('sessions') or get_patients().count() > 0
+
+
+def get_staff():
+    """
+    The StaffDirectory over the shared pool. An install that was in use
+    before accounts were stored keeps the legacy K/k logins until real
+    accounts exist; a fresh one creates its administrator on the first
+    login. Sessions of accounts that are no longer active are ended here
+    and whenever an account is deactivated. Hashes passwords: call it off
+    the UI thread.
+    """
+    global _staff
+    if _staff is None:
+        pool = get_db_pool()
+        with _staff_lock:
+            if _staff is None:
+                staff = StaffDirectory(pool, on_deactivated=end_sessions)
+                if staff.needs_setup() and _in_use_before_accounts():
+                    staff.seed_legacy_accounts()
+                staff.retire_defaults()
+                end_inactive_sessions(staff)
+                _staff = staff
+    return _staff
+
+
+def end_sessions(usernames):
+    """Log `usernames` out of this device (their accounts were deactivated)."""
+    session = get_session()
+    for username in usernames:
+        Logger.info(f"Session: ending the session of deactivated account {username}")
+        session.logout(username)
+
+
+def end_inactive_sessions(staff=None):
+    """
+    End the stored sessions of accounts that may not log in any more, e.g.
+    retired or deactivated while the app was closed: a restored session is
+    only as good as its account. Off the UI thread.
+    """
+    staff = staff or get_staff()
+    session = get_session()
+    current = session.current_user()
+    usernames = set(session.users()) | ({current[0]} if current else set())
+    end_sessions(sorted(u for u in usernames if not staff.is_active(u)))
+
+
+# ---------------------------
+# User session (user_store.json, held in memory)
+# ---------------------------
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    The process-wide SessionStore: user_store.json is read once, on first
+    use, and written back in the background (see session_store).
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # Use App.user_data_dir once app is running; else fallback to home folder
+                app = App.get_running_app()
+                base = app.user_data_dir if (app and hasattr(app, "user_data_dir")) else os.path.expanduser("~/.my_health_app")
+                _session = SessionStore(os.path.join(base, "user_store.json"))
+    return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
 # Use the uploaded file path (or change to 'data/presplash.png' after moving file)
 DEFAULT_POSTER = "kivy_projects\my_health_app\splash.jpg"
 class SplashScreen(Screen):
     def __init__(self, next_screen='login', video_source='splash.mp4',
                  poster_image=DEFAULT_POSTER, **kwargs):
         super().__init__(**kwargs)
+        from kivy.uix.video import Video  # loads the video provider only when a splash is shown
+
         self.next_screen = next_screen
         self.video_source = video_source
         self.poster_image = poster_image
@@ -300,27 +638,117 @@ class SplashScreen(Screen):
         except Exception:
             pass
 
+# ---------------------------
+# Shared background video
+# ---------------------------
+BACKGROUND_VIDEO = "hhhh.mp4"
+
+
+class SharedBackgroundVideo(EventDispatcher):
+    """
+    One decoder for the looping background video. Every Background draws the
+    same texture, so the number of screens and popups no longer multiplies
+    decode work. Playback runs only while a background can actually be seen:
+    not while the app is paused, the window is minimised, or the splash (which
+    has no background) is showing. In low-power mode the first decoded frame
+    is kept as a static poster and decoding stops.
+    """
+    texture = ObjectProperty(None, allownone=True)
+    low_power = BooleanProperty(False)
+
+    __events__ = ('on_frame',)
+
+    def __init__(self, source=BACKGROUND_VIDEO, **kwargs):
+        super().__init__(**kwargs)
+        self.source = source
+        self._video = None
+        self._visible = False
+        self._app_paused = False
+        self._minimized = False
+        self._playing = False
+
+    def _ensure_loaded(self):
+        if self._video is None:
+            from kivy.core.video import Video as CoreVideo
+            self._video = CoreVideo(filename=self.source, eos='loop')
+            self._video.bind(on_load=self._on_video_frame, on_frame=self._on_video_frame)
+        return self._video
+
+    def _on_video_frame(self, *args):
+        self.texture = self._video.texture
+        self.dispatch('on_frame')
+        if self.low_power and self._playing:
+            # poster frame captured; nothing else needs decoding
+            self._video.pause()
+            self._playing = False
+
+    def on_frame(self):
+        pass
+
+    def on_low_power(self, instance, value):
+        self._update_playback()
+
+    def set_visible(self, visible):
+        self._visible = visible
+        self._update_playback()
+
+    def set_app_paused(self, paused):
+        self._app_paused = paused
+        self._update_playback()
+
+    def set_minimized(self, minimized):
+        self._minimized = minimized
+        self._update_playback()
+
+    def _update_playback(self):
+        want = self._visible and not self._app_paused and not self._minimized
+        if self.low_power:
+            # decode just until a poster frame exists
+            want = want and self.texture is None
+        if want and not self._playing:
+            self._ensure_loaded().play()
+            self._playing = True
+        elif not want and self._playing:
+            self._video.pause()
+            self._playing = False
+
+
+_background_video = None
+
+
+def get_background_video():
+    global _background_video
+    if _background_video is None:
+        _background_video = SharedBackgroundVideo()
+    return _background_video
+
+
 # ---------------------------
 # Background video wrapper
 # ---------------------------
 class Background(FloatLayout):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        # Keep video inside background; disable if not needed
-        self.video = Video(
-            source="hhhh.mp4",
-            state='play',
-            options={'eos': 'loop'},
+        # Draws the shared background texture; no per-instance decoder
+        self.video = Image(
             allow_stretch=True,
             keep_ratio=False,
             size_hint=(1, 1),
             pos_hint={'x': 0, 'y': 0}
         )
-        # Setting disabled True prevents touch but still plays. If video not desired set state='stop'
-        # If your video is large or causes issues on mobile, set state='stop' or remove this widget
+        shared = get_background_video()
+        self.video.texture = shared.texture
+        # bound methods are held weakly, so discarded popups are not kept alive
+        shared.bind(texture=self._on_shared_texture, on_frame=self._on_shared_frame)
         self.add_widget(self.video)
         self.bind(size=self._update_video_size, pos=self._update_video_size)
 
+    def _on_shared_texture(self, instance, texture):
+        self.video.texture = texture
+
+    def _on_shared_frame(self, *args):
+        self.video.canvas.ask_update()
+
     def _update_video_size(self, *args):
         self.video.size = self.size
         self.video.pos = self.pos
@@ -370,7 +798,7 @@ class LoginScreen(Screen):
         )
         layout.add_widget(self.password)
 
-        login_btn = Button(
+        self.login_btn = login_btn = Button(
             text='Login',
             size_hint=(0.3, None),
             height=dp(50),
@@ -390,33 +818,97 @@ class LoginScreen(Screen):
             height=dp(30),
         )
         layout.add_widget(self.message)
-        layout.add_widget(Widget(size_hint_y=None, height=dp(200)))
+
+        # "Continue as ..." buttons, filled in on_pre_enter
+        self.switch_box = BoxLayout(orientation='horizontal', spacing=dp(10), size_hint_y=None, height=dp(45))
+        layout.add_widget(self.switch_box)
+        layout.add_widget(Widget(size_hint_y=None, height=dp(155)))
+        self._checking = False
+        # True on a fresh install with no accounts: Login then creates the administrator
+        self._setup = False
 
         bg.add_widget(layout)
         self.add_widget(bg)
 
     def authenticate(self, instance):
-        users = {
-            'K':{'password': '17', 'role': 'nurse'},
-            'k':{'password': '18', 'role': 'doctor'}
-        }
         uname = self.username.text.strip()
         pwd = self.password.text.strip()
-        user = users.get(uname)
+        if self._checking:
+            return
+        if not self._setup and (not uname or not pwd):
+            self.message.text = 'Invalid username or password!'
+            return
+        # the password hash is slow on purpose: check it on the DB executor
+        self._checking = True
+        self.message.text = 'Checking...'
+        setup = self._setup
+        get_db_executor().submit(
+            lambda: get_staff().create_first_admin(uname, pwd) if setup else get_staff().authenticate(uname, pwd),
+            on_result=lambda role: self._on_authenticated(uname, role),
+            on_error=self._on_authenticate_failed,
+        )
 
-        if user and user['password'] == pwd:
-            # persist login
-            try:
-                store = get_store()
-                store.put('user', username=uname, role=user['role'])
-            except Exception as e:
-                print("Warning: could not save login:", e)
-
-            self.message.text = ''
-            self.manager.get_screen('main').load_user(uname, user['role'])
-            self.manager.current = 'main'
-        else:
+    def _on_authenticated(self, username, role):
+        self._checking = False
+        if role is None:
             self.message.text = 'Invalid username or password!'
+            return
+        if self._setup:
+            self._show_setup(False)
+        # persist login (written to disk in the background)
+        get_session().login(username, role)
+        self._enter_as(username, role)
+
+    def _on_authenticate_failed(self, e):
+        self._checking = False
+        if isinstance(e, ValueError):
+            # create_first_admin() refused the account
+            self.message.text = str(e)
+            self._check_setup()
+            return
+        Logger.error("Login: could not check the credentials", exc_info=e)
+        self.message.text = 'Login failed. See the app log.'
+
+    def _check_setup(self):
+        get_db_executor().submit(
+            lambda: get_staff().needs_setup(),
+            on_result=self._show_setup,
+            on_error=lambda e: Logger.error("Login: could not read the staff accounts", exc_info=e),
+        )
+
+    def _show_setup(self, needed):
+        if needed and not self._setup:
+            self.message.text = (f'First start: choose the administrator username and a password '
+                                 f'of at least {MIN_PASSWORD_LENGTH} characters.')
+        self._setup = needed
+        self.login_btn.text = 'Create Account' if needed else 'Login'
+
+    def _enter_as(self, username, role):
+        self.message.text = ''
+        self.password.text = ''
+        self.manager.get_screen('main').load_user(username, role)
+        self.manager.current = 'main'
+
+    def on_pre_enter(self, *args):
+        self._check_setup()
+        # staff who are still signed in on this device: one tap picks the account, the password is still asked
+        self.switch_box.clear_widgets()
+        for username in get_session().users():
+            btn = Button(
+                text=f'Continue as {username}',
+                background_color=(0.2, 0.6, 0.3, 1),
+                color=(1, 1, 1, 1),
+                font_size=sp(14),
+            )
+            btn.bind(on_press=lambda x, name=username: self.switch_to(name))
+            self.switch_box.add_widget(btn)
+
+    def switch_to(self, username):
+        # a live session only saves typing the username: anyone can tap the button on a shared device
+        self.username.text = username
+        self.password.text = ''
+        self.password.focus = True
+        self.message.text = f'Enter the password for {username}.'
 
 
     def on_touch_down(self, touch):
@@ -467,6 +959,7 @@ class MainScreen(Screen):
 
         layout.add_widget(create_button('View Health Record', (0.2, 0.6, 0.3, 1), 'record'))
         layout.add_widget(create_button('Emergency Access Override', (0.8, 0.2, 0.2, 1), 'emergency'))
+        layout.add_widget(create_button('Broadcast Message', (0.6, 0.4, 0.2, 1), 'broadcast'))
         layout.add_widget(create_button('Settings', (0.3, 0.3, 0.5, 1), 'settings'))
 
         helpline_btn = Button(
@@ -492,7 +985,8 @@ class MainScreen(Screen):
         self.user_label.text = f"[b]Logged in as: {username} ({role})[/b]"
         # propagate to screens if present
         for name in ('record', 'emergency', 'settings'):
-            if self.manager and self.manager.has_screen(name):
+            # screens not built yet pick the user up when they are built
+            if self.manager and self.manager.is_built(name):
                 screen = self.manager.get_screen(name)
                 if hasattr(screen, 'set_user'):
                     screen.set_user(username)
@@ -548,12 +1042,70 @@ class MainScreen(Screen):
         popup.open()
 
 
+# ---------------------------
+# Virtualized patient list
+# ---------------------------
+class PatientRow(RecycleDataViewBehavior, Button):
+    """One recycled row button; only enough of these exist to fill the viewport."""
+    patient_id = NumericProperty(0)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.background_color = (0.2, 0.4, 0.6, 1)
+        self.color = (1, 1, 1, 1)
+        self._rv = None
+
+    def refresh_view_attrs(self, rv, index, data):
+        self._rv = rv
+        return super().refresh_view_attrs(rv, index, data)
+
+    def on_press(self):
+        if self._rv is not None and self._rv.on_row_press:
+            self._rv.on_row_press(self.patient_id)
+
+
+class PatientRecycleView(RecycleView):
+    def __init__(self, on_row_press=None, **kwargs):
+        super().__init__(**kwargs)
+        self.on_row_press = on_row_press
+        rows = RecycleBoxLayout(
+            orientation='vertical',
+            spacing=dp(10),
+            default_size=(None, dp(60)),
+            default_size_hint=(1, None),
+            size_hint_y=None,
+        )
+        rows.bind(minimum_height=rows.setter('height'))
+        self.add_widget(rows)
+        # viewclass lives on the layout manager, so set it after adding one
+        self.viewclass = PatientRow
+
+    def set_rows(self, rows):
+        # rows are compact (id, name) tuples; views are only built for visible rows
+        self.data = [{'patient_id': pid, 'text': name or ''} for pid, name in rows]
+
+    def append_rows(self, rows):
+        # scroll_y is relative to the content height, which is about to grow:
+        # keep the distance from the top instead, so the visible rows stay put
+        distance = (1 - self.scroll_y) * max(0, self.layout_manager.height - self.height)
+        self.data.extend({'patient_id': pid, 'text': name or ''} for pid, name in rows)
+        Clock.schedule_once(lambda dt: self._scroll_to_distance(distance), 0)
+
+    def _scroll_to_distance(self, distance):
+        if self.layout_manager.height <= self.height:
+            return
+        self.scroll_y = max(0, 1 - self.convert_distance_to_scroll(0, distance)[1])
+
+
 # ---------------------------
 # PatientListScreen (single correct version)
 # ---------------------------
 class PatientListScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self._pending = None
+        self.rows = []
+        self._has_more = False
         layout = BoxLayout(orientation='vertical', padding=dp(15), spacing=dp(10))
         top_buttons = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(50))
         back_btn = Button(
@@ -565,7 +1117,19 @@ class PatientListScreen(Screen):
         )
         back_btn.bind(on_press=lambda x: setattr(self.manager, 'current', 'main'))
         top_buttons.add_widget(back_btn)
-        top_buttons.add_widget(Label(size_hint_x=1))
+
+        self.search_input = TextInput(
+            hint_text='Search name, condition, medication, doctor, notes',
+            multiline=False,
+            size_hint_x=1,
+            font_size=sp(16),
+            padding=[dp(10), dp(14), dp(10), dp(10)],
+        )
+        # debounce typing so only the last keystroke in a burst hits the DB
+        self._search_trigger = Clock.create_trigger(lambda dt: self.load_patients(), 0.25)
+        self.search_input.bind(text=lambda *a: self._search_trigger())
+        top_buttons.add_widget(self.search_input)
+
         add_btn = Button(
             text='Add Patient',
             size_hint=(None, 1),
@@ -579,12 +1143,26 @@ class PatientListScreen(Screen):
         layout.add_widget(top_buttons)
 
         # --- Patient List Area ---
-        self.patient_list_layout = GridLayout(cols=1, spacing=10, size_hint_y=None)
-        self.patient_list_layout.bind(minimum_height=self.patient_list_layout.setter('height'))
+        list_area = FloatLayout()
+        self.patient_rv = PatientRecycleView(
+            on_row_press=self.go_to_details,
+            size_hint=(1, 1),
+            pos_hint={'x': 0, 'y': 0},
+        )
+        # fetch the next page when the user scrolls near the bottom
+        self.patient_rv.bind(scroll_y=self._on_list_scroll)
+        list_area.add_widget(self.patient_rv)
 
-        scroll_view = ScrollView()
-        scroll_view.add_widget(self.patient_list_layout)
-        layout.add_widget(scroll_view)
+        # loading / empty-state text drawn over the list
+        self.status_label = Label(
+            text='',
+            color=(1, 1, 1, 1),
+            size_hint=(None, None),
+            size=(dp(400), dp(30)),
+            pos_hint={'center_x': 0.5, 'center_y': 0.5},
+        )
+        list_area.add_widget(self.status_label)
+        layout.add_widget(list_area)
 
         bg = Background()
         bg.add_widget(layout)
@@ -593,51 +1171,77 @@ class PatientListScreen(Screen):
     def on_enter(self):
         self.load_patients()
 
+    def on_leave(self, *args):
+        # drop results that arrive after the user has navigated away
+        self._cancel_pending()
+
     def set_user(self, username):
         self.username = username
         self.load_patients()
 
-    def load_patients(self):
-        self.patient_list_layout.clear_widgets()
-        db_path = get_db_path()
-        try:
-            with db_lock:
-                conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
-                cursor = conn.cursor()
-                try:
-                    cursor.execute('SELECT id, name FROM patients ORDER BY name')
-                    patients = cursor.fetchall()
-                finally:
-                    cursor.close()
-                    conn.close()
-        except Exception as e:
-            Logger.error(f"PatientList: DB error: {e}")
-            return
+    def _cancel_pending(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
 
-        if not patients:
-            container = FloatLayout(size_hint_y=None, height=dp(200))
-            no_patient_label = Label(
-                text="No patients found. Click 'Add Patient' to begin.",
-                color=(1, 1, 1, 1),
-                size_hint=(None, None),
-                size=(dp(400), dp(30)),
-                pos_hint={'center_x': 0.5, 'center_y': 0.5},
+    def load_patients(self):
+        self._cancel_pending()
+        # keep showing the current rows while a refresh is in flight
+        if not self.rows:
+            self.status_label.text = "Loading patients..."
+        query = self.search_input.text.strip()
+        if query:
+            self._pending = get_db_executor().submit(
+                lambda: get_patients().search(query),
+                on_result=self._show_patients,
+                on_error=self._on_load_error,
             )
-            container.add_widget(no_patient_label)
-            self.patient_list_layout.add_widget(container)
+        else:
+            self._pending = get_db_executor().submit(
+                lambda: get_patients().page(),
+                on_result=self._show_patients,
+                on_error=self._on_load_error,
+            )
+
+    def _on_load_error(self, e):
+        self._pending = None
+        Logger.error(f"PatientList: DB error: {e}")
+        self.status_label.text = "Could not load patients."
+
+    def _show_patients(self, patients):
+        self._pending = None
+        self.rows = patients
+        # search results are a single ranked batch; only the full list pages
+        self._has_more = len(patients) >= PAGE_SIZE and not self.search_input.text.strip()
+        self.patient_rv.set_rows(patients)
+        self.patient_rv.scroll_y = 1
+
+        if not patients and self.search_input.text.strip():
+            self.status_label.text = "No patients match your search."
+        elif not patients:
+            self.status_label.text = "No patients found. Click 'Add Patient' to begin."
+        else:
+            self.status_label.text = ''
+
+    def _on_list_scroll(self, rv, scroll_y):
+        if scroll_y <= 0.1:
+            self.load_next_page()
+
+    def load_next_page(self):
+        if not self._has_more or self._pending is not None or not self.rows:
             return
+        last_id, last_name = self.rows[-1]
+        self._pending = get_db_executor().submit(
+            lambda: get_patients().page(after=(last_name, last_id)),
+            on_result=self._append_patients,
+            on_error=self._on_load_error,
+        )
 
-        for pid, pname in patients:
-            btn = Button(
-                text=pname,
-                size_hint_y=None,
-                height=dp(60),
-                background_color=(0.2, 0.4, 0.6, 1),
-                color=(1, 1, 1, 1),
-            )
-            # bind with default arg to capture pid
-            btn.bind(on_press=lambda inst, _pid=pid: self.go_to_details(_pid))
-            self.patient_list_layout.add_widget(btn)
+    def _append_patients(self, patients):
+        self._pending = None
+        self._has_more = len(patients) >= PAGE_SIZE
+        self.rows.extend(patients)
+        self.patient_rv.append_rows(patients)
 
     def go_to_details(self, patient_id):
         if self.manager and self.manager.has_screen('patient_details'):
@@ -655,10 +1259,22 @@ class PatientListScreen(Screen):
 # ---------------------------
 # PatientDetailsScreen
 # ---------------------------
+# label shown for each column of a patient record, in column order
+DETAIL_FIELDS = [
+    "ID", "Name", "Age", "Gender", "Contact", "Address",
+    "Conditions", "Medications", "Doctor Name", "Last Visit", "Notes",
+]
+
+
+def _wrap_to_width(label, size):
+    label.text_size = (size[0], None)
+
+
 class PatientDetailsScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.patient_id = None
+        self._pending = None
 
         main_layout = BoxLayout(
             orientation='vertical',
@@ -689,6 +1305,8 @@ class PatientDetailsScreen(Screen):
 
         self.details_grid = GridLayout(cols=1, spacing=10, size_hint_y=None)
         self.details_grid.bind(minimum_height=self.details_grid.setter('height'))
+        self._shown_patient = None
+        self._build_details_table()
 
         self.details_scroll = ScrollView()
         self.details_scroll.add_widget(self.details_grid)
@@ -707,55 +1325,12 @@ class PatientDetailsScreen(Screen):
         bg.add_widget(main_layout)
         self.add_widget(bg)
 
-    def clear_details(self):
-        self.details_label.text = 'Select a patient to view details'
-        self.details_label.font_size = sp(18)
-        self.details_grid.clear_widgets()
-        self.delete_btn.disabled = True
-        self.patient_id = None
-
-    def load_patient_data(self, patient_id):
-        self.patient_id = patient_id
-        self.details_grid.clear_widgets()
-
-        db_path = get_db_path()
-        try:
-            with db_lock:
-                conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
-                cursor = conn.cursor()
-                try:
-                    cursor.execute('SELECT * FROM patients WHERE id = ?', (patient_id,))
-                    patient = cursor.fetchone()
-                finally:
-                    cursor.close()
-                    conn.close()
-        except Exception as e:
-            Logger.error(f"PatientDetails: DB error {e}")
-            self.details_label.text = "Error loading patient."
-            return
-
-        if not patient:
-            self.details_label.text = "Patient details not found."
-            self.delete_btn.disabled = True
-            return
-
-        self.details_label.text = f"Details for: {patient[1]}"
-        self.delete_btn.disabled = False
-
-        details = [
-            ("ID", patient[0]),
-            ("Name", patient[1]),
-            ("Age", patient[2]),
-            ("Gender", patient[3]),
-            ("Contact", patient[4]),
-            ("Address", patient[5]),
-            ("Conditions", patient[6]),
-            ("Medications", patient[7]),
-            ("Doctor Name", patient[8]),
-            ("Last Visit", patient[9]),
-            ("Notes", patient[10]),
-        ]
-
+    def _build_details_table(self):
+        """
+        Build the field table and action buttons once. Loading a patient
+        only rewrites the value labels (see _show_patient); the buttons act
+        on whichever patient is currently shown.
+        """
         table = GridLayout(
             cols=3,
             spacing=[dp(5), dp(10)],
@@ -766,7 +1341,8 @@ class PatientDetailsScreen(Screen):
 
         table.bind(minimum_height=table.setter('height'))
 
-        for field, value in details:
+        self._value_labels = []
+        for field in DETAIL_FIELDS:
             field_label = Label(
                 text=field,
                 size_hint_x=None,
@@ -790,7 +1366,7 @@ class PatientDetailsScreen(Screen):
             colon_label.bind(size=colon_label.setter('text_size'))
 
             value_label = Label(
-                text=str(value or "N/A"),
+                text="",
                 size_hint_x=1,
                 font_size=sp(16),
                 halign='left',
@@ -798,11 +1374,12 @@ class PatientDetailsScreen(Screen):
                 color=(1, 1, 1, 1),
             )
             # ensure wrapping
-            value_label.bind(size=lambda i, s: setattr(i, 'text_size', (s[0], None)))
+            value_label.bind(size=_wrap_to_width)
 
             table.add_widget(field_label)
             table.add_widget(colon_label)
             table.add_widget(value_label)
+            self._value_labels.append(value_label)
 
         self.details_grid.add_widget(table)
         self.details_grid.add_widget(Label(size_hint_y=None, height=dp(20)))
@@ -813,25 +1390,13 @@ class PatientDetailsScreen(Screen):
             spacing=dp(10)
         )
 
-        qr_data = f"ID: {patient[0]}, Name: {patient[1]}, Contact: {patient[4]}"
-        filename = generate_qr_code(qr_data, f"{patient[1].replace(' ', '_')}_qr.png")
-
-        def show_qr_popup(fn):
-            popup = Popup(
-                title="Patient QR Code",
-                content=Image(source=fn, allow_stretch=True, keep_ratio=True),
-                size_hint=(None, None),
-                size=(dp(350), dp(350)),
-            )
-            popup.open()
-
         qr_button = Button(
             text="Generate QR Code",
             size_hint_y=1,
             background_color=(0.6, 0.4, 0.2, 1),
             color=(1, 1, 1, 1),
         )
-        qr_button.bind(on_press=lambda x: show_qr_popup(filename))
+        qr_button.bind(on_press=self._on_qr_press)
         action_buttons_container.add_widget(qr_button)
 
         sms_button = Button(
@@ -840,30 +1405,171 @@ class PatientDetailsScreen(Screen):
             background_color=(0.2, 0.7, 0.2, 1),
             color=(1, 1, 1, 1),
         )
-        sms_button.bind(on_press=lambda x: send_sms(patient[4], f"Dear {patient[1]}, your health record is saved."))
+        sms_button.bind(on_press=self._on_sms_press)
         action_buttons_container.add_widget(sms_button)
 
         self.details_grid.add_widget(action_buttons_container)
 
+        self.sms_status = Label(
+            text="",
+            size_hint_y=None,
+            height=dp(30),
+            font_size=sp(14),
+            color=(0.9, 0.9, 0.9, 1),
+        )
+        self.details_grid.add_widget(self.sms_status)
+        self._set_table_visible(False)
+
+    def _set_table_visible(self, visible):
+        # hidden rather than removed, so the widgets and their layout are reused
+        self.details_grid.opacity = 1 if visible else 0
+        self.details_grid.disabled = not visible
+
+    def _on_qr_press(self, instance):
+        patient = self._shown_patient
+        if patient:
+            self.show_qr(f"ID: {patient[0]}, Name: {patient[1]}, Contact: {patient[4]}")
+
+    def _on_sms_press(self, instance):
+        patient = self._shown_patient
+        if patient:
+            send_sms(
+                patient[4], f"Dear {patient[1]}, your health record is saved.",
+                on_status=lambda message: self._on_sms_status(patient[0], message),
+                patient_id=patient[0],
+            )
+
+    def _on_sms_status(self, patient_id, message):
+        # delivery can finish after the user has moved on to another patient
+        if self._shown_patient and self._shown_patient[0] == patient_id:
+            self.sms_status.text = describe_sms(message)
+
+    def clear_details(self):
+        self.details_label.text = 'Select a patient to view details'
+        self.details_label.font_size = sp(18)
+        self._shown_patient = None
+        self._set_table_visible(False)
+        self.delete_btn.disabled = True
+        self.patient_id = None
+
+    def on_leave(self, *args):
+        # a slow query must not repaint this screen after the user has left it
+        self._cancel_pending()
+
+    def _cancel_pending(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+    def load_patient_data(self, patient_id):
+        self._cancel_pending()
+        self.patient_id = patient_id
+
+        # back-and-forth between list and details: render straight from the cache
+        patient = peek_patient(patient_id)
+        if patient is not None:
+            self._show_patient(patient)
+            return
+
+        self.details_label.text = "Loading patient..."
+        self.delete_btn.disabled = True
+        self._shown_patient = None
+        self._set_table_visible(False)
+        self._pending = get_db_executor().submit(
+            lambda: get_patients().get(patient_id),
+            on_result=self._show_patient,
+            on_error=self._on_load_error,
+        )
+
+    def _on_load_error(self, e):
+        self._pending = None
+        Logger.error(f"PatientDetails: DB error {e}")
+        self.details_label.text = "Error loading patient."
+
+    def _show_patient(self, patient):
+        self._pending = None
+        if not patient:
+            self.details_label.text = "Patient details not found."
+            self.delete_btn.disabled = True
+            self._shown_patient = None
+            self._set_table_visible(False)
+            return
+
+        self.details_label.text = f"Details for: {patient[1]}"
+        self.delete_btn.disabled = False
+
+        # patient columns are in DETAIL_FIELDS order: only the texts change
+        for value_label, value in zip(self._value_labels, patient):
+            value_label.text = str(value or "N/A")
+        if not self._shown_patient or self._shown_patient[0] != patient[0]:
+            self.sms_status.text = ""
+        self._shown_patient = patient
+        self._set_table_visible(True)
+
+    def show_qr(self, qr_data):
+        from qr_render import qr_rgba_buffer
+
+        # matrix is built off the UI thread; nothing is written to disk
+        get_db_executor().submit(
+            qr_rgba_buffer, qr_data,
+            on_result=lambda rendered: self._open_qr_popup(qr_data, rendered),
+            on_error=lambda e: Logger.error(f"PatientDetails: QR generation failed {e}"),
+        )
+
+    def _open_qr_popup(self, qr_data, rendered):
+        size, buf = rendered
+        texture = Texture.create(size=(size, size), colorfmt='rgba')
+        texture.blit_buffer(buf, colorfmt='rgba', bufferfmt='ubyte')
+        # one texel per module; nearest filtering keeps the edges sharp when scaled
+        texture.mag_filter = 'nearest'
+
+        content = BoxLayout(orientation='vertical', spacing=dp(8))
+        content.add_widget(Image(texture=texture, allow_stretch=True, keep_ratio=True))
+
+        status = Label(text='', size_hint_y=None, height=dp(24), font_size=sp(12))
+        content.add_widget(status)
+
+        export_btn = Button(text='Export PNG', size_hint_y=None, height=dp(40))
+        content.add_widget(export_btn)
+
+        def on_exported(path):
+            status.text = f"Saved: {os.path.basename(path)}"
+
+        def on_export_failed(e):
+            Logger.error(f"PatientDetails: QR export failed {e}")
+            status.text = "Export failed."
+
+        # the file cache is only touched when the user explicitly exports
+        export_btn.bind(on_press=lambda x: get_db_executor().submit(
+            generate_qr_code, qr_data, on_result=on_exported, on_error=on_export_failed))
+
+        popup = Popup(
+            title="Patient QR Code",
+            content=content,
+            size_hint=(None, None),
+            size=(dp(350), dp(420)),
+        )
+        popup.open()
+
     def delete_patient(self, instance):
         if not self.patient_id:
             return
-        db_path = get_db_path()
-        try:
-            with db_lock:
-                conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
-                cursor = conn.cursor()
-                try:
-                    cursor.execute('DELETE FROM patients WHERE id = ?', (self.patient_id,))
-                    conn.commit()
-                finally:
-                    cursor.close()
-                    conn.close()
-        except Exception as e:
+        self.delete_btn.disabled = True
+        patient_id = self.patient_id
+
+        def _done(*args):
+            self.patient_id = None
+            self.go_back(None)
+
+        def _failed(e):
             Logger.error(f"PatientDetails: delete error {e}")
+            _done()
 
-        self.patient_id = None
-        self.go_back(None)
+        get_db_executor().submit(
+            lambda: get_patients().delete(patient_id),
+            on_result=_done,
+            on_error=_failed,
+        )
 
     def go_back(self, instance):
         self.manager.transition.direction = 'right'
@@ -887,10 +1593,7 @@ class AddPatientPopup(Popup):
         form_grid.bind(minimum_height=form_grid.setter('height'))
         self.fields = {}
 
-        labels = [
-            "Name", "Age", "Gender", "Contact", "Address",
-            "Conditions", "Medications", "Doctor Name", "Last Visit (YYYY-MM-DD)", "Notes"
-        ]
+        labels = [label for label, _ in PATIENT_FIELDS]
 
         for label_text in labels:
             lbl = Label(text=label_text, color=(1, 1, 1, 1), size_hint_y=None, height=dp(30))
@@ -954,31 +1657,12 @@ class AddPatientPopup(Popup):
             )
             popup.open()
         except Exception:
-            self._write_error_log(f"{title}: {message}")
-
-    def _write_error_log(self, msg):
-        try:
-            app = App.get_running_app()
-            base = app.user_data_dir if app else os.getcwd()
-        except Exception:
-            base = os.getcwd()
-        try:
-            os.makedirs(base, exist_ok=True)
-            path = os.path.join(base, "error_log.txt")
-            with open(path, "a", encoding="utf-8") as f:
-                f.write(msg + "\n\n")
-        except Exception:
-            pass
+            Logger.error(f"AddPatient: {title}: {message}", exc_info=True)
 
     def add_patient(self, instance):
         try:
-            expected_keys = [
-                "Name", "Age", "Gender", "Contact", "Address",
-                "Conditions", "Medications", "Doctor Name",
-                "Last Visit (YYYY-MM-DD)", "Notes"
-            ]
             data = {}
-            for key in expected_keys:
+            for key, _ in PATIENT_FIELDS:
                 widget = self.fields.get(key)
                 val = ""
                 try:
@@ -987,148 +1671,228 @@ class AddPatientPopup(Popup):
                     val = ""
                 data[key] = val
 
-            # Basic validation
-            if not data["Name"]:
-                self.show_error("Name is required.\nEnter your good name please.", title="Validation")
-                return
-            if not data['Age']:
-                self.show_error("Age is required.", title="Validation")
-                return
-            if not data['Contact']:
-                self.show_error("Contact is important, fill it.", title="Validation")
-                return
-            if not data['Last Visit (YYYY-MM-DD)']:
-                self.show_error("Last visit is required.", title="Validation")
+            # Same rules as the bulk importer
+            error = validate_patient(data)
+            if error:
+                self.show_error(error, title="Validation")
                 return
 
-            # Validate date format
-            try:
-                datetime.strptime(data["Last Visit (YYYY-MM-DD)"], '%Y-%m-%d')
-            except Exception:
-                self.show_error("Last Visit date must be YYYY-MM-DD", title="Validation")
+            # guard against double taps while the insert is in flight
+            if getattr(self, '_saving', False):
                 return
+            self._saving = True
+            get_db_executor().submit(lambda: get_patients().add(data),
+                                     on_result=self._on_patient_added, on_error=self._on_add_failed)
 
-            # Get DB path
-            try:
-                db_path = get_db_path()
-            except Exception:
-                app = App.get_running_app()
-                base = app.user_data_dir if app else os.getcwd()
-                db_path = os.path.join(base, "health_records.db")
+        except Exception:
+            Logger.error("AddPatient: unexpected error", exc_info=True)
+            self.show_error("An unexpected error occurred. See the app log.", title="Crash")
 
-            # Ensure parent dir exists
-            db_dir = os.path.dirname(db_path)
-            if db_dir and not os.path.exists(db_dir):
-                os.makedirs(db_dir, exist_ok=True)
+    def _on_add_failed(self, db_e):
+        self._saving = False
+        # full traceback goes to the app log
+        Logger.error("AddPatient: DB error", exc_info=db_e)
 
-            # --- ensure table exists before inserting ---
-            def ensure_table_exists(path):
-                try:
-                    with sqlite3.connect(path) as c:
-                        cur = c.cursor()
-                        cur.execute("""
-                            CREATE TABLE IF NOT EXISTS patients (
-                                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                name TEXT,
-                                age INTEGER,
-                                gender TEXT,
-                                contact TEXT,
-                                address TEXT,
-                                conditions TEXT,
-                                medications TEXT,
-                                doctor_name TEXT,
-                                last_visit TEXT,
-                                notes TEXT
-                            )
-                        """)
-                        c.commit()
-                except Exception:
-                    # Log but don't crash here
-                    try:
-                        tb = traceback.format_exc()
-                        app = App.get_running_app()
-                        base = app.user_data_dir if app else os.path.expanduser("~/.my_health_app")
-                        os.makedirs(base, exist_ok=True)
-                        with open(os.path.join(base, "error_log.txt"), "a", encoding="utf-8") as lf:
-                            lf.write("\n\n--- ensure_table_exists() EXCEPTION at " + datetime.now().isoformat() + " ---\n")
-                            lf.write(tb)
-                    except Exception:
-                        pass
+        # show popup with the exception message (dev only)
+        self.show_error(f"Database error occurred:\n{str(db_e)}\n\nSee the app log for the full traceback.", title="DB Error")
 
-            ensure_table_exists(db_path)
+    def _on_patient_added(self, patient_id):
+        self._saving = False
+        # Refresh parent screen list if available
+        try:
+            if hasattr(self, "parent_screen") and self.parent_screen and hasattr(self.parent_screen, 'load_patients'):
+                self.parent_screen.load_patients()
+        except Exception:
+            Logger.error("AddPatient: could not refresh the list", exc_info=True)
 
-            # Insert into DB with lock
-            lock = globals().get('db_lock')
-            if lock is None:
-                import threading
-                lock = threading.Lock()
+        # Success + dismiss
+        self.show_error("Patient added successfully.", title="Success")
+        try:
+            self.dismiss()
+        except Exception:
+            pass
 
-            with lock:
-                conn = None
-                cursor = None
-                try:
-                    conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        INSERT INTO patients (
-                            name, age, gender, contact, address,
-                            conditions, medications, doctor_name, last_visit, notes
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        data["Name"], data["Age"], data["Gender"], data["Contact"], data["Address"],
-                        data["Conditions"], data["Medications"], data["Doctor Name"],
-                        data["Last Visit (YYYY-MM-DD)"], data["Notes"]
-                    ))
-                    conn.commit()
-                except Exception as db_e:
-                    # full traceback
-                    tb = traceback.format_exc()
-                    # write verbose log
-                    try:
-                        app = App.get_running_app()
-                        base = app.user_data_dir if app else os.path.expanduser("~/.my_health_app")
-                        os.makedirs(base, exist_ok=True)
-                        logpath = os.path.join(base, "error_log.txt")
-                        with open(logpath, "a", encoding="utf-8") as lf:
-                            lf.write("\n\n--- DB EXCEPTION at " + datetime.now().isoformat() + " ---\n")
-                            lf.write(tb)
-                    except Exception:
-                        pass
 
-                    # show popup with the exception message (dev only)
-                    self.show_error(f"Database error occurred:\n{str(db_e)}\n\nSee error_log.txt for full traceback.", title="DB Error")
-                    return
-                finally:
-                    try:
-                        if cursor:
-                            cursor.close()
-                    except Exception:
-                        pass
-                    try:
-                        if conn:
-                            conn.close()
-                    except Exception:
-                        pass
 
-            # Refresh parent screen list if available
-            try:
-                if hasattr(self, "parent_screen") and self.parent_screen and hasattr(self.parent_screen, 'load_patients'):
-                    self.parent_screen.load_patients()
-            except Exception:
-                self._write_error_log("REFRESH ERROR:\n" + traceback.format_exc())
+# ---------------------------
+# BroadcastScreen
+# ---------------------------
+# shown in the results list: only the recipients that need a second look
+BROADCAST_RESULT_LINES = 50
 
-            # Success + dismiss
-            self.show_error("Patient added successfully.", title="Success")
-            try:
-                self.dismiss()
-            except Exception:
-                pass
 
-        except Exception:
-            tb = traceback.format_exc()
-            self._write_error_log("UNEXPECTED ERROR:\n" + tb)
-            self.show_error("An unexpected error occurred. See error_log.txt in app data.", title="Crash")
+class BroadcastScreen(Screen):
+    """Send one templated SMS to every patient with a condition, medication and/or doctor."""
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.broadcast = None
+        self._refresh_trigger = Clock.create_trigger(lambda dt: self._refresh(), 0.2)
+        layout = BoxLayout(orientation='vertical', padding=dp(15), spacing=dp(10))
+
+        top_bar = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(50))
+        back_btn = Button(
+            text='Back',
+            size_hint=(None, 1),
+            width=dp(100),
+            background_color=(0.3, 0.3, 0.6, 1),
+            color=(1, 1, 1, 1)
+        )
+        back_btn.bind(on_press=lambda x: setattr(self.manager, 'current', 'main'))
+        top_bar.add_widget(back_btn)
+        top_bar.add_widget(Label(text="Broadcast Message", font_size=sp(20), color=(1, 1, 1, 1)))
+        layout.add_widget(top_bar)
+
+        def text_input(hint, multiline=False, height=dp(45)):
+            return TextInput(
+                hint_text=hint,
+                multiline=multiline,
+                size_hint_y=None,
+                height=height,
+                font_size=sp(16),
+            )
+
+        self.condition_input = text_input("Condition (e.g. Diabetes or E11), blank for any")
+        self.medication_input = text_input("Medication (e.g. Metformin), blank for any")
+        self.doctor_input = text_input("Doctor name (e.g. Dr. Mehta), blank for any")
+        self.template_input = text_input("Message", multiline=True, height=dp(100))
+        self.template_input.text = "Dear {first_name}, the clinic of {doctor_name} is closed tomorrow."
+        for widget in (self.condition_input, self.medication_input, self.doctor_input, self.template_input):
+            layout.add_widget(widget)
+        layout.add_widget(Label(
+            text="Placeholders: {first_name} {name} {doctor_name} {conditions} {last_visit}",
+            size_hint_y=None, height=dp(25), font_size=sp(13), color=(0.9, 0.9, 0.9, 1),
+        ))
+
+        buttons = BoxLayout(orientation='horizontal', size_hint_y=None, height=dp(50), spacing=dp(10))
+        self.count_btn = Button(text="Count Recipients", background_color=(0.1, 0.4, 0.6, 1))
+        self.count_btn.bind(on_press=self.count_recipients)
+        self.start_btn = Button(text="Send", background_color=(0.2, 0.7, 0.2, 1))
+        self.start_btn.bind(on_press=self.start_broadcast)
+        self.pause_btn = Button(text="Pause", background_color=(0.6, 0.4, 0.2, 1), disabled=True)
+        self.pause_btn.bind(on_press=self.toggle_pause)
+        self.cancel_btn = Button(text="Cancel", background_color=(0.8, 0.2, 0.2, 1), disabled=True)
+        self.cancel_btn.bind(on_press=self.cancel_broadcast)
+        for btn in (self.count_btn, self.start_btn, self.pause_btn, self.cancel_btn):
+            buttons.add_widget(btn)
+        layout.add_widget(buttons)
+
+        self.progress_bar = ProgressBar(max=1, value=0, size_hint_y=None, height=dp(20))
+        layout.add_widget(self.progress_bar)
+        self.status_label = Label(text="", size_hint_y=None, height=dp(30), color=(1, 1, 1, 1))
+        layout.add_widget(self.status_label)
+
+        self.results_label = Label(
+            text="",
+            size_hint_y=None,
+            font_size=sp(14),
+            halign='left',
+            valign='top',
+            color=(0.9, 0.9, 0.9, 1),
+        )
+        self.results_label.bind(
+            width=lambda inst, w: setattr(inst, 'text_size', (w, None)),
+            texture_size=lambda inst, ts: setattr(inst, 'height', ts[1]),
+        )
+        results_scroll = ScrollView()
+        results_scroll.add_widget(self.results_label)
+        layout.add_widget(results_scroll)
+
+        bg = Background()
+        bg.add_widget(layout)
+        self.add_widget(bg)
+
+    def _filter(self):
+        return (self.condition_input.text.strip() or None, self.doctor_input.text.strip() or None,
+                self.medication_input.text.strip() or None)
+
+    def count_recipients(self, instance):
+        condition, doctor, medication = self._filter()
+        self.status_label.text = "Counting..."
+        get_db_executor().submit(
+            lambda: get_patients().count_cohort(condition, doctor, medication=medication),
+            on_result=lambda n: setattr(self.status_label, 'text', f"{n} patients match."),
+            on_error=self._on_error,
+        )
+
+    def start_broadcast(self, instance):
+        from broadcast import Broadcast, check_template
+
+        if self.broadcast is not None and self.broadcast.finished_at is None:
+            return
+        template = self.template_input.text
+        try:
+            check_template(template)
+        except ValueError as e:
+            self.status_label.text = str(e)
+            return
+        condition, doctor, medication = self._filter()
+        if condition is None and doctor is None and medication is None:
+            self.status_label.text = "Choose a condition, medication or doctor first."
+            return
+
+        def start():
+            broadcast = Broadcast(get_patients(), get_outbox(), template, condition=condition, doctor=doctor,
+                                  medication=medication, on_progress=lambda progress: self._refresh_trigger())
+            broadcast.start()
+            return broadcast
+
+        self.start_btn.disabled = True
+        self.status_label.text = "Starting..."
+        get_db_executor().submit(start, on_result=self._on_started, on_error=self._on_error)
+
+    def _on_started(self, broadcast):
+        self.broadcast = broadcast
+        self.pause_btn.disabled = False
+        self.cancel_btn.disabled = False
+        self._refresh()
+
+    def _on_error(self, e):
+        Logger.error(f"Broadcast: {e}")
+        self.status_label.text = f"Error: {e}"
+        self.start_btn.disabled = False
+
+    def toggle_pause(self, instance):
+        if self.broadcast is None:
+            return
+        if self.broadcast.state == 'paused':
+            self.broadcast.resume()
+        else:
+            self.broadcast.pause()
+        self._refresh()
+
+    def cancel_broadcast(self, instance):
+        if self.broadcast is not None:
+            # fails the queued messages in the outbox: keep it off the UI thread
+            get_db_executor().submit(self.broadcast.cancel, on_error=self._on_error)
+
+    def _refresh(self):
+        broadcast = self.broadcast
+        if broadcast is None:
+            return
+        p = broadcast.progress()
+        total = p['total'] or 0
+        done = p['sent'] + p['failed'] + p['skipped']
+        self.progress_bar.max = max(1, total)
+        self.progress_bar.value = done
+        self.status_label.text = (
+            f"{p['state'].capitalize()}: {done}/{total} done, {p['sent']} sent, "
+            f"{p['failed']} failed, {p['skipped']} skipped, {p['pending']} in progress"
+        )
+        self.pause_btn.text = "Resume" if p['state'] == 'paused' else "Pause"
+        finished = broadcast.finished_at is not None
+        self.pause_btn.disabled = finished
+        self.cancel_btn.disabled = finished
+        self.start_btn.disabled = not finished
+
+        lines = []
+        for patient_id, (status, error) in list(broadcast.results.items()):
+            if status in ('failed', 'skipped'):
+                lines.append(f"{broadcast.names.get(patient_id) or patient_id}: {status} ({error or 'unknown'})")
+                if len(lines) >= BROADCAST_RESULT_LINES:
+                    lines.append("...")
+                    break
+        self.results_label.text = "\n".join(lines)
 
 
 # ---------------------------
@@ -1162,7 +1926,7 @@ class EmergencyAccessScreen(Screen):
         layout.add_widget(label)
 
         notify_btn = Button(
-            text="Notify Emergency Contact",
+            text="Notify Emergency Contacts",
             size_hint=(None, None),
             size=(dp(220), dp(50)),
             pos_hint={'center_x': 0.5, 'center_y': 0.45},
@@ -1172,6 +1936,32 @@ class EmergencyAccessScreen(Screen):
         notify_btn.bind(on_press=self.send_emergency_sms)
         layout.add_widget(notify_btn)
 
+        self.status_label = Label(
+            text="",
+            font_size=sp(16),
+            color=(1, 1, 1, 1),
+            size_hint=(None, None),
+            size=(dp(500), dp(40)),
+            pos_hint={'center_x': 0.5, 'center_y': 0.35}
+        )
+        layout.add_widget(self.status_label)
+
+        # stops the escalation once a responder has answered
+        self.ack_btn = Button(
+            text="Acknowledged",
+            size_hint=(None, None),
+            size=(dp(220), dp(50)),
+            pos_hint={'center_x': 0.5, 'center_y': 0.25},
+            background_color=(0.2, 0.6, 0.3, 1),
+            color=(1, 1, 1, 1),
+            disabled=True,
+        )
+        self.ack_btn.bind(on_press=self.acknowledge_alert)
+        layout.add_widget(self.ack_btn)
+        self.alert_id = None
+        self._starting = False
+        self._early_update = None
+
         bg.add_widget(layout)
         self.add_widget(bg)
 
@@ -1179,8 +1969,55 @@ class EmergencyAccessScreen(Screen):
         self.username = username
 
     def send_emergency_sms(self, instance):
-        message = f"Emergency access triggered by {getattr(self, 'username', 'unknown')}."
-        send_sms("+919876543210", message)
+        if self.alert_id is not None or self._starting:
+            # one alert at a time: it is already escalating
+            return
+        self._starting = True
+        username = getattr(self, 'username', 'unknown')
+        message = f"Emergency access triggered by {username}."
+
+        def on_update(alert, deliveries):
+            # dispatcher thread -> UI thread
+            Clock.schedule_once(lambda dt: self._show_alert(alert, deliveries), 0)
+
+        self.status_label.text = "Alerting emergency contacts..."
+        get_db_executor().submit(
+            lambda: get_emergency_dispatcher().trigger(
+                message, get_escalation_tiers(), triggered_by=username, on_update=on_update),
+            on_result=self._on_alert_started,
+            on_error=self._on_alert_error,
+        )
+
+    def _on_alert_started(self, alert_id):
+        self._starting = False
+        self.alert_id = alert_id
+        self.ack_btn.disabled = False
+        early, self._early_update = self._early_update, None
+        if early is not None and early[0].id == alert_id:
+            self._show_alert(*early)
+
+    def _on_alert_error(self, e):
+        self._starting = False
+        Logger.error(f"Emergency: could not start the alert: {e}")
+        self.status_label.text = "Could not send the alert. Call the helpline."
+
+    def _show_alert(self, alert, deliveries):
+        if alert is None:
+            return
+        if alert.id != self.alert_id:
+            if self._starting:
+                # the dispatcher can report before trigger() has handed back the id
+                self._early_update = (alert, deliveries)
+            return
+        self.status_label.text = describe_alert(alert, deliveries)
+        if alert.finished_at is not None:
+            self.alert_id = None
+            self.ack_btn.disabled = True
+
+    def acknowledge_alert(self, instance):
+        if self.alert_id is not None:
+            get_emergency_dispatcher().acknowledge(self.alert_id, by=getattr(self, 'username', None))
+            self.ack_btn.disabled = True
 
 
 # ---------------------------
@@ -1247,11 +2084,15 @@ class SettingsScreen(Screen):
 
         btn_app_version = main_style_btn('App Version', (0.07, 0.35, 0.45, 1), self.show_app_version)
         btn_about_app = main_style_btn('About This App', (0.07, 0.25, 0.35, 1), self.show_about_app)
+        btn_export = main_style_btn('Export Patient Records', (0.1, 0.4, 0.3, 1), self.export_records)
+        self.btn_low_power = main_style_btn(self._low_power_text(), (0.25, 0.3, 0.2, 1), self.toggle_low_power)
+        btn_switch_user = main_style_btn('Switch User', (0.3, 0.3, 0.5, 1), self.switch_user)
         btn_logout = main_style_btn('Logout', (0.6, 0.12, 0.12, 1), self.logout)
         btn_back = main_style_btn('Back to Menu', (0.18, 0.18, 0.33, 1), self.back_to_menu)
 
         # Add small elevation effect using spacing widgets above and below each button
-        for w in (btn_app_version, btn_about_app, btn_logout, btn_back):
+        for w in (btn_app_version, btn_about_app, btn_export, self.btn_low_power, btn_switch_user, btn_logout,
+                  btn_back):
             # a surrounding BoxLayout to give visual breathing room (like the main screen)
             wrapper = BoxLayout(size_hint=(1, None), height=w.height)
             wrapper.add_widget(w)
@@ -1264,14 +2105,55 @@ class SettingsScreen(Screen):
         outer.add_widget(scroll)
         bg.add_widget(outer)
         self.add_widget(bg)
-    def logout(self, instance):
-        try:
-            store = get_store()
-            if store.exists('user'):
-                store.delete('user')
-        except Exception:
-            pass
-        self.manager.current = 'login'
+    def _low_power_text(self):
+        return 'Low Power Mode: ' + ('On' if get_background_video().low_power else 'Off')
+
+    def toggle_low_power(self, instance):
+        background = get_background_video()
+        background.low_power = not background.low_power
+        self.btn_low_power.text = self._low_power_text()
+        get_session().put('settings', low_power=background.low_power)
+
+    def export_records(self, instance):
+        if getattr(self, '_export', None) is not None and not self._export.done():
+            return
+        from patient_export import export_in_background
+
+        export_dir = os.path.join(get_app_storage_dir(), "exports")
+        os.makedirs(export_dir, exist_ok=True)
+        path = os.path.join(export_dir, datetime.now().strftime("patients-%Y%m%d-%H%M%S.csv.gz"))
+
+        content = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        status = Label(text='Exporting...', font_size=16, color=(1, 1, 1, 1))
+        content.add_widget(status)
+        close_btn = Button(text='Close', size_hint_y=None, height=40)
+        content.add_widget(close_btn)
+        popup = Popup(
+            title='Export Patient Records',
+            content=content,
+            size_hint=(None, None),
+            size=(dp(500), dp(300)),
+            auto_dismiss=False,
+        )
+        close_btn.bind(on_press=popup.dismiss)
+        popup.open()
+
+        # progress arrives on the export thread; hop to the UI thread to show it
+        def on_progress(stats):
+            text = f"Exported {stats['rows']} rows ({stats['rows_per_sec']:.0f} rows/s)"
+            Clock.schedule_once(lambda dt: setattr(status, 'text', text), 0)
+
+        def on_done(future):
+            if future.exception() is not None:
+                Logger.error(f"Settings: export failed {future.exception()}")
+                text = "Export failed."
+            else:
+                text = f"Saved {future.result()['rows']} rows to\n{path}"
+            Clock.schedule_once(lambda dt: setattr(status, 'text', text), 0)
+
+        # get_db_pool may open the DB and migrate it: resolved on the export thread
+        self._export = export_in_background(get_db_pool, path, progress=on_progress)
+        self._export.add_done_callback(on_done)
 
     def show_app_version(self, instance):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
@@ -1311,7 +2193,12 @@ class SettingsScreen(Screen):
         popup.open()
 
     def logout(self, instance):
-        # perform any logout cleanup here
+        get_session().logout()
+        self.manager.current = 'login'
+
+    def switch_user(self, instance):
+        # keeps this user's session, so they can switch back from the login screen
+        get_session().suspend()
         self.manager.current = 'login'
 
     def back_to_menu(self, instance):
@@ -1343,36 +2230,86 @@ if platform == 'android':
         hide_android_ui = lambda *a, **k: None
 
 
+# ---------------------------
+# Lazy screen registry
+# ---------------------------
+class LazyScreenManager(ScreenManager):
+    """
+    ScreenManager whose screens are registered as factories and only built
+    the first time they are looked up (navigated to, get_screen, ...), or
+    ahead of time in idle frames via prebuild_when_idle.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._factories = {}
+        self._prebuild = []
+        self.on_screen_built = None
+
+    def register(self, name, factory):
+        self._factories[name] = factory
+
+    def is_built(self, name):
+        return super().has_screen(name)
+
+    def has_screen(self, name):
+        return name in self._factories or super().has_screen(name)
+
+    def get_screen(self, name):
+        if name in self._factories and not super().has_screen(name):
+            self._build(name)
+        return super().get_screen(name)
+
+    def _build(self, name):
+        started = Clock.get_time()
+        screen = self._factories.pop(name)(name=name)
+        self.add_widget(screen)
+        Logger.debug(f"Screens: built '{name}' in {(Clock.get_time() - started) * 1000:.1f} ms")
+        if self.on_screen_built is not None:
+            self.on_screen_built(screen)
+        return screen
+
+    def prebuild_when_idle(self, names, interval=0.25):
+        # one screen per tick keeps each frame short while the splash plays
+        self._prebuild = [n for n in names if n in self._factories]
+        if self._prebuild:
+            Clock.schedule_once(self._prebuild_next, interval)
+
+    def _prebuild_next(self, dt):
+        while self._prebuild:
+            name = self._prebuild.pop(0)
+            if name in self._factories:
+                self._build(name)
+                break
+        if self._prebuild:
+            Clock.schedule_once(self._prebuild_next, dt)
+
+
 # ---------------------------
 # App main class
 # ---------------------------
 
 class Health(App):
     def build(self):
-        # Create screens
-        sm = ScreenManager()
-        sm.add_widget(LoginScreen(name='login'))
-        sm.add_widget(MainScreen(name='main'))
-        sm.add_widget(PatientListScreen(name='record'))
-        sm.add_widget(PatientDetailsScreen(name='patient_details'))
-        sm.add_widget(EmergencyAccessScreen(name='emergency'))
-        sm.add_widget(SettingsScreen(name='settings'))
+        startup_profile.mark('build_start')
+        # Register screens; each one is only built when first needed
+        sm = LazyScreenManager()
+        sm.register('login', LoginScreen)
+        sm.register('main', MainScreen)
+        sm.register('record', PatientListScreen)
+        sm.register('patient_details', PatientDetailsScreen)
+        sm.register('emergency', EmergencyAccessScreen)
+        sm.register('broadcast', BroadcastScreen)
+        sm.register('settings', SettingsScreen)
+        sm.on_screen_built = self._on_screen_built
 
         # ---- Decide splash target synchronously (NO Clock delay) ----
         # Determine if a saved session exists right now so we can set the splash target.
-        try:
-            # Use App.user_data_dir (available on build()) or fallback to home
-            base = self.user_data_dir if hasattr(self, 'user_data_dir') and self.user_data_dir \
-                   else os.path.expanduser("~/.my_health_app")
-            os.makedirs(base, exist_ok=True)
-            store_path = os.path.join(base, "user_store.json")
-            store = JsonStore(store_path)
-            if store.exists('user'):
-                splash_target = 'main'
-            else:
-                splash_target = 'login'
-        except Exception:
-            splash_target = 'login'
+        # The session file is read here, once; everything after is served from memory
+        session = get_session()
+        session.touch()
+        splash_target = 'main' if session.current_user() else 'login'
+        get_background_video().low_power = bool(session.get('settings', {}).get('low_power', False))
 
         # Add the SplashScreen first and give it the correct next_screen target
         sm.add_widget(
@@ -1387,49 +2324,109 @@ class Health(App):
         # Make sure splash is the first visible screen
         sm.current = 'splash'
 
-        # Ensure DB/tables exist now that App exists and user_data_dir is available
-        try:
-            create_db()
-        except Exception as e:
-            # Write a helpful error_log inside the app data dir (if possible)
-            try:
-                base = self.user_data_dir if hasattr(self, 'user_data_dir') and self.user_data_dir else os.path.expanduser("~/.my_health_app")
-                os.makedirs(base, exist_ok=True)
-                with open(os.path.join(base, "error_log.txt"), "a", encoding="utf-8") as f:
-                    f.write("create_db() error in build():\n")
-                    f.write(traceback.format_exc())
-            except Exception:
-                pass
+        # The shared background only decodes while a screen that shows it is up
+        background = get_background_video()
+        sm.bind(current=lambda inst, name: background.set_visible(name != 'splash'))
+        Window.bind(on_minimize=lambda *a: background.set_minimized(True),
+                    on_restore=lambda *a: background.set_minimized(False))
+
+        # Build the splash target first, then the rest, in idle frames while the splash plays
+        sm.prebuild_when_idle([splash_target] + [n for n in ('login', 'main', 'record', 'patient_details',
+                                                             'emergency', 'broadcast', 'settings')
+                                                   if n != splash_target])
+
+        # Open the DB (and create tables) on the DB executor, off the UI thread, and
+        # start the SMS dispatcher: the outbox may still hold unsent messages
+        get_db_executor().submit(get_outbox, on_error=self._on_db_init_failed)
+        # staff accounts ready (and seeded on a fresh install) before the first login; a
+        # restored session whose account was retired is ended, and the splash then goes to login
+        get_db_executor().submit(get_staff, on_result=lambda staff: self._leave_ended_session(),
+                                 on_error=self._on_db_init_failed)
 
         # Hide system UI on Android if requested
         if platform == 'android':
             Clock.schedule_once(lambda dt: hide_android_ui(), 0.5)
 
+        startup_profile.mark('build_end')
+        if startup_profile.ENABLED:
+            Window.bind(on_flip=self._on_first_frame)
         return sm
 
+    def _on_first_frame(self, *args):
+        Window.unbind(on_flip=self._on_first_frame)
+        try:
+            data = startup_profile.finish(os.path.join(self.user_data_dir, "startup_profile.json"))
+        except Exception as e:
+            Logger.warning(f"Startup: could not write profile: {e}")
+            return
+        phases = ", ".join(f"{p['phase']}={p['ms']:.0f}ms" for p in data['phases'])
+        slowest = ", ".join(f"{i['module']}={i['ms']:.0f}ms" for i in data['top_level_imports'][:5])
+        Logger.info(f"Startup: {phases}")
+        Logger.info(f"Startup: slowest imports {slowest}")
+
+    def _on_db_init_failed(self, e):
+        Logger.error("DB: migrate_db() error in build()", exc_info=e)
+
+    def _on_screen_built(self, screen):
+        # screens built after login still need to know who is logged in
+        sm = screen.manager
+        if screen.name == 'main':
+            current = get_session().current_user()
+            if current:
+                screen.load_user(*current)
+        elif sm.is_built('main') and hasattr(screen, 'set_user'):
+            username = sm.get_screen('main').username
+            if username:
+                screen.set_user(username)
+
     # keep on_pause / on_resume as you already have
     def on_pause(self):
+        get_background_video().set_app_paused(True)
         return True
 
+    def on_stop(self):
+        close_emergency_dispatcher()
+        stop_outbox()
+        shutdown_db_executor()
+        close_db_pool()
+        close_session()
+        app_log.shutdown()
+
     def on_resume(self):
-        try:
-            sm = self.root
-            store = get_store()
-            if store.exists('user') and sm:
-                u = store.get('user')
-                if hasattr(sm.get_screen('main'), 'load_user'):
-                    sm.get_screen('main').load_user(u['username'], u['role'])
-        except Exception:
-            pass
+        get_background_video().set_app_paused(False)
+        # in memory: no file I/O on resume
+        sm = self.root
+        session = get_session()
+        session.touch()
+        current = session.current_user()
+        if not sm:
+            return
+        if current:
+            sm.get_screen('main').load_user(*current)
+            # the account may have been deactivated in the meantime
+            get_db_executor().submit(end_inactive_sessions, on_result=lambda _: self._leave_ended_session(),
+                                     on_error=lambda e: Logger.error("Session: could not check the account",
+                                                                     exc_info=e))
+        elif sm.current not in ('splash', 'login'):
+            # the session expired while the app was in the background
+            sm.current = 'login'
+
+    def _leave_ended_session(self):
+        # UI thread: nobody is logged in any more, so nothing past the login screen stays open
+        sm = self.root
+        if not sm or get_session().current_user() is not None:
+            return
+        if sm.current == 'splash':
+            sm.current_screen.next_screen = 'login'
+        elif sm.current != 'login':
+            sm.current = 'login'
 
     # you can keep _restore_session if you like, but DO NOT schedule it in build()
     def _restore_session(self, sm):
         try:
-            store = get_store()
-            if store.exists('user'):
-                u = store.get('user')
-                username = u.get('username')
-                role = u.get('role')
+            current = get_session().current_user()
+            if current:
+                username, role = current
                 if hasattr(sm.get_screen('main'), 'load_user'):
                     sm.get_screen('main').load_user(username, role)
                     sm.current = 'main'
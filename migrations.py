@@ -0,0 +1,351 @@
+import sqlite3
+from contextlib import contextmanager
+
+# ---------------------------
+# Versioned schema migrations
+# ---------------------------
+# The schema version lives in PRAGMA user_version. Each entry below upgrades
+# the schema by one version; migrate() applies the pending ones in order,
+# each inside its own transaction together with the version bump, so a
+# failed upgrade leaves the DB at the last good version. All DDL lives here:
+# it runs once at startup and never on the insert/query paths.
+#
+# To change the schema, append a new (description, function) entry. Never
+# edit or reorder entries that have already shipped.
+
+
+def _create_patients(conn):
+    # IF NOT EXISTS: DBs created before versioning already have the table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            age INTEGER,
+            gender TEXT,
+            contact TEXT,
+            address TEXT,
+            conditions TEXT,
+            medications TEXT,
+            doctor_name TEXT,
+            last_visit TEXT,
+            notes TEXT
+        )
+    ''')
+
+
+def _create_name_index(conn):
+    # (name, id) index backs the ordered, keyset-paginated patient list
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_patients_name_id ON patients(name, id)')
+
+
+def _create_search_index(conn):
+    """FTS5 index over the searchable patient columns, kept in sync by triggers."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patients_fts'"
+    ).fetchone()
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+                name, conditions, medications, doctor_name, notes,
+                content='patients', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        if 'no such module' not in str(e):
+            raise
+        # SQLite built without FTS5: search falls back to LIKE
+        return
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN
+            INSERT INTO patients_fts(rowid, name, conditions, medications, doctor_name, notes)
+            VALUES (new.id, new.name, new.conditions, new.medications, new.doctor_name, new.notes);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN
+            INSERT INTO patients_fts(patients_fts, rowid, name, conditions, medications, doctor_name, notes)
+            VALUES ('delete', old.id, old.name, old.conditions, old.medications, old.doctor_name, old.notes);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE ON patients BEGIN
+            INSERT INTO patients_fts(patients_fts, rowid, name, conditions, medications, doctor_name, notes)
+            VALUES ('delete', old.id, old.name, old.conditions, old.medications, old.doctor_name, old.notes);
+            INSERT INTO patients_fts(rowid, name, conditions, medications, doctor_name, notes)
+            VALUES (new.id, new.name, new.conditions, new.medications, new.doctor_name, new.notes);
+        END
+    ''')
+    if not exists:
+        # index rows that were inserted before the FTS table existed
+        conn.execute("INSERT INTO patients_fts(patients_fts) VALUES ('rebuild')")
+
+
+def _create_sms_outbox(conn):
+    # persistent queue drained by sms_outbox.Outbox; times are UNIX epoch seconds
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sms_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            sent_at REAL,
+            last_error TEXT,
+            patient_id INTEGER,
+            tag TEXT
+        )
+    ''')
+    # the dispatcher's "next due message" lookup
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sms_outbox_due
+        ON sms_outbox(status, priority DESC, next_attempt_at)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sms_outbox_tag
+        ON sms_outbox(tag) WHERE tag IS NOT NULL
+    ''')
+
+
+def _create_emergency_alerts(conn):
+    # one row per emergency alert (emergency_alert.EmergencyDispatcher) and one per
+    # message it sent; times are UNIX epoch seconds, latencies ms since the trigger
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS emergency_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            triggered_by TEXT,
+            message TEXT NOT NULL,
+            status TEXT NOT NULL,
+            tier INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            dispatch_ms REAL,
+            first_delivery_ms REAL,
+            ack_ms REAL,
+            acknowledged_by TEXT,
+            finished_at REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS emergency_deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            alert_id INTEGER NOT NULL REFERENCES emergency_alerts(id) ON DELETE CASCADE,
+            tier INTEGER NOT NULL,
+            recipient TEXT,
+            number TEXT NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            latency_ms REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_emergency_deliveries_alert
+        ON emergency_deliveries(alert_id, tier)
+    ''')
+
+
+def _create_staff_users(conn):
+    # login accounts (staff_accounts.StaffDirectory); password_hash is a salted
+    # KDF string, never the password. Usernames are case-sensitive ('K' != 'k').
+    # is_default marks the legacy K/k logins, retired once real accounts exist.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS staff_users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            role TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1,
+            is_default INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_staff_users_username ON staff_users(username)')
+
+
+def _create_patient_terms(conn):
+    """
+    Conditions and medications as normalized, indexed terms (see
+    patient_terms). Existing patients are not indexed here: that would hold
+    the write lock for the whole table. The step only records how far
+    patient_terms.backfill() has to go, and that runs in short batches
+    once the DB is open.
+    """
+    # (term, patient_id) primary key: a cohort is one range of the table, already in id order
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patient_conditions (
+            patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+            term TEXT NOT NULL,
+            code TEXT,
+            PRIMARY KEY (term, patient_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patient_medications (
+            patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+            term TEXT NOT NULL,
+            dose TEXT,
+            code TEXT,
+            PRIMARY KEY (term, patient_id)
+        ) WITHOUT ROWID
+    ''')
+    for table in ('patient_conditions', 'patient_medications'):
+        conn.execute(f'''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_code
+            ON {table}(code, patient_id) WHERE code IS NOT NULL
+        ''')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_patient ON {table}(patient_id)')
+    # foreign keys are not enforced on the app's connections: the trigger does the cascade
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS patient_terms_ad AFTER DELETE ON patients BEGIN
+            DELETE FROM patient_conditions WHERE patient_id = old.id;
+            DELETE FROM patient_medications WHERE patient_id = old.id;
+        END
+    ''')
+    # single row while a backfill is due: indexed up to done_id, of the ids up to until_id
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patient_terms_backfill (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            done_id INTEGER NOT NULL,
+            until_id INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO patient_terms_backfill (id, done_id, until_id)
+        SELECT 1, 0, MAX(id) FROM patients HAVING MAX(id) IS NOT NULL
+    ''')
+
+
+# Version N is reached by applying MIGRATIONS[N - 1].
+MIGRATIONS = [
+    ("patients table", _create_patients),
+    ("patient list (name, id) index", _create_name_index),
+    ("full-text search index", _create_search_index),
+    ("sms outbox", _create_sms_outbox),
+    ("emergency alert log", _create_emergency_alerts),
+    ("staff accounts", _create_staff_users),
+    ("normalized conditions and medications", _create_patient_terms),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, log=None):
+    """
+    Bring the DB on `conn` up to SCHEMA_VERSION. Returns the list of versions
+    applied (empty when already current). `log(message)` is called once per
+    applied migration. Raises RuntimeError for a DB written by a newer app.
+    Also puts back what an interrupted bulk_load() left dropped.
+    """
+    if schema_version(conn) == SCHEMA_VERSION:
+        # the common case on every start after the first: no write lock needed
+        repair_bulk_load(conn, log)
+        return []
+    applied = []
+    while True:
+        if conn.in_transaction:
+            conn.commit()
+        # IMMEDIATE takes the write lock before the version is re-read, so two
+        # processes opening the same DB cannot apply the same step twice
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = schema_version(conn)
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(
+                    f"database schema version {version} is newer than this app supports ({SCHEMA_VERSION})"
+                )
+            if version == SCHEMA_VERSION:
+                conn.rollback()
+                repair_bulk_load(conn, log)
+                return applied
+            description, upgrade = MIGRATIONS[version]
+            upgrade(conn)
+            # user_version is part of the transaction: it only moves if the step commits
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version + 1)
+        if log is not None:
+            log(f"schema migrated to v{version + 1}: {description}")
+
+
+# ---------------------------
+# Bulk loading
+# ---------------------------
+_FTS_TRIGGERS = ('patients_fts_ai', 'patients_fts_ad', 'patients_fts_au')
+
+
+@contextmanager
+def bulk_load(conn):
+    """
+    Drop the list index and the FTS sync triggers while a large number of
+    patients is inserted, then rebuild both in a single pass at the end,
+    which is several times faster than maintaining them row by row.
+    Run the whole block while holding the pool's writer so nothing else
+    writes in between; search results are stale until the block exits. If
+    the process dies inside the block, the next migrate() finds the index
+    and triggers missing and rebuilds them (repair_bulk_load).
+    """
+    has_fts = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patients_fts'"
+    ).fetchone()
+    conn.execute('DROP INDEX IF EXISTS idx_patients_name_id')
+    for trigger in _FTS_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    conn.commit()
+    try:
+        yield
+    finally:
+        _create_name_index(conn)
+        if has_fts:
+            _create_search_index(conn)
+            conn.execute("INSERT INTO patients_fts(patients_fts) VALUES ('rebuild')")
+        conn.commit()
+
+
+def _missing_bulk_load_objects(conn):
+    names = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE name = 'idx_patients_name_id' OR name = 'patients_fts' "
+        "OR (type = 'trigger' AND name LIKE 'patients_fts_%')"
+    )}
+    missing = [] if 'idx_patients_name_id' in names else ['idx_patients_name_id']
+    if 'patients_fts' in names:
+        missing += [trigger for trigger in _FTS_TRIGGERS if trigger not in names]
+    return missing
+
+
+def repair_bulk_load(conn, log=None):
+    """
+    Recreate the list index and FTS triggers if a bulk_load() never got to
+    its end (the process died mid-load), and rebuild the FTS index, which
+    missed every row inserted meanwhile. A read of sqlite_master when
+    nothing is missing. Returns the names it recreated.
+    """
+    if not _missing_bulk_load_objects(conn):
+        return []
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # re-read under the write lock: another connection may have repaired it already
+        missing = _missing_bulk_load_objects(conn)
+        if 'idx_patients_name_id' in missing:
+            _create_name_index(conn)
+        if any(name in _FTS_TRIGGERS for name in missing):
+            _create_search_index(conn)
+            conn.execute("INSERT INTO patients_fts(patients_fts) VALUES ('rebuild')")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if missing and log is not None:
+        log(f"rebuilt {', '.join(missing)} left dropped by an interrupted bulk load")
+    return missing
@@ -0,0 +1,166 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+
+from patient_import import PATIENT_COLUMNS
+
+EXPORT_COLUMNS = ['id'] + PATIENT_COLUMNS
+
+
+# ---------------------------
+# Streaming reader
+# ---------------------------
+def iter_patients(pool, batch_size=1000):
+    """
+    Yield patient rows (tuples in EXPORT_COLUMNS order) in id order.
+    Reads one keyset batch at a time and hands the reader connection back
+    between batches, so memory stays at one batch and the app keeps working.
+    """
+    select = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM patients WHERE id > ? ORDER BY id LIMIT ?"
+    last_id = 0
+    while True:
+        with pool.reader() as conn:
+            rows = conn.execute(select, (last_id, batch_size)).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            return
+
+
+# ---------------------------
+# Writers
+# ---------------------------
+def _export_format(path):
+    lower = path.lower()
+    if lower.endswith('.zip'):
+        return 'csv', 'zip'
+    compression = None
+    if lower.endswith('.gz'):
+        compression = 'gzip'
+        lower = lower[:-3]
+    if lower.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl', compression
+    if lower.endswith('.csv'):
+        return 'csv', compression
+    raise ValueError(f"unsupported export file type: {path} (use .csv, .jsonl, .gz or .zip)")
+
+
+def _write_rows(f, fmt, rows, stats, progress, every):
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        write = writer.writerow
+    else:
+        def write(row):
+            f.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False))
+            f.write('\n')
+
+    for row in rows:
+        write(row)
+        stats['rows'] += 1
+        if progress is not None and stats['rows'] % every == 0:
+            stats['elapsed'] = time.perf_counter() - stats['_started']
+            stats['rows_per_sec'] = stats['rows'] / stats['elapsed'] if stats['elapsed'] else 0.0
+            progress({k: v for k, v in stats.items() if not k.startswith('_')})
+
+
+def export_patients(pool, path, batch_size=1000, progress=None):
+    """
+    Stream the patients table to `path`. The format follows the extension:
+    .csv, .jsonl, either with .gz, or .zip (a zip holding patients.csv).
+    Writes to a temp file and renames it into place when complete.
+    Returns stats with rows, elapsed seconds and rows_per_sec.
+    """
+    fmt, compression = _export_format(path)
+    stats = {'rows': 0, 'elapsed': 0.0, 'rows_per_sec': 0.0, '_started': time.perf_counter()}
+    rows = iter_patients(pool, batch_size=batch_size)
+    tmp_path = path + '.part'
+
+    try:
+        if compression == 'zip':
+            with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                with zf.open('patients.csv', 'w', force_zip64=True) as raw:
+                    with io.TextIOWrapper(raw, encoding='utf-8', newline='') as f:
+                        _write_rows(f, fmt, rows, stats, progress, batch_size)
+        elif compression == 'gzip':
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as f:
+                _write_rows(f, fmt, rows, stats, progress, batch_size)
+        else:
+            with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+                _write_rows(f, fmt, rows, stats, progress, batch_size)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    stats['elapsed'] = time.perf_counter() - stats.pop('_started')
+    stats['rows_per_sec'] = stats['rows'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    if progress is not None:
+        progress(dict(stats))
+    return stats
+
+
+def export_in_background(pool, path, batch_size=1000, progress=None):
+    """
+    Run export_patients on its own daemon thread; returns a Future with the
+    stats. `pool` may also be a function returning the pool, called on that
+    thread, so opening the DB never happens on the caller's.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            source = pool() if callable(pool) else pool
+            future.set_result(export_patients(source, path, batch_size=batch_size, progress=progress))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name='patient-export', daemon=True).start()
+    return future
+
+
+def main(argv=None):
+    from db_pool import ConnectionPool
+
+    parser = argparse.ArgumentParser(description="Export the patients table.")
+    parser.add_argument('output', help="target file: .csv, .jsonl, .csv.gz, .jsonl.gz or .zip")
+    parser.add_argument('--db', required=True, help="path to health_records.db")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"database not found: {args.db}")
+    try:
+        _export_format(args.output)
+    except ValueError as e:
+        parser.error(str(e))
+
+    pool = ConnectionPool(args.db, readers=1)
+
+    def report(stats):
+        print(f"exported {stats['rows']} rows ({stats['rows_per_sec']:.0f} rows/s)", file=sys.stderr)
+
+    try:
+        export_patients(pool, args.output, batch_size=args.batch_size, progress=report)
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
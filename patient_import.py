@@ -0,0 +1,202 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from patient_terms import index_patients, max_patient_id
+
+# ---------------------------
+# Patient fields and validation (shared with AddPatientPopup)
+# ---------------------------
+# (form label, column) in the order the add-patient form shows them
+PATIENT_FIELDS = [
+    ("Name", "name"),
+    ("Age", "age"),
+    ("Gender", "gender"),
+    ("Contact", "contact"),
+    ("Address", "address"),
+    ("Conditions", "conditions"),
+    ("Medications", "medications"),
+    ("Doctor Name", "doctor_name"),
+    ("Last Visit (YYYY-MM-DD)", "last_visit"),
+    ("Notes", "notes"),
+]
+PATIENT_COLUMNS = [column for _, column in PATIENT_FIELDS]
+
+INSERT_PATIENT_SQL = '''
+    INSERT INTO patients (
+        name, age, gender, contact, address,
+        conditions, medications, doctor_name, last_visit, notes
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def validate_patient(data):
+    """
+    Check a record keyed by form label. Returns the error message to show,
+    or None if the record can be saved.
+    """
+    if not data.get("Name"):
+        return "Name is required.\nEnter your good name please."
+    if not data.get("Age"):
+        return "Age is required."
+    if not data.get("Contact"):
+        return "Contact is important, fill it."
+    if not data.get("Last Visit (YYYY-MM-DD)"):
+        return "Last visit is required."
+    try:
+        datetime.strptime(data["Last Visit (YYYY-MM-DD)"], '%Y-%m-%d')
+    except Exception:
+        return "Last Visit date must be YYYY-MM-DD"
+    return None
+
+
+def patient_row(data):
+    """Column-ordered tuple for INSERT_PATIENT_SQL from a record keyed by form label."""
+    return tuple(data.get(label, "") for label, _ in PATIENT_FIELDS)
+
+
+def normalize_record(raw):
+    """
+    Map an imported record onto form labels. Accepts either the form labels
+    ("Doctor Name") or the column names ("doctor_name") as keys.
+    """
+    data = {}
+    for label, column in PATIENT_FIELDS:
+        value = raw.get(label, raw.get(column))
+        data[label] = "" if value is None else str(value).strip()
+    return data
+
+
+# ---------------------------
+# Streaming readers
+# ---------------------------
+def iter_records(path):
+    """Yield (line_number, raw_record) from a CSV or JSONL file without loading it whole."""
+    if path.lower().endswith(('.jsonl', '.ndjson')):
+        with open(path, encoding='utf-8') as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_no, {'__error__': f"invalid JSON: {e}", '__raw__': line}
+                    continue
+                if not isinstance(record, dict):
+                    yield line_no, {'__error__': "not a JSON object", '__raw__': line}
+                    continue
+                yield line_no, record
+    else:
+        with open(path, encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+
+
+# ---------------------------
+# Bulk import
+# ---------------------------
+def import_patients(pool, path, batch_size=5000, progress=None, rejects_path=None):
+    """
+    Stream `path` into the patients table in executemany batches, one
+    transaction per batch, holding at most one batch in memory.
+    Invalid rows are written as JSON lines to `rejects_path`
+    (default: <path>.rejected.jsonl). `progress(stats)` is called after
+    every batch. Returns the final stats dict.
+    """
+    if rejects_path is None:
+        rejects_path = path + '.rejected.jsonl'
+
+    stats = {'read': 0, 'inserted': 0, 'rejected': 0, 'elapsed': 0.0, 'rows_per_sec': 0.0}
+    started = time.perf_counter()
+    batch = []
+    rejects = None
+
+    def update_rate():
+        stats['elapsed'] = time.perf_counter() - started
+        stats['rows_per_sec'] = stats['inserted'] / stats['elapsed'] if stats['elapsed'] else 0.0
+
+    def flush(report=True):
+        if not batch:
+            return
+        with pool.writer() as conn:
+            last_id = max_patient_id(conn)
+            conn.executemany(INSERT_PATIENT_SQL, batch)
+            # conditions / medications terms for the new rows, in the same transaction
+            index_patients(conn, after_id=last_id)
+        stats['inserted'] += len(batch)
+        batch.clear()
+        if report and progress is not None:
+            update_rate()
+            progress(dict(stats))
+
+    try:
+        for line_no, raw in iter_records(path):
+            stats['read'] += 1
+            error = raw.get('__error__')
+            data = None
+            if error is None:
+                data = normalize_record(raw)
+                error = validate_patient(data)
+            if error is not None:
+                if rejects is None:
+                    rejects = open(rejects_path, 'w', encoding='utf-8')
+                rejects.write(json.dumps({
+                    'line': line_no,
+                    'error': error.replace('\n', ' '),
+                    'record': raw.get('__raw__', raw),
+                }) + '\n')
+                stats['rejected'] += 1
+                continue
+            batch.append(patient_row(data))
+            if len(batch) >= batch_size:
+                flush()
+        flush(report=False)
+    finally:
+        if rejects is not None:
+            rejects.close()
+
+    update_rate()
+    if progress is not None:
+        progress(dict(stats))
+    return stats
+
+
+def main(argv=None):
+    from db_pool import ConnectionPool
+    from migrations import migrate
+
+    parser = argparse.ArgumentParser(description="Bulk import patients from CSV or JSONL.")
+    parser.add_argument('file', help="CSV (with a header row) or .jsonl file")
+    parser.add_argument('--db', required=True, help="path to health_records.db")
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--rejects', help="where to write rejected rows (default: <file>.rejected.jsonl)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"database not found: {args.db} (start the app once to create it)")
+
+    pool = ConnectionPool(args.db, readers=1)
+    # a DB last opened by an older app version may still lack tables or indexes
+    with pool.writer() as conn:
+        migrate(conn)
+
+    def report(stats):
+        print(f"read {stats['read']}  inserted {stats['inserted']}  rejected {stats['rejected']}"
+              f"  ({stats['rows_per_sec']:.0f} rows/s)", file=sys.stderr)
+
+    try:
+        stats = import_patients(pool, args.file, batch_size=args.batch_size,
+                                progress=report, rejects_path=args.rejects)
+    finally:
+        pool.close()
+    return 0 if stats['rejected'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,431 @@
+import logging
+import re
+import sqlite3
+from collections import namedtuple
+from itertools import islice
+
+from patient_import import INSERT_PATIENT_SQL, PATIENT_COLUMNS, PATIENT_FIELDS
+from patient_terms import (
+    backfill, backfill_pending, index_patients, index_terms, matches, max_patient_id, parse_conditions,
+    parse_medications, resolve,
+)
+
+log = logging.getLogger(__name__)
+
+# ---------------------------
+# Records
+# ---------------------------
+# Tuples, so existing code that indexes rows (patient[1], id, name = row)
+# keeps working, with named fields for new code.
+Patient = namedtuple('Patient', ['id'] + PATIENT_COLUMNS)
+PatientSummary = namedtuple('PatientSummary', ['id', 'name'])
+
+_SELECT_PATIENT = f"SELECT {', '.join(Patient._fields)} FROM patients"
+_PATIENT_COLUMNS_P = ', '.join(f"p.{field}" for field in Patient._fields)
+_CONDITIONS = PATIENT_COLUMNS.index('conditions')
+_MEDICATIONS = PATIENT_COLUMNS.index('medications')
+
+PAGE_SIZE = 100
+SEARCH_LIMIT = 200
+# stay well under SQLITE_MAX_VARIABLE_NUMBER on old builds (999)
+_IN_CHUNK = 500
+
+
+def _row_values(record):
+    """
+    Column-ordered values for one new patient. `record` may be a Patient
+    (its id is ignored), a plain tuple already in PATIENT_COLUMNS order, or a
+    mapping keyed by column name or by form label.
+    """
+    if isinstance(record, Patient):
+        return tuple(record[1:])
+    if isinstance(record, tuple):
+        return record
+    return tuple(
+        record.get(column, record.get(label, ""))
+        for label, column in PATIENT_FIELDS
+    )
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def fts_query(text):
+    # quote each word and prefix-match it, so user input can never be parsed as FTS syntax
+    words = re.findall(r"\w+", text, flags=re.UNICODE)
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def _term_filter(table, forms):
+    # "column = ?" for one matched form, "(term = ? OR code = ?)" for both
+    sql = ' OR '.join(f"{column} = ?" for column, _ in forms)
+    return (f"({sql})" if len(forms) > 1 else sql), [value for _, value in forms]
+
+
+def _cohort_source(conn, condition, doctor, medication, rows=True):
+    """
+    (FROM clause, its params, id column, WHERE clauses, their params) for a
+    cohort filter, or None if a condition or medication matches nobody.
+    With a condition (or a medication) the scan is driven by that term's
+    (term, patient_id) key, which hands back the cohort already in id
+    order; a value that is both some patient's term and some patient's
+    code drives it with a UNION of the two index seeks instead. The other
+    filters are checked per row with index lookups. With `rows` false
+    (counting) and no doctor, patients is not joined at all.
+    """
+    terms = []
+    for table, value in (('patient_conditions', condition), ('patient_medications', medication)):
+        if value:
+            forms = resolve(conn, table, value)
+            if not forms:
+                return None
+            terms.append((table, forms))
+    source_params, clauses, params = [], [], []
+    if terms:
+        (table, forms), others = terms[0], terms[1:]
+        if len(forms) == 1:
+            (column, value), = forms
+            source = f"{table} m"
+            clauses.append(f"m.{column} = ?")
+            params.append(value)
+        else:
+            # UNION also drops the duplicate when one patient matches on both
+            source = ' UNION '.join(f"SELECT patient_id FROM {table} WHERE {column} = ?" for column, _ in forms)
+            source = f"({source}) m"
+            source_params.extend(value for _, value in forms)
+        key = "m.patient_id"
+        if rows or doctor:
+            source += " JOIN patients p ON p.id = m.patient_id"
+        for table, forms in others:
+            sql, values = _term_filter(table, forms)
+            clauses.append(f"EXISTS (SELECT 1 FROM {table} WHERE patient_id = {key} AND {sql})")
+            params.extend(values)
+    else:
+        source, key = "patients p", "p.id"
+    if doctor:
+        clauses.append("p.doctor_name = ? COLLATE NOCASE")
+        params.append(doctor.strip())
+    return source, source_params, key, clauses, params
+
+
+def _scan_cohort(conn, condition, doctor, medication, after_id=0):
+    """
+    Patients matching a cohort filter, in id order, found by parsing every
+    row's free text. Only used while patient_terms.backfill() is still
+    running: until then the term tables miss some patients.
+    """
+    sql, params = f"{_SELECT_PATIENT} WHERE id > ?", [after_id]
+    if doctor:
+        sql += " AND doctor_name = ? COLLATE NOCASE"
+        params.append(doctor.strip())
+    for row in conn.execute(sql + " ORDER BY id", params):
+        patient = Patient._make(row)
+        if condition and not matches(parse_conditions(patient.conditions), condition):
+            continue
+        if medication and not matches(parse_medications(patient.medications), medication):
+            continue
+        yield patient
+
+
+# ---------------------------
+# Patient repository
+# ---------------------------
+class PatientRepository:
+    """
+    All patient SQL in one place, on top of a db_pool.ConnectionPool.
+    Plain Python with no Kivy imports, so it can be used from the app's DB
+    executor, the CLIs, benchmarks and load tests alike. Methods block; the
+    app calls them from background threads, never from the UI thread.
+
+    With a `cache` (record_cache.LRUCache) get/get_many serve full records
+    from memory, and every write method invalidates the ids it touched once
+    its transaction has committed. Writes that bypass this class (bulk
+    import, SQL consoles) must call cache.clear() themselves.
+    """
+
+    def __init__(self, pool, cache=None):
+        self.pool = pool
+        self.cache = cache
+
+    def close(self):
+        self.pool.close()
+
+    # --- reads ---
+    def get(self, patient_id):
+        """The Patient with `patient_id`, or None."""
+        cache = self.cache
+        if cache is not None:
+            patient = cache.get(patient_id)
+            if patient is not None:
+                return patient
+            generation = cache.generation
+        with self.pool.reader() as conn:
+            row = conn.execute(f"{_SELECT_PATIENT} WHERE id = ?", (patient_id,)).fetchone()
+        if not row:
+            return None
+        patient = Patient._make(row)
+        if cache is not None:
+            cache.put(patient_id, patient, generation)
+        return patient
+
+    def get_cached(self, patient_id):
+        """The Patient if it is in the cache, else None; never touches the DB (UI-thread safe)."""
+        return self.cache.peek(patient_id) if self.cache is not None else None
+
+    def get_many(self, patient_ids):
+        """{id: Patient} for the ids that exist, fetched in a few IN (...) queries."""
+        ids = list(dict.fromkeys(patient_ids))
+        found = {}
+        cache = self.cache
+        if cache is not None:
+            generation = cache.generation
+            missing = []
+            for patient_id in ids:
+                patient = cache.get(patient_id)
+                if patient is None:
+                    missing.append(patient_id)
+                else:
+                    found[patient_id] = patient
+            ids = missing
+        if not ids:
+            return found
+        with self.pool.reader() as conn:
+            for chunk in _chunks(ids, _IN_CHUNK):
+                marks = ', '.join('?' for _ in chunk)
+                for row in conn.execute(f"{_SELECT_PATIENT} WHERE id IN ({marks})", chunk):
+                    patient = Patient._make(row)
+                    found[row[0]] = patient
+                    if cache is not None:
+                        cache.put(row[0], patient, generation)
+        return found
+
+    def count(self):
+        with self.pool.reader() as conn:
+            return conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0]
+
+    def page(self, after=None, before=None, limit=PAGE_SIZE):
+        """
+        Keyset-paginated PatientSummary rows in (name, id) order.
+        `after` / `before` are (name, id) cursors taken from the last / first row
+        of the page already shown. Served by idx_patients_name_id, so the cost of
+        a page does not depend on the table size or on how deep the user scrolled.
+        """
+        with self.pool.reader() as conn:
+            if after is not None:
+                name, pid = after
+                if name is None:
+                    # NULL names sort first: finish them, then continue with named rows
+                    rows = conn.execute(
+                        'SELECT id, name FROM patients WHERE name IS NULL AND id > ? ORDER BY id LIMIT ?',
+                        (pid, limit),
+                    ).fetchall()
+                    if len(rows) < limit:
+                        rows += conn.execute(
+                            'SELECT id, name FROM patients WHERE name IS NOT NULL ORDER BY name, id LIMIT ?',
+                            (limit - len(rows),),
+                        ).fetchall()
+                else:
+                    rows = conn.execute(
+                        'SELECT id, name FROM patients WHERE (name, id) > (?, ?) ORDER BY name, id LIMIT ?',
+                        (name, pid, limit),
+                    ).fetchall()
+
+            elif before is not None:
+                name, pid = before
+                rows = []
+                if name is not None:
+                    rows = conn.execute(
+                        'SELECT id, name FROM patients WHERE (name, id) < (?, ?) '
+                        'ORDER BY name DESC, id DESC LIMIT ?',
+                        (name, pid, limit),
+                    ).fetchall()
+                if len(rows) < limit:
+                    # walked back past every named row: continue into the NULL names
+                    max_id = pid if name is None else None
+                    rows += conn.execute(
+                        'SELECT id, name FROM patients WHERE name IS NULL AND (? IS NULL OR id < ?) '
+                        'ORDER BY id DESC LIMIT ?',
+                        (max_id, max_id, limit - len(rows)),
+                    ).fetchall()
+                rows.reverse()
+
+            else:
+                rows = conn.execute(
+                    'SELECT id, name FROM patients ORDER BY name, id LIMIT ?', (limit,)
+                ).fetchall()
+        return [PatientSummary._make(r) for r in rows]
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """
+        Ranked full-text search over name, conditions, medications, doctor and notes.
+        Name matches weigh most (bm25 column weights). Falls back to a name LIKE
+        scan if this SQLite build has no FTS5.
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        with self.pool.reader() as conn:
+            try:
+                rows = conn.execute('''
+                    SELECT p.id, p.name
+                    FROM patients_fts
+                    JOIN patients p ON p.id = patients_fts.rowid
+                    WHERE patients_fts MATCH ?
+                    ORDER BY bm25(patients_fts, 10.0, 2.0, 2.0, 3.0, 1.0)
+                    LIMIT ?
+                ''', (query, limit)).fetchall()
+            except sqlite3.OperationalError as e:
+                log.warning(f"Search: FTS unavailable ({e}), using LIKE")
+                rows = conn.execute(
+                    'SELECT id, name FROM patients WHERE name LIKE ? ORDER BY name LIMIT ?',
+                    (f"%{text.strip()}%", limit),
+                ).fetchall()
+        return [PatientSummary._make(r) for r in rows]
+
+    def cohort(self, condition=None, doctor=None, after_id=0, limit=PAGE_SIZE, medication=None):
+        """
+        Full Patient rows matching a cohort filter, in id order, `limit` at a
+        time: pass the last id seen as `after_id` to get the next page.
+        `condition` and `medication` match a whole entry of the patient's
+        list, case-insensitively, or its code ("diabetes", "E11"; see
+        patient_terms); `doctor` is a case-insensitive match on the doctor's
+        name. None means any.
+        """
+        with self.pool.reader() as conn:
+            if (condition or medication) and backfill_pending(conn):
+                return list(islice(_scan_cohort(conn, condition, doctor, medication, after_id), limit))
+            found = _cohort_source(conn, condition, doctor, medication)
+            if found is None:
+                return []
+            source, source_params, key, clauses, params = found
+            where = ''.join(f" AND {c}" for c in clauses)
+            rows = conn.execute(
+                f"SELECT {_PATIENT_COLUMNS_P} FROM {source} WHERE {key} > ?{where} ORDER BY {key} LIMIT ?",
+                (*source_params, after_id, *params, limit),
+            ).fetchall()
+        return [Patient._make(r) for r in rows]
+
+    def count_cohort(self, condition=None, doctor=None, medication=None):
+        with self.pool.reader() as conn:
+            if (condition or medication) and backfill_pending(conn):
+                return sum(1 for _ in _scan_cohort(conn, condition, doctor, medication))
+            found = _cohort_source(conn, condition, doctor, medication, rows=False)
+            if found is None:
+                return 0
+            source, source_params, _, clauses, params = found
+            where = ' AND '.join(clauses) or '1'
+            return conn.execute(
+                f"SELECT COUNT(*) FROM {source} WHERE {where}", (*source_params, *params)
+            ).fetchone()[0]
+
+    # --- writes ---
+    def _invalidate(self, patient_ids):
+        # call only after the write has committed, or a reader could cache the old row again
+        if self.cache is not None:
+            self.cache.invalidate_many(patient_ids)
+
+    def add(self, record):
+        """Insert one patient (see _row_values for accepted shapes); returns the new id."""
+        values = _row_values(record)
+        with self.pool.writer() as conn:
+            patient_id = conn.execute(INSERT_PATIENT_SQL, values).lastrowid
+            index_terms(conn, [(patient_id, values[_CONDITIONS], values[_MEDICATIONS])])
+        # ids are never reused (AUTOINCREMENT), but keep the rule: every write invalidates
+        self._invalidate([patient_id])
+        return patient_id
+
+    def add_many(self, records, batch_size=5000):
+        """
+        Insert many patients with executemany, one transaction per batch.
+        `records` may be any iterable; at most one batch is held in memory.
+        Returns the number of rows inserted.
+        """
+        inserted = 0
+        batch = []
+        for record in records:
+            batch.append(_row_values(record))
+            if len(batch) >= batch_size:
+                inserted += self._insert_batch(batch)
+                batch = []
+        if batch:
+            inserted += self._insert_batch(batch)
+        return inserted
+
+    def _insert_batch(self, rows):
+        with self.pool.writer() as conn:
+            last_id = max_patient_id(conn)
+            conn.executemany(INSERT_PATIENT_SQL, rows)
+            index_patients(conn, after_id=last_id)
+        return len(rows)
+
+    def update(self, patient_id, fields):
+        """
+        Change some columns of one patient. `fields` is keyed by column name
+        or form label; unknown keys are ignored. Returns True if a row changed.
+        """
+        labels = dict(PATIENT_FIELDS)
+        changes = {}
+        for key, value in fields.items():
+            column = labels.get(key, key)
+            if column in PATIENT_COLUMNS:
+                changes[column] = value
+        if not changes:
+            return False
+        assignments = ', '.join(f"{column} = ?" for column in changes)
+        try:
+            with self.pool.writer() as conn:
+                changed = conn.execute(
+                    f"UPDATE patients SET {assignments} WHERE id = ?",
+                    (*changes.values(), patient_id),
+                ).rowcount > 0
+                if changed and ('conditions' in changes or 'medications' in changes):
+                    index_terms(conn, conn.execute(
+                        'SELECT id, conditions, medications FROM patients WHERE id = ?', (patient_id,)
+                    ).fetchall())
+                return changed
+        finally:
+            self._invalidate([patient_id])
+
+    def delete(self, patient_id):
+        """Delete one patient; returns True if a row was removed."""
+        try:
+            with self.pool.writer() as conn:
+                return conn.execute('DELETE FROM patients WHERE id = ?', (patient_id,)).rowcount > 0
+        finally:
+            self._invalidate([patient_id])
+
+    def delete_many(self, patient_ids):
+        """Delete patients by id in a single transaction; returns the number removed."""
+        ids = list(dict.fromkeys(patient_ids))
+        removed = 0
+        try:
+            with self.pool.writer() as conn:
+                for chunk in _chunks(ids, _IN_CHUNK):
+                    marks = ', '.join('?' for _ in chunk)
+                    removed += conn.execute(f"DELETE FROM patients WHERE id IN ({marks})", chunk).rowcount
+        finally:
+            self._invalidate(ids)
+        return removed
+
+
+def open_repository(db_path, readers=3):
+    """
+    Open (or create) the DB at `db_path`, bring its schema up to date,
+    finish any term backfill and return a PatientRepository over a new
+    pool. Close it with .close(). For headless use: CLIs, benchmarks and
+    load tests.
+    """
+    from db_pool import ConnectionPool
+    from migrations import migrate
+
+    pool = ConnectionPool(db_path, readers=readers)
+    try:
+        with pool.writer() as conn:
+            migrate(conn)
+        backfill(pool)
+    except Exception:
+        pool.close()
+        raise
+    return PatientRepository(pool)
@@ -0,0 +1,217 @@
+import re
+
+# ---------------------------
+# Conditions and medications as terms
+# ---------------------------
+# patients.conditions / patients.medications stay the free text the staff
+# typed (and what the details screen shows). Each entry of that text is
+# also stored as a normalized term in patient_conditions /
+# patient_medications, keyed by (term, patient_id), so "everyone with
+# diabetes" is an index seek instead of a LIKE scan over every patient.
+#
+# Entries are separated by commas, semicolons or new lines. A code in
+# brackets at the end of an entry is kept separately and indexed too:
+#
+#     "Type 2 diabetes (E11), Hypertension"  -> ("type 2 diabetes", "E11"), ("hypertension", None)
+#     "Metformin 500mg twice daily (A10BA02)" -> ("metformin", "500mg twice daily", "A10BA02")
+#
+# Writes that bypass PatientRepository and patient_import must call
+# index_patients() for the rows they touched; deletes are covered by a trigger.
+#
+# Patients that existed before the term tables did are indexed by
+# backfill(), after the migration, one short write transaction per batch.
+# Until it finishes, cohort lookups scan the free text instead.
+
+TERM_TABLES = ('patient_conditions', 'patient_medications')
+
+_SEPARATORS = re.compile(r'[,;\n]+')
+_CODE = re.compile(r'[\(\[]\s*([A-Za-z0-9][A-Za-z0-9.\-]*)\s*[\)\]]$')
+
+# patients read per batch when (re)indexing existing rows
+INDEX_BATCH = 1000
+
+
+def normalize_term(text):
+    """Lowercase, single-spaced, without trailing punctuation: the form terms are stored and matched in."""
+    return ' '.join((text or '').lower().split()).strip(' .:-')
+
+
+def normalize_code(text):
+    return (text or '').strip().upper()
+
+
+def _entries(text):
+    # (entry without its code, code or None) for every non-empty entry
+    for entry in _SEPARATORS.split(text or ''):
+        entry = entry.strip()
+        match = _CODE.search(entry)
+        code = None
+        if match:
+            code = normalize_code(match.group(1))
+            entry = entry[:match.start()]
+        if normalize_term(entry) or code:
+            yield entry, code
+
+
+def _dedupe(items):
+    # one row per term and per code for a patient: both are unique per patient in the indexes.
+    # A repeated term is merged into its first entry, filling in what that one left out
+    # ("Diabetes, diabetes (E11)" -> ("diabetes", "E11")).
+    merged, seen_codes = {}, set()
+    for item in items:
+        term, code = item[0], item[-1]
+        if code in seen_codes:
+            item = item[:-1] + (None,)
+        first = merged.get(term)
+        if first is not None:
+            item = tuple(old if old is not None else new for old, new in zip(first, item))
+        merged[term] = item
+        if item[-1] is not None:
+            seen_codes.add(item[-1])
+    return list(merged.values())
+
+
+def parse_conditions(text):
+    """[(term, code)] for a conditions text; a code-only entry uses the code as its term."""
+    items = []
+    for entry, code in _entries(text):
+        items.append((normalize_term(entry) or code.lower(), code))
+    return _dedupe(items)
+
+
+def parse_medications(text):
+    """
+    [(term, dose, code)] for a medications text. The term is the drug name,
+    the dose everything from the first word starting with a digit on
+    ("Vitamin B12 1000mcg daily" -> "vitamin b12", "1000mcg daily").
+    """
+    items = []
+    for entry, code in _entries(text):
+        words = normalize_term(entry).split(' ')
+        split = next((i for i, word in enumerate(words) if word[:1].isdigit()), len(words))
+        if split == 0:
+            # starts with a number: nothing to call a name, keep the entry whole
+            split = len(words)
+        term = ' '.join(words[:split]) or code.lower()
+        items.append((term, ' '.join(words[split:]) or None, code))
+    return _dedupe(items)
+
+
+# ---------------------------
+# Index maintenance (inside the caller's write transaction)
+# ---------------------------
+def index_terms(conn, rows):
+    """
+    Replace the terms of the patients in `rows`, (id, conditions,
+    medications) tuples. Runs in the caller's transaction; never commits.
+    """
+    ids, conditions, medications = [], [], []
+    for patient_id, condition_text, medication_text in rows:
+        ids.append((patient_id,))
+        conditions.extend((patient_id, term, code) for term, code in parse_conditions(condition_text))
+        medications.extend((patient_id, term, dose, code) for term, dose, code in parse_medications(medication_text))
+    if not ids:
+        return 0
+    conn.executemany('DELETE FROM patient_conditions WHERE patient_id = ?', ids)
+    conn.executemany('DELETE FROM patient_medications WHERE patient_id = ?', ids)
+    conn.executemany('INSERT INTO patient_conditions (patient_id, term, code) VALUES (?, ?, ?)', conditions)
+    conn.executemany(
+        'INSERT INTO patient_medications (patient_id, term, dose, code) VALUES (?, ?, ?, ?)', medications,
+    )
+    return len(ids)
+
+
+def index_patients(conn, after_id=0, batch_size=INDEX_BATCH):
+    """
+    (Re)index every patient with an id above `after_id`, reading `batch_size`
+    rows at a time in id order so memory stays flat however big the table
+    is. Used after bulk inserts (executemany gives no ids: pass the max id
+    from before), inside the insert's own transaction.
+    Returns the number of patients indexed.
+    """
+    indexed = 0
+    while True:
+        rows = conn.execute(
+            'SELECT id, conditions, medications FROM patients WHERE id > ? ORDER BY id LIMIT ?',
+            (after_id, batch_size),
+        ).fetchall()
+        if not rows:
+            break
+        indexed += index_terms(conn, rows)
+        after_id = rows[-1][0]
+    return indexed
+
+
+def max_patient_id(conn):
+    return conn.execute('SELECT COALESCE(MAX(id), 0) FROM patients').fetchone()[0]
+
+
+# ---------------------------
+# Backfill of pre-existing patients (one write transaction per batch)
+# ---------------------------
+# The migration that creates the term tables records which patients it did
+# not index (ids up to until_id) in patient_terms_backfill; done_id is the
+# high-water mark. Newer patients are indexed by the normal write paths, and
+# an update to an older one is simply indexed again when the backfill gets there.
+
+def backfill_pending(conn):
+    """True while some pre-existing patients have no terms yet."""
+    return conn.execute('SELECT 1 FROM patient_terms_backfill').fetchone() is not None
+
+
+def backfill(pool, batch_size=INDEX_BATCH, stop=None):
+    """
+    Index the patients the migration left to do, `batch_size` at a time,
+    each batch in its own pool.writer() transaction so other writers wait
+    for one batch at most. Resumes from the high-water mark after a restart;
+    returns between batches once `stop` (a threading.Event) is set.
+    Returns the number of patients indexed.
+    """
+    indexed = 0
+    while stop is None or not stop.is_set():
+        with pool.writer() as conn:
+            state = conn.execute('SELECT done_id, until_id FROM patient_terms_backfill').fetchone()
+            if state is None:
+                break
+            done_id, until_id = state
+            rows = conn.execute(
+                'SELECT id, conditions, medications FROM patients WHERE id > ? AND id <= ? ORDER BY id LIMIT ?',
+                (done_id, until_id, batch_size),
+            ).fetchall()
+            if not rows:
+                conn.execute('DELETE FROM patient_terms_backfill')
+                break
+            indexed += index_terms(conn, rows)
+            conn.execute('UPDATE patient_terms_backfill SET done_id = ?', (rows[-1][0],))
+    return indexed
+
+
+# ---------------------------
+# Lookups
+# ---------------------------
+def resolve(conn, table, value):
+    """
+    How `value` is matched in `table` (one of TERM_TABLES): a list of
+    ('term', term) and/or ('code', code), one per form some patient has,
+    empty if nobody has either. A patient matches on either form, so
+    "E11" finds both an "(E11)" entry and "Diabetes (E11)".
+    """
+    found = []
+    term = normalize_term(value)
+    if term and conn.execute(f'SELECT 1 FROM {table} WHERE term = ? LIMIT 1', (term,)).fetchone():
+        found.append(('term', term))
+    code = normalize_code(value)
+    if code and conn.execute(f'SELECT 1 FROM {table} WHERE code = ? LIMIT 1', (code,)).fetchone():
+        found.append(('code', code))
+    return found
+
+
+def matches(items, value):
+    """
+    True if parsed `items` (parse_conditions / parse_medications output)
+    contain `value` as a term or a code: the free-text form of resolve(),
+    for patients the backfill has not reached yet.
+    """
+    term, code = normalize_term(value), normalize_code(value)
+    return any(item[0] == term or (code and item[-1] == code) for item in items)
+
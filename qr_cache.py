@@ -0,0 +1,91 @@
+import hashlib
+import os
+import threading
+
+
+# ---------------------------
+# Content-addressed QR image cache
+# ---------------------------
+class QRCache:
+    """
+    Stores QR PNGs under the SHA-256 of their payload, so the same payload is
+    only ever encoded once (also across app restarts) and two patients with the
+    same name can no longer overwrite each other's image.
+    The directory is kept under `max_files` / `max_bytes` by evicting the
+    least recently used files; a cache hit refreshes the file's mtime.
+    """
+
+    def __init__(self, directory, max_files=500, max_bytes=20 * 1024 * 1024):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(payload):
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path_for(self, payload):
+        return os.path.join(self.directory, self.key(payload) + '.png')
+
+    def get(self, payload):
+        path = self.path_for(payload)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def get_or_create(self, payload):
+        path = self.get(payload)
+        if path is not None:
+            return path
+
+        import qrcode  # only needed on a cache miss
+
+        path = self.path_for(payload)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        qrcode.make(payload).save(tmp_path, format='PNG')
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.misses += 1
+            self._evict(keep=path)
+        return path
+
+    def _evict(self, keep=None):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.png'):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+
+        entries.sort()
+        count = len(entries)
+        for mtime, size, path in entries:
+            if count <= self.max_files and total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            count -= 1
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,28 @@
+# ---------------------------
+# In-memory QR rendering
+# ---------------------------
+_DARK = b'\x00\x00\x00\xff'
+_LIGHT = b'\xff\xff\xff\xff'
+
+
+def qr_matrix(payload, border=4):
+    """Module matrix for `payload` (rows of booleans, True = dark), quiet zone included."""
+    import qrcode  # deferred: only needed when a QR is actually shown
+
+    qr = qrcode.QRCode(border=border)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def qr_rgba_buffer(payload, border=4):
+    """
+    Render `payload` as an RGBA pixel buffer with one pixel per QR module.
+    Returns (size, buffer) where the buffer rows run bottom-to-top, matching
+    the orientation Kivy textures expect. Upscaling is left to the GPU
+    (nearest filtering), which keeps the buffer a few KB.
+    """
+    matrix = qr_matrix(payload, border=border)
+    size = len(matrix)
+    rows = [b''.join(_DARK if cell else _LIGHT for cell in row) for row in reversed(matrix)]
+    return size, b''.join(rows)
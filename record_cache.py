@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+
+
+# ---------------------------
+# Bounded in-memory LRU cache
+# ---------------------------
+class LRUCache:
+    """
+    Thread-safe LRU map with a fixed number of entries, used for patient
+    records keyed by id. Writers call invalidate() for every key they
+    change; lookups that raced with an invalidation are not stored (see
+    generation/put), so a stale row can never be cached after a write.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max(1, max_entries)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """The cached value for `key` (marking it most recently used), or None."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        """
+        The cached value for `key` or None, leaving recency and the hit/miss
+        counts alone: for fast paths that fall back to a normal lookup
+        (which then counts the lookup once).
+        """
+        with self._lock:
+            return self._data.get(key)
+
+    @property
+    def generation(self):
+        """Take this before reading from the DB and hand it to put()."""
+        return self._generation
+
+    def put(self, key, value, generation=None):
+        """
+        Store `value`. With `generation` (read before the DB lookup) the value
+        is dropped if any invalidation happened since, as it may be stale.
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._data.pop(key, None)
+
+    def invalidate_many(self, keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self.invalidations += 1
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,205 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# a session unused for this long needs a new login
+SESSION_TTL = 12 * 3600
+# writes are batched: the file is rewritten at most this often
+FLUSH_DELAY = 0.5
+
+
+# ---------------------------
+# Session store
+# ---------------------------
+class SessionStore:
+    """
+    user_store.json kept in memory. The file is read once when the store is
+    created; every read after that is served from memory, and writes are
+    persisted behind the caller by a background thread, coalesced and
+    replaced atomically (temp file + rename), so a crash mid-write never
+    leaves a truncated store.
+
+    The file stays compatible with the kivy JsonStore layout it replaces
+    (top-level keys holding dicts): 'settings', 'user' (the current user)
+    and 'sessions' (every user with a live session, by username), which is
+    what lets several staff share a device and switch between them. A
+    session is not a credential: switching back still takes the password
+    (see LoginScreen.switch_to); the store never makes a user current
+    without login().
+    """
+
+    def __init__(self, path, ttl=SESSION_TTL, flush_delay=FLUSH_DELAY):
+        self.path = path
+        self.ttl = ttl
+        self.flush_delay = flush_delay
+        self._lock = threading.RLock()
+        self._data = self._load()
+        self._pending = False
+        self._wake = threading.Event()
+        self._closed = False
+        self._writer = None
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("not a JSON object")
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            log.warning(f"Session: ignoring unreadable {self.path}: {e}")
+            return {}
+        user = data.get('user')
+        if user and 'sessions' not in data:
+            # store written before sessions were tracked: its user is logged in as of now
+            now = time.time()
+            data['sessions'] = {user['username']: {'role': user.get('role'), 'login_at': now, 'last_seen': now}}
+        return data
+
+    # --- JsonStore-style access ---
+    def exists(self, key):
+        with self._lock:
+            return key in self._data
+
+    def get(self, key, default=None):
+        """A copy of the dict stored under `key`, or `default`."""
+        with self._lock:
+            value = self._data.get(key)
+            return copy.deepcopy(value) if value is not None else default
+
+    def put(self, key, **values):
+        with self._lock:
+            self._data[key] = values
+            self._changed()
+
+    def delete(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._changed()
+
+    # --- sessions ---
+    def login(self, username, role):
+        """Start (or renew) `username`'s session and make it the current user."""
+        now = time.time()
+        with self._lock:
+            sessions = self._data.setdefault('sessions', {})
+            sessions[username] = {'role': role, 'login_at': now, 'last_seen': now}
+            self._data['user'] = {'username': username, 'role': role}
+            self._changed()
+
+    def current_user(self):
+        """(username, role) of the current user, or None if nobody is logged in or the session expired."""
+        with self._lock:
+            user = self._data.get('user')
+            if not user:
+                return None
+            username = user['username']
+            session = self._session(username)
+            if session is None:
+                log.info(f"Session: session of {username} expired")
+                self._data.pop('user', None)
+                self._changed()
+                return None
+            return username, session['role']
+
+    def touch(self):
+        """Mark the current session as used now (on resume); keeps it from expiring."""
+        with self._lock:
+            user = self._data.get('user')
+            session = self._session(user['username']) if user else None
+            if session is not None:
+                session['last_seen'] = time.time()
+                self._changed()
+
+    def suspend(self):
+        """Leave the current user's session live but nobody current (switch user)."""
+        self.delete('user')
+
+    def logout(self, username=None):
+        """End the session of `username` (default: the current user)."""
+        with self._lock:
+            user = self._data.get('user')
+            username = username or (user['username'] if user else None)
+            if username is None:
+                return
+            self._data.get('sessions', {}).pop(username, None)
+            if user and user['username'] == username:
+                self._data.pop('user', None)
+            self._changed()
+
+    def users(self):
+        """Usernames with a live session, most recently used first."""
+        with self._lock:
+            live = [(name, s) for name, s in list(self._data.get('sessions', {}).items()) if self._session(name)]
+        return [name for name, _ in sorted(live, key=lambda item: item[1]['last_seen'], reverse=True)]
+
+    def _session(self, username):
+        # call with the lock held; drops the session if it has expired
+        sessions = self._data.get('sessions', {})
+        session = sessions.get(username)
+        if session is None:
+            return None
+        if self.ttl and time.time() - session.get('last_seen', 0) > self.ttl:
+            del sessions[username]
+            self._changed()
+            return None
+        return session
+
+    # --- write-behind ---
+    def _changed(self):
+        # call with the lock held
+        self._pending = True
+        self._wake.set()
+        if self._writer is None and not self._closed:
+            self._writer = threading.Thread(target=self._write_loop, name='session-writer', daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed:
+                break
+            # let a burst of changes land before writing once
+            time.sleep(self.flush_delay)
+            self._write()
+
+    def _write(self):
+        with self._lock:
+            if not self._pending:
+                return
+            self._pending = False
+            snapshot = json.dumps(self._data)
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning(f"Session: could not save {self.path}: {e}")
+            # retried with the next change, or on close()
+            with self._lock:
+                self._pending = True
+
+    def flush(self):
+        """Write pending changes now (blocks)."""
+        self._write()
+
+    def close(self):
+        """Flush and stop the writer thread (App.on_stop)."""
+        self._closed = True
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join(2.0)
+            self._writer = None
+        self._write()
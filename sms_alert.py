@@ -1,12 +1,27 @@
-import os
+import re
+import subprocess
 import urllib.parse
 
+# country code and number, digits only (e.g. 911234567890); a leading + is allowed
+PHONE_NUMBER = re.compile(r'^\+?\d{6,15}$')
+
+
+def valid_number(number):
+    """True if `number` can go into the intent URL as it is."""
+    return bool(PHONE_NUMBER.match(number or ''))
+
+
 def send_sms(to, message):
     # Format phone number with country code and no symbols (e.g., 911234567890)
-    phone_number = to
+    if not valid_number(to):
+        raise ValueError(f"not a phone number: {to!r}")
+    phone_number = to.lstrip('+')
     encoded_msg = urllib.parse.quote(message)
-    # Create the WhatsApp intent using `am start`
-    os.system(f'am start -a android.intent.action.VIEW -d "https://wa.me/{phone_number}?text={encoded_msg}"')
+    url = f"https://wa.me/{phone_number}?text={encoded_msg}"
+    # Create the WhatsApp intent using `am start`, with no shell in between;
+    # non-zero means it could not be started
+    return subprocess.run(['am', 'start', '-a', 'android.intent.action.VIEW', '-d', url]).returncode
 
-# Example usage
-send_sms("911234567890", "Hello from Termux and Python!")
\ No newline at end of file
+# Example usage (only when run directly, never on import)
+if __name__ == '__main__':
+    send_sms("911234567890", "Hello from Termux and Python!")
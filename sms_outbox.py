@@ -0,0 +1,361 @@
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+OutboxMessage = namedtuple('OutboxMessage', [
+    'id', 'recipient', 'body', 'status', 'priority', 'attempts', 'next_attempt_at',
+    'created_at', 'sent_at', 'last_error', 'patient_id', 'tag',
+])
+_SELECT_MESSAGE = f"SELECT {', '.join(OutboxMessage._fields)} FROM sms_outbox"
+
+
+# ---------------------------
+# Transports
+# ---------------------------
+class TransportError(Exception):
+    """A send that failed; `permanent` ones (a bad recipient) are not retried."""
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class IntentTransport:
+    """Hands the message to WhatsApp through an Android intent (sms_alert.send_sms)."""
+
+    def send(self, recipient, body):
+        from sms_alert import send_sms, valid_number
+
+        # recipients come from imports, broadcasts and escalation.json: never trust them into a URL
+        if not valid_number(recipient):
+            raise TransportError(f"not a phone number: {recipient!r}", permanent=True)
+        try:
+            status = send_sms(recipient, body)
+        except OSError as e:
+            raise TransportError(f"intent could not be started ({e})")
+        if status:
+            raise TransportError(f"intent could not be started (exit status {status})")
+
+
+class LocalTransport:
+    """
+    Stand-in that delivers nothing: logs each message and keeps it in
+    `delivered`. `fail_first` makes the first N sends fail and `delay` adds
+    latency, so retries, backoff and timeouts can be exercised off-device.
+    """
+
+    def __init__(self, delay=0.0, fail_first=0):
+        self.delay = delay
+        self.fail_first = fail_first
+        self.delivered = []
+        self._attempts = 0
+        self._lock = threading.Lock()
+
+    def send(self, recipient, body):
+        with self._lock:
+            self._attempts += 1
+            fail = self._attempts <= self.fail_first
+        if self.delay:
+            time.sleep(self.delay)
+        if fail:
+            raise TransportError("simulated delivery failure")
+        with self._lock:
+            self.delivered.append((recipient, body))
+        log.info(f"SMS: (local) to {recipient}: {body}")
+
+
+# ---------------------------
+# Rate limiting
+# ---------------------------
+class TokenBucket:
+    """Allows `rate` sends per `per` seconds on average, in bursts of up to `burst`."""
+
+    def __init__(self, rate, per=60.0, burst=1):
+        self.fill_rate = rate / float(per)
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event=None):
+        """Block until a token is available; returns False if `stop_event` was set meanwhile."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.fill_rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.fill_rate
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+# ---------------------------
+# Persistent outbox
+# ---------------------------
+class Outbox:
+    """
+    Messages are written to the sms_outbox table first and delivered by
+    background worker threads, so callers (UI handlers included) never wait
+    on the transport and nothing is lost when a send fails or the app dies:
+    failed sends are retried with exponential backoff up to `max_attempts`,
+    and messages caught mid-send by a crash are re-queued on start().
+    Sends go through a shared token bucket (`rate_per_minute`, `burst`).
+    Higher `priority` messages are sent first.
+
+    Listeners registered with add_listener(fn) are called as fn(message)
+    from a worker thread after every status change of any message; a
+    per-message `on_status` can be passed to enqueue().
+    """
+
+    def __init__(self, pool, transport, workers=1, rate_per_minute=30, burst=5,
+                 max_attempts=5, base_delay=5.0, max_delay=600.0, poll_interval=30.0):
+        self.pool = pool
+        self.transport = transport
+        self.workers = max(1, workers)
+        self.limiter = TokenBucket(rate_per_minute, per=60.0, burst=burst)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._listeners = []
+        self._watchers = {}
+        self._watchers_lock = threading.Lock()
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Condition()
+        # set by _notify(), so a wake-up that lands between a worker's empty
+        # claim and its wait is not lost
+        self._pending = False
+
+    # --- producers ---
+    def enqueue(self, recipient, body, priority=0, patient_id=None, tag=None, on_status=None):
+        """Persist one message for delivery and return its id (see enqueue_many)."""
+        return self.enqueue_many([(recipient, body)], priority=priority, patient_id=patient_id,
+                                 tag=tag, on_status=on_status)[0]
+
+    def enqueue_many(self, messages, priority=0, patient_id=None, tag=None, on_status=None):
+        """
+        Persist (recipient, body) pairs in one transaction; returns their ids.
+        A pair may carry a third item, the patient id, overriding `patient_id`.
+        `on_status(message)` is called from a worker thread on every status
+        change of these messages until each is sent or has failed for good.
+        """
+        now = time.time()
+        ids = []
+        with self.pool.writer() as conn:
+            for message in messages:
+                recipient, body = message[0], message[1]
+                pid = message[2] if len(message) > 2 else patient_id
+                ids.append(conn.execute(
+                    'INSERT INTO sms_outbox (recipient, body, status, priority, next_attempt_at, '
+                    'created_at, patient_id, tag) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (recipient, body, QUEUED, priority, now, now, pid, tag),
+                ).lastrowid)
+            if on_status is not None:
+                # registered before commit: workers cannot claim these rows before then
+                with self._watchers_lock:
+                    for message_id in ids:
+                        self._watchers[message_id] = on_status
+        self._notify()
+        return ids
+
+    # --- status ---
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def get(self, message_id):
+        with self.pool.reader() as conn:
+            row = conn.execute(f"{_SELECT_MESSAGE} WHERE id = ?", (message_id,)).fetchone()
+        return OutboxMessage._make(row) if row else None
+
+    def recent(self, limit=50, tag=None):
+        with self.pool.reader() as conn:
+            if tag is None:
+                rows = conn.execute(f"{_SELECT_MESSAGE} ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = conn.execute(
+                    f"{_SELECT_MESSAGE} WHERE tag = ? ORDER BY id DESC LIMIT ?", (tag, limit)
+                ).fetchall()
+        return [OutboxMessage._make(r) for r in rows]
+
+    def counts(self, tag=None):
+        """{status: number of messages}, optionally for one tag."""
+        with self.pool.reader() as conn:
+            if tag is None:
+                rows = conn.execute('SELECT status, COUNT(*) FROM sms_outbox GROUP BY status').fetchall()
+            else:
+                rows = conn.execute(
+                    'SELECT status, COUNT(*) FROM sms_outbox WHERE tag = ? GROUP BY status', (tag,)
+                ).fetchall()
+        return dict(rows)
+
+    def retry(self, message_id):
+        """Put a failed message back in the queue with a fresh attempt budget."""
+        with self.pool.writer() as conn:
+            changed = conn.execute(
+                'UPDATE sms_outbox SET status = ?, attempts = 0, next_attempt_at = ? '
+                'WHERE id = ? AND status = ?',
+                (QUEUED, time.time(), message_id, FAILED),
+            ).rowcount
+        if changed:
+            self._notify()
+            self._emit(message_id)
+        return bool(changed)
+
+    def cancel(self, tag, reason="cancelled"):
+        """Fail every still-queued message with `tag`; returns how many were cancelled."""
+        with self.pool.writer() as conn:
+            ids = [r[0] for r in conn.execute(
+                'SELECT id FROM sms_outbox WHERE tag = ? AND status = ?', (tag, QUEUED)
+            )]
+            conn.executemany(
+                'UPDATE sms_outbox SET status = ?, last_error = ? WHERE id = ?',
+                [(FAILED, reason, message_id) for message_id in ids],
+            )
+        for message_id in ids:
+            self._emit(message_id)
+        return len(ids)
+
+    # --- dispatcher ---
+    def start(self):
+        if self._threads:
+            return
+        # a crash mid-send leaves rows in 'sending': they never reached a verdict
+        with self.pool.writer() as conn:
+            conn.execute('UPDATE sms_outbox SET status = ? WHERE status = ?', (QUEUED, SENDING))
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f'sms-outbox-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        self._notify()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _notify(self):
+        with self._wake:
+            self._pending = True
+            self._wake.notify_all()
+
+    def _emit(self, message_id):
+        with self._watchers_lock:
+            watcher = self._watchers.get(message_id)
+        if watcher is None and not self._listeners:
+            return
+        message = self.get(message_id)
+        if message is None:
+            return
+        if watcher is not None and message.status in (SENT, FAILED):
+            with self._watchers_lock:
+                self._watchers.pop(message_id, None)
+        for fn in ([watcher] if watcher is not None else []) + list(self._listeners):
+            try:
+                fn(message)
+            except Exception:
+                log.exception("Outbox: status callback failed")
+
+    def _claim_next(self):
+        """Atomically move the most urgent due message to 'sending'; returns it, or the next due time."""
+        now = time.time()
+        with self.pool.writer() as conn:
+            row = conn.execute(
+                f"{_SELECT_MESSAGE} WHERE status = ? AND next_attempt_at <= ? "
+                "ORDER BY priority DESC, next_attempt_at, id LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is None:
+                upcoming = conn.execute(
+                    'SELECT MIN(next_attempt_at) FROM sms_outbox WHERE status = ?', (QUEUED,)
+                ).fetchone()[0]
+                return None, upcoming
+            conn.execute(
+                'UPDATE sms_outbox SET status = ?, attempts = attempts + 1 WHERE id = ?',
+                (SENDING, row[0]),
+            )
+        return OutboxMessage._make(row), None
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        # jitter spreads retries of a burst of failures apart
+        return delay * random.uniform(0.8, 1.2)
+
+    def _run(self):
+        while not self._stop.is_set():
+            # cleared before claiming: anything committed after this point sets it again
+            with self._wake:
+                self._pending = False
+            try:
+                message, upcoming = self._claim_next()
+            except Exception:
+                log.exception("Outbox: could not read the queue")
+                self._stop.wait(self.poll_interval)
+                continue
+
+            if message is None:
+                wait = self.poll_interval
+                if upcoming is not None:
+                    wait = max(0.05, min(wait, upcoming - time.time()))
+                with self._wake:
+                    if not self._pending:
+                        self._wake.wait(wait)
+                continue
+
+            if not self.limiter.acquire(self._stop):
+                # stopping: hand the message back untouched
+                self._finish(message.id, QUEUED, message.attempts, None, time.time())
+                break
+            self._emit(message.id)
+            try:
+                self.transport.send(message.recipient, message.body)
+            except Exception as e:
+                attempts = message.attempts + 1
+                if attempts >= self.max_attempts or getattr(e, 'permanent', False):
+                    log.warning(f"Outbox: message {message.id} to {message.recipient} failed for good: {e}")
+                    self._finish(message.id, FAILED, attempts, str(e), None)
+                else:
+                    self._finish(message.id, QUEUED, attempts, str(e), time.time() + self._backoff(attempts))
+            else:
+                self._finish(message.id, SENT, message.attempts + 1, None, None)
+
+    def _finish(self, message_id, status, attempts, error, next_attempt_at):
+        with self.pool.writer() as conn:
+            if status == SENT:
+                conn.execute(
+                    'UPDATE sms_outbox SET status = ?, sent_at = ?, last_error = NULL WHERE id = ?',
+                    (SENT, time.time(), message_id),
+                )
+            elif status == QUEUED:
+                conn.execute(
+                    'UPDATE sms_outbox SET status = ?, attempts = ?, last_error = COALESCE(?, last_error), '
+                    'next_attempt_at = ? WHERE id = ?',
+                    (QUEUED, attempts, error, next_attempt_at, message_id),
+                )
+            else:
+                conn.execute(
+                    'UPDATE sms_outbox SET status = ?, last_error = ? WHERE id = ?',
+                    (status, error, message_id),
+                )
+        self._emit(message_id)
@@ -0,0 +1,376 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+ROLES = ('nurse', 'doctor', 'admin')
+# the K (nurse) and k (doctor) logins the app used to hard-code, as stored hashes.
+# Only installs that were already in use get them (seed_legacy_accounts), and
+# they are deactivated as soon as any real account exists (retire_defaults).
+LEGACY_ACCOUNTS = [
+    ('K', 'pbkdf2_sha256$200000$oQ0J6RiXh/BwL6ER6gVbUA==$GcXRVQd+PaVERn21qJD9+WVbmv02fUYtIVNj1VJG+RY=', 'nurse'),
+    ('k', 'pbkdf2_sha256$200000$gsuOUWOvFmyjkKmBgnmGww==$HazO8K8K+gc9MkrJX4NVNlVMgpxbEufYSrRSrDq+sEY=', 'doctor'),
+]
+MIN_PASSWORD_LENGTH = 8
+
+PBKDF2_ITERATIONS = 200000
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+SALT_BYTES = 16
+# how long a successful login can be repeated without running the KDF again
+VERIFIED_TTL = 300.0
+
+StaffUser = namedtuple('StaffUser', ['id', 'username', 'role', 'active', 'is_default', 'created_at', 'updated_at'])
+_SELECT_USER = f"SELECT {', '.join(StaffUser._fields)} FROM staff_users"
+
+
+# ---------------------------
+# Password hashing
+# ---------------------------
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def hash_password(password, method='pbkdf2_sha256'):
+    """
+    Salted hash string for `password`, with the method and its cost stored
+    alongside so they can be raised later (see needs_rehash):
+    pbkdf2_sha256$<iterations>$<salt>$<hash> or scrypt$<n>$<r>$<p>$<salt>$<hash>.
+    Deliberately slow (~0.1 s): call it off the UI thread.
+    """
+    salt = secrets.token_bytes(SALT_BYTES)
+    if method == 'scrypt':
+        digest = hashlib.scrypt(password.encode('utf-8'), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    if method != 'pbkdf2_sha256':
+        raise ValueError(f"unknown password hash method: {method}")
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+
+
+def verify_password(password, encoded):
+    """True if `password` matches the hash string; compares in constant time."""
+    try:
+        method, *params = encoded.split('$')
+        if method == 'pbkdf2_sha256':
+            iterations, salt, expected = int(params[0]), base64.b64decode(params[1]), base64.b64decode(params[2])
+            digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+        elif method == 'scrypt':
+            n, r, p = (int(v) for v in params[:3])
+            salt, expected = base64.b64decode(params[3]), base64.b64decode(params[4])
+            digest = hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p)
+        else:
+            return False
+    except (ValueError, IndexError):
+        log.warning("Staff: unreadable password hash")
+        return False
+    return hmac.compare_digest(digest, expected)
+
+
+def needs_rehash(encoded):
+    """True for PBKDF2 hashes made with fewer iterations than the current setting."""
+    method, _, rest = encoded.partition('$')
+    if method != 'pbkdf2_sha256':
+        return False
+    try:
+        return int(rest.split('$')[0]) < PBKDF2_ITERATIONS
+    except ValueError:
+        return True
+
+
+# verified against when the username does not exist, so a miss takes as long as a wrong password
+_DUMMY_HASH = None
+
+
+def _dummy_hash():
+    global _DUMMY_HASH
+    if _DUMMY_HASH is None:
+        _DUMMY_HASH = hash_password(secrets.token_hex(8))
+    return _DUMMY_HASH
+
+
+# ---------------------------
+# Staff directory
+# ---------------------------
+class StaffDirectory:
+    """
+    Staff login accounts in the staff_users table, looked up by username
+    through its unique index. Methods block and hashing is slow by design,
+    so the app calls them from background threads.
+
+    A successful authenticate() is remembered for `verified_ttl` seconds as
+    an HMAC of the password under a per-process random key (never the
+    password itself), so unlocking again with the same credentials is a
+    dictionary lookup instead of another key derivation. Changing or
+    deactivating an account drops its entry.
+
+    `on_deactivated(usernames)` is called after accounts are deactivated
+    (set_active, provision with active false, retire_defaults), so the app
+    can end their sessions.
+    """
+
+    def __init__(self, pool, verified_ttl=VERIFIED_TTL, on_deactivated=None):
+        self.pool = pool
+        self.on_deactivated = on_deactivated
+        self.verified_ttl = verified_ttl
+        self._verified = {}
+        self._verified_key = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+
+    # --- verified-session cache ---
+    def _fingerprint(self, username, password):
+        return hmac.new(self._verified_key, f"{username}\0{password}".encode('utf-8'), 'sha256').digest()
+
+    def _remember(self, username, password, role):
+        with self._lock:
+            self._verified[username] = (self._fingerprint(username, password), role,
+                                        time.monotonic() + self.verified_ttl)
+
+    def _recall(self, username, password):
+        with self._lock:
+            entry = self._verified.get(username)
+            if entry is None:
+                return None
+            fingerprint, role, expires = entry
+            if time.monotonic() >= expires:
+                del self._verified[username]
+                return None
+        return role if hmac.compare_digest(fingerprint, self._fingerprint(username, password)) else None
+
+    def _deactivated(self, usernames):
+        if usernames and self.on_deactivated is not None:
+            try:
+                self.on_deactivated(list(usernames))
+            except Exception:
+                log.exception("Staff: deactivation callback failed")
+
+    def forget(self, username=None):
+        """Drop the cached verification of `username` (default: everyone)."""
+        with self._lock:
+            if username is None:
+                self._verified.clear()
+            else:
+                self._verified.pop(username, None)
+
+    # --- lookups ---
+    def authenticate(self, username, password):
+        """The role of an active account matching the credentials, or None."""
+        role = self._recall(username, password)
+        if role is not None:
+            return role
+        with self.pool.reader() as conn:
+            row = conn.execute(
+                'SELECT role, password_hash FROM staff_users WHERE username = ? AND active = 1', (username,)
+            ).fetchone()
+        if row is None:
+            verify_password(password, _dummy_hash())
+            return None
+        role, encoded = row
+        if not verify_password(password, encoded):
+            return None
+        if needs_rehash(encoded):
+            self.set_password(username, password)
+        self._remember(username, password, role)
+        return role
+
+    def is_active(self, username):
+        """True if `username` is an account that may log in."""
+        with self.pool.reader() as conn:
+            return conn.execute(
+                'SELECT 1 FROM staff_users WHERE username = ? AND active = 1', (username,)
+            ).fetchone() is not None
+
+    def get(self, username):
+        with self.pool.reader() as conn:
+            row = conn.execute(f"{_SELECT_USER} WHERE username = ?", (username,)).fetchone()
+        return StaffUser._make(row) if row else None
+
+    def count(self, active_only=True):
+        with self.pool.reader() as conn:
+            sql = 'SELECT COUNT(*) FROM staff_users' + (' WHERE active = 1' if active_only else '')
+            return conn.execute(sql).fetchone()[0]
+
+    # --- changes ---
+    def add(self, username, password, role):
+        """Create an account, or replace the password and role of an existing one."""
+        return self.provision([(username, password, role)])['written']
+
+    def set_password(self, username, password):
+        encoded = hash_password(password)
+        with self.pool.writer() as conn:
+            changed = conn.execute(
+                'UPDATE staff_users SET password_hash = ?, updated_at = ? WHERE username = ?',
+                (encoded, time.time(), username),
+            ).rowcount
+        self.forget(username)
+        return changed > 0
+
+    def set_active(self, username, active):
+        with self.pool.writer() as conn:
+            changed = conn.execute(
+                'UPDATE staff_users SET active = ?, updated_at = ? WHERE username = ?',
+                (1 if active else 0, time.time(), username),
+            ).rowcount
+        self.forget(username)
+        if changed and not active:
+            self._deactivated([username])
+        return changed > 0
+
+    def provision(self, accounts, workers=None, batch_size=500):
+        """
+        Create or update accounts from (username, password, role[, active])
+        tuples. Passwords are hashed on `workers` threads (the KDFs release
+        the GIL, so this scales with cores) and written `batch_size` per
+        transaction. Returns {'written', 'rejected', 'elapsed'}.
+        """
+        stats = {'written': 0, 'rejected': 0, 'elapsed': 0.0}
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 2,
+                                thread_name_prefix='staff-hash') as executor:
+            pending = []
+            for account in accounts:
+                username, password, role = (str(v).strip() if v is not None else '' for v in account[:3])
+                active = account[3] if len(account) > 3 else True
+                if not username or not password or role not in ROLES:
+                    log.warning(f"Staff: skipping account '{username}': needs a username, password and "
+                                f"a role in {', '.join(ROLES)}")
+                    stats['rejected'] += 1
+                    continue
+                pending.append((username, role, active, executor.submit(hash_password, password)))
+                if len(pending) >= batch_size:
+                    stats['written'] += self._upsert([(u, r, f.result(), a) for u, r, a, f in pending])
+                    pending = []
+            if pending:
+                stats['written'] += self._upsert([(u, r, f.result(), a) for u, r, a, f in pending])
+        if stats['written']:
+            self.retire_defaults()
+        stats['elapsed'] = time.perf_counter() - started
+        return stats
+
+    def _upsert(self, rows):
+        now = time.time()
+        with self.pool.writer() as conn:
+            conn.executemany(
+                'INSERT INTO staff_users (username, role, password_hash, active, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(username) DO UPDATE SET role = excluded.role, password_hash = excluded.password_hash, '
+                'active = excluded.active, is_default = 0, updated_at = excluded.updated_at',
+                [(u, r, h, 1 if _truthy(a) else 0, now, now) for u, r, h, a in rows],
+            )
+        for username, _, _, _ in rows:
+            self.forget(username)
+        self._deactivated([u for u, _, _, a in rows if not _truthy(a)])
+        return len(rows)
+
+    def seed_legacy_accounts(self):
+        """
+        Create LEGACY_ACCOUNTS if there are no accounts at all; returns True
+        if it did. Only for installs that were in use before accounts were
+        stored: their staff still log in with the old credentials until an
+        administrator provisions real ones.
+        """
+        now = time.time()
+        with self.pool.writer() as conn:
+            if conn.execute('SELECT 1 FROM staff_users LIMIT 1').fetchone():
+                return False
+            conn.executemany(
+                'INSERT INTO staff_users (username, role, password_hash, active, is_default, created_at, updated_at) '
+                'VALUES (?, ?, ?, 1, 1, ?, ?)',
+                [(username, role, encoded, now, now) for username, encoded, role in LEGACY_ACCOUNTS],
+            )
+        log.warning("Staff: created the legacy K/k accounts; provision real accounts to retire them")
+        return True
+
+    def retire_defaults(self):
+        """Deactivate the legacy accounts once any other active account exists; returns how many."""
+        with self.pool.writer() as conn:
+            retired = [row[0] for row in conn.execute(
+                'SELECT username FROM staff_users WHERE is_default = 1 AND active = 1 '
+                'AND EXISTS (SELECT 1 FROM staff_users WHERE is_default = 0 AND active = 1)'
+            )]
+            now = time.time()
+            conn.executemany('UPDATE staff_users SET active = 0, updated_at = ? WHERE username = ?',
+                             [(now, username) for username in retired])
+        if retired:
+            self.forget()
+            log.info(f"Staff: deactivated {len(retired)} legacy accounts")
+            self._deactivated(retired)
+        return len(retired)
+
+    def needs_setup(self):
+        """True while there is no account at all: the first login creates the administrator."""
+        return self.count(active_only=False) == 0
+
+    def create_first_admin(self, username, password):
+        """
+        Create the administrator account of a fresh install. Raises
+        ValueError for a weak password or if any account exists already.
+        """
+        username = (username or '').strip()
+        if not username:
+            raise ValueError("Choose a username.")
+        if len(password or '') < MIN_PASSWORD_LENGTH:
+            raise ValueError(f"The password needs at least {MIN_PASSWORD_LENGTH} characters.")
+        encoded = hash_password(password)
+        now = time.time()
+        with self.pool.writer() as conn:
+            if conn.execute('SELECT 1 FROM staff_users LIMIT 1').fetchone():
+                raise ValueError("Staff accounts exist already.")
+            conn.execute(
+                'INSERT INTO staff_users (username, role, password_hash, active, created_at, updated_at) '
+                'VALUES (?, ?, ?, 1, ?, ?)',
+                (username, 'admin', encoded, now, now),
+            )
+        log.info(f"Staff: created the administrator account '{username}'")
+        return 'admin'
+
+
+def _truthy(value):
+    if isinstance(value, str):
+        return value.strip().lower() not in ('', '0', 'false', 'no', 'n')
+    return bool(value)
+
+
+def main(argv=None):
+    from db_pool import ConnectionPool
+    from migrations import migrate
+    from patient_import import iter_records
+
+    parser = argparse.ArgumentParser(
+        description="Create or update staff login accounts from CSV or JSONL "
+                    "(columns: username, password, role[, active]).")
+    parser.add_argument('file', help="CSV (with a header row) or .jsonl file")
+    parser.add_argument('--db', required=True, help="path to health_records.db")
+    parser.add_argument('--workers', type=int, help="hashing threads (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"database not found: {args.db} (start the app once to create it)")
+
+    pool = ConnectionPool(args.db, readers=1)
+    with pool.writer() as conn:
+        migrate(conn)
+
+    def accounts():
+        for _, raw in iter_records(args.file):
+            yield raw.get('username'), raw.get('password'), raw.get('role'), raw.get('active', True)
+
+    try:
+        stats = StaffDirectory(pool).provision(accounts(), workers=args.workers)
+    finally:
+        pool.close()
+    print(f"written {stats['written']}  rejected {stats['rejected']}  in {stats['elapsed']:.1f}s", file=sys.stderr)
+    return 0 if stats['rejected'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
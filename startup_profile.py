@@ -0,0 +1,91 @@
+import builtins
+import json
+import os
+import sys
+import threading
+import time
+
+# ---------------------------
+# Startup profiler
+# ---------------------------
+# Enabled with VHR_STARTUP_PROFILE=1. Records how long every first-time
+# import takes and when each startup phase is reached, from
+# "Main: Starting MyApp" to the first rendered frame, then writes the lot to
+# startup_profile.json. Disabled, every call here is a cheap no-op.
+ENABLED = os.environ.get('VHR_STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+_t0 = time.perf_counter()
+_phases = []
+_imports = []
+_local = threading.local()
+_original_import = builtins.__import__
+_finished = False
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level != 0 or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    started = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _local.depth = depth
+        # inclusive time: nested imports are also listed with a greater depth
+        _imports.append({
+            'module': name,
+            'depth': depth,
+            'ms': round((time.perf_counter() - started) * 1000, 3),
+        })
+
+
+def start():
+    """Install the import timer. Call before the imports you want measured."""
+    if ENABLED and builtins.__import__ is _original_import:
+        builtins.__import__ = _timed_import
+
+
+def mark(phase):
+    """Record that startup reached `phase`, in ms since the profile origin."""
+    if ENABLED and not _finished:
+        _phases.append({'phase': phase, 'ms': round((time.perf_counter() - _t0) * 1000, 3)})
+
+
+def reset_origin():
+    """Make now the zero point for phase timings (already recorded phases are shifted)."""
+    global _t0
+    if not ENABLED:
+        return
+    now = time.perf_counter()
+    shift = (now - _t0) * 1000
+    for phase in _phases:
+        phase['ms'] = round(phase['ms'] - shift, 3)
+    _t0 = now
+
+
+def report():
+    top = sorted((i for i in _imports if i['depth'] == 0), key=lambda i: i['ms'], reverse=True)
+    return {
+        'phases': list(_phases),
+        'imports': list(_imports),
+        'top_level_imports': top,
+    }
+
+
+def finish(path):
+    """Stop timing imports, write the report to `path` and return it."""
+    global _finished
+    if not ENABLED or _finished:
+        return None
+    mark('first_frame')
+    _finished = True
+    if builtins.__import__ is _timed_import:
+        builtins.__import__ = _original_import
+    data = report()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    return data
@@ -0,0 +1,210 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+# ---------------------------
+# Synthetic patient data
+# ---------------------------
+# Seeded, so the same (seed, rows) always produces the same dataset. Names,
+# conditions and doctors follow Zipf-like distributions: a few values are
+# very common and there is a long tail, the way real clinic data looks.
+# That matters for benchmarks: FTS postings, index pages and LIKE scans
+# behave very differently on uniform data.
+
+FIRST_NAMES = [
+    "Aarav", "Priya", "Rahul", "Asha", "Kunal", "Neha", "Amit", "Pooja", "Ravi", "Sneha",
+    "Vikram", "Anjali", "Suresh", "Kavita", "Arjun", "Meera", "Rohan", "Divya", "Sanjay", "Lakshmi",
+    "Manoj", "Sunita", "Deepak", "Rekha", "Nikhil", "Geeta", "Ajay", "Swati", "Vijay", "Nisha",
+    "Harish", "Pallavi", "Ganesh", "Shweta", "Prakash", "Radha", "Mahesh", "Usha", "Kiran", "Sana",
+    "Imran", "Fatima", "Joseph", "Mary", "Harpreet", "Gurpreet", "Tenzin", "Aditi", "Omkar", "Ishaan",
+]
+LAST_NAMES = [
+    "Patel", "Sharma", "Singh", "Kumar", "Gupta", "Rao", "Reddy", "Iyer", "Nair", "Joshi",
+    "Desai", "Kulkarni", "Ugade", "Pawar", "Jadhav", "Shinde", "Khan", "Das", "Mehta", "Shah",
+    "Chopra", "Verma", "Mishra", "Pandey", "Menon", "Pillai", "Bose", "Ghosh", "Fernandes", "DSouza",
+]
+# (condition, medications commonly prescribed for it)
+CONDITIONS = [
+    ("Hypertension", ["Amlodipine", "Losartan", "Telmisartan"]),
+    ("Diabetes", ["Metformin", "Glimepiride", "Insulin"]),
+    ("Asthma", ["Salbutamol", "Budesonide"]),
+    ("Hypothyroidism", ["Levothyroxine"]),
+    ("Arthritis", ["Ibuprofen", "Diclofenac"]),
+    ("Anemia", ["Ferrous sulfate", "Folic acid"]),
+    ("Migraine", ["Sumatriptan", "Propranolol"]),
+    ("Hyperlipidemia", ["Atorvastatin", "Rosuvastatin"]),
+    ("GERD", ["Pantoprazole", "Omeprazole"]),
+    ("Depression", ["Sertraline", "Escitalopram"]),
+    ("COPD", ["Tiotropium", "Salbutamol"]),
+    ("Tuberculosis", ["Isoniazid", "Rifampicin"]),
+    ("Chronic kidney disease", ["Furosemide"]),
+    ("Epilepsy", ["Levetiracetam", "Valproate"]),
+    ("Psoriasis", ["Methotrexate"]),
+    ("Heart failure", ["Carvedilol", "Spironolactone"]),
+    ("Osteoporosis", ["Alendronate", "Calcium"]),
+    ("Gout", ["Allopurinol", "Colchicine"]),
+    ("Malaria", ["Artemether"]),
+    ("Dengue", ["Paracetamol"]),
+]
+DOCTORS = [
+    "Dr. Mehta", "Dr. Rao", "Dr. Kulkarni", "Dr. Sharma", "Dr. Iyer", "Dr. Khan", "Dr. Desai",
+    "Dr. Nair", "Dr. Joshi", "Dr. Ghosh", "Dr. Reddy", "Dr. Fernandes", "Dr. Pillai", "Dr. Shah",
+]
+STREETS = ["MG Road", "Station Road", "Gandhi Nagar", "Shivaji Chowk", "Market Yard", "Nehru Colony", "Tilak Road"]
+CITIES = ["Pune", "Mumbai", "Nashik", "Nagpur", "Kolhapur", "Satara", "Solapur", "Aurangabad"]
+NOTES = [
+    "Follow-up in 2 weeks", "Allergic to penicillin", "Smoker", "Refer to specialist",
+    "BP check monthly", "Diet counselling given", "Lab results pending",
+]
+# how many conditions a patient has
+CONDITION_COUNTS = [0, 1, 2, 3]
+CONDITION_COUNT_WEIGHTS = [35, 40, 18, 7]
+
+# fixed reference date, so last_visit values do not depend on when the data is generated
+AS_OF = date(2025, 1, 1)
+
+
+def _zipf_cum_weights(n, s=1.1):
+    total = 0.0
+    cum = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s
+        cum.append(total)
+    return cum
+
+
+class PatientGenerator:
+    """
+    Produces column-ordered patient rows (patient_import.PATIENT_COLUMNS
+    order) in batches. Most values are drawn for the whole batch at once with
+    random.choices, which keeps generation well above 50k rows per second.
+    """
+
+    def __init__(self, seed=0, as_of=AS_OF):
+        self.rng = random.Random(seed)
+        self.as_of = as_of
+        self._first_cum = _zipf_cum_weights(len(FIRST_NAMES))
+        self._last_cum = _zipf_cum_weights(len(LAST_NAMES))
+        self._condition_cum = _zipf_cum_weights(len(CONDITIONS), s=1.3)
+        self._doctor_cum = _zipf_cum_weights(len(DOCTORS), s=0.8)
+
+    def _conditions(self, count):
+        if not count:
+            return "", ""
+        picked = set(self.rng.choices(range(len(CONDITIONS)), cum_weights=self._condition_cum, k=count))
+        conditions = [CONDITIONS[i][0] for i in sorted(picked)]
+        medications = [self.rng.choice(CONDITIONS[i][1]) for i in sorted(picked)]
+        return ", ".join(conditions), ", ".join(medications)
+
+    def batch(self, n):
+        rng = self.rng
+        names = zip(
+            rng.choices(FIRST_NAMES, cum_weights=self._first_cum, k=n),
+            rng.choices(LAST_NAMES, cum_weights=self._last_cum, k=n),
+        )
+        doctors = rng.choices(DOCTORS, cum_weights=self._doctor_cum, k=n)
+        counts = rng.choices(CONDITION_COUNTS, weights=CONDITION_COUNT_WEIGHTS, k=n)
+        genders = rng.choices(("Male", "Female", "Other"), weights=(49, 49, 2), k=n)
+        streets = rng.choices(STREETS, k=n)
+        cities = rng.choices(CITIES, k=n)
+        rows = []
+        for (first, last), doctor, count, gender, street, city in zip(names, doctors, counts, genders, streets, cities):
+            conditions, medications = self._conditions(count)
+            # visits cluster in the recent past with a long tail back ~3 years
+            days_ago = min(int(rng.expovariate(1 / 120.0)), 3 * 365)
+            rows.append((
+                f"{first} {last}",
+                int(rng.triangular(1, 95, 42)),
+                gender,
+                f"{rng.randrange(6 * 10 ** 9, 10 ** 10)}",
+                f"{rng.randint(1, 999)}, {street}, {city}",
+                conditions,
+                medications,
+                doctor,
+                (self.as_of - timedelta(days=days_ago)).isoformat(),
+                rng.choice(NOTES) if rng.random() < 0.2 else "",
+            ))
+        return rows
+
+
+def iter_patients(count, seed=0, batch_size=10000):
+    """Yield `count` synthetic patient rows, generated `batch_size` at a time."""
+    generator = PatientGenerator(seed)
+    remaining = count
+    while remaining > 0:
+        n = min(batch_size, remaining)
+        yield from generator.batch(n)
+        remaining -= n
+
+
+def populate(repo, count, seed=0, batch_size=20000, progress=None, defer_indexes=True):
+    """
+    Insert `count` synthetic patients through `repo` (a PatientRepository),
+    one transaction per batch. With `defer_indexes` the list index and FTS
+    triggers are rebuilt once at the end instead of per row (see
+    migrations.bulk_load). Returns stats with rows, elapsed and rows_per_sec.
+    """
+    from migrations import bulk_load
+
+    stats = {'rows': 0, 'elapsed': 0.0, 'rows_per_sec': 0.0}
+    started = time.perf_counter()
+    generator = PatientGenerator(seed)
+
+    def load():
+        remaining = count
+        while remaining > 0:
+            n = min(batch_size, remaining)
+            stats['rows'] += repo.add_many(generator.batch(n), batch_size=batch_size)
+            remaining -= n
+            if progress is not None:
+                stats['elapsed'] = time.perf_counter() - started
+                stats['rows_per_sec'] = stats['rows'] / stats['elapsed'] if stats['elapsed'] else 0.0
+                progress(dict(stats))
+
+    if defer_indexes:
+        # the writer lock is re-entrant: add_many's batches nest inside it
+        with repo.pool.writer() as conn:
+            with bulk_load(conn):
+                load()
+    else:
+        load()
+
+    stats['elapsed'] = time.perf_counter() - started
+    stats['rows_per_sec'] = stats['rows'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    return stats
+
+
+def main(argv=None):
+    from patient_repository import open_repository
+
+    parser = argparse.ArgumentParser(description="Fill a health_records.db with seeded synthetic patients.")
+    parser.add_argument('--db', required=True, help="path to health_records.db (created if missing)")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=20000)
+    parser.add_argument('--no-defer-indexes', action='store_true',
+                        help="maintain the indexes row by row (slower; what the app's own inserts do)")
+    args = parser.parse_args(argv)
+
+    directory = os.path.dirname(os.path.abspath(args.db))
+    os.makedirs(directory, exist_ok=True)
+    repo = open_repository(args.db)
+
+    def report(stats):
+        print(f"inserted {stats['rows']}/{args.rows}  ({stats['rows_per_sec']:.0f} rows/s)", file=sys.stderr)
+
+    try:
+        stats = populate(repo, args.rows, seed=args.seed, batch_size=args.batch_size,
+                         progress=report, defer_indexes=not args.no_defer_indexes)
+    finally:
+        repo.close()
+    print(f"done: {stats['rows']} rows in {stats['elapsed']:.1f}s ({stats['rows_per_sec']:.0f} rows/s)",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Cohort broadcasts against a temporary DB and an outbox: a full run, and
+cancel() landing between the feeder's checks and its enqueue.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import broadcast  # noqa: E402
+from broadcast import CANCELLED, DONE, Broadcast  # noqa: E402
+from patient_repository import open_repository  # noqa: E402
+from sms_outbox import FAILED, QUEUED, LocalTransport, Outbox  # noqa: E402
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class BroadcastTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.repo = open_repository(os.path.join(self.tmp, 'broadcast.db'))
+        for i in range(5):
+            self.repo.add({'name': f'Patient {i}', 'age': '40', 'contact': f'91980000000{i}',
+                           'conditions': 'Diabetes', 'last_visit': '2025-01-01'})
+        self.transport = LocalTransport()
+        self.outbox = Outbox(self.repo.pool, self.transport, rate_per_minute=6000, burst=100, poll_interval=30.0)
+
+    def tearDown(self):
+        self.outbox.stop()
+        self.repo.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def tagged(self, tag):
+        with self.repo.pool.reader() as conn:
+            return [tuple(r) for r in conn.execute('SELECT status FROM sms_outbox WHERE tag = ?', (tag,))]
+
+
+class BroadcastTest(BroadcastTestCase):
+
+    def test_sends_to_the_whole_cohort(self):
+        self.outbox.start()
+        run = Broadcast(self.repo, self.outbox, "Dear {first_name}, your check-up is due.", condition='diabetes')
+        run.start()
+        self.assertTrue(run.wait(timeout=10))
+        self.assertEqual(run.state, DONE)
+        self.assertEqual(run.progress()['sent'], 5)
+        self.assertEqual(sorted(self.transport.delivered)[0], ('919800000000', 'Dear Patient, your check-up is due.'))
+
+    def test_cancel_between_checks_and_enqueue_queues_nothing(self):
+        # the outbox is not started: anything queued stays QUEUED and would be sent later
+        run = Broadcast(self.repo, self.outbox, "Hello {name}", condition='diabetes', window=1)
+        real_render = broadcast.render
+
+        def render_then_cancel(template, patient):
+            # runs on the feeder after its cancel checks, before the enqueue
+            run.cancel()
+            return real_render(template, patient)
+
+        with mock.patch.object(broadcast, 'render', render_then_cancel):
+            run.start()
+            self.assertTrue(run.wait(timeout=10))
+        self.assertEqual(run.state, CANCELLED)
+        self.assertNotIn((QUEUED,), self.tagged(run.tag))
+        self.assertEqual(run.progress()['queued'], 0)
+
+    def test_cancel_fails_what_is_still_queued(self):
+        run = Broadcast(self.repo, self.outbox, "Hello {name}", condition='diabetes', window=3)
+        run.start()
+        self.assertTrue(wait_for(lambda: len(self.tagged(run.tag)) == 3))
+        run.cancel()
+        self.assertTrue(run.wait(timeout=10))
+        self.assertEqual(self.tagged(run.tag), [(FAILED,)] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""
+Schema migrations and bulk loading against temporary DB files.
+"""
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import migrations  # noqa: E402
+from migrations import MIGRATIONS, SCHEMA_VERSION, migrate, schema_version  # noqa: E402
+from patient_repository import open_repository  # noqa: E402
+
+
+class MigrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'health_records.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        self.addCleanup(conn.close)
+        return conn
+
+    def names(self, conn, kind):
+        return {r[0] for r in conn.execute('SELECT name FROM sqlite_master WHERE type = ?', (kind,))}
+
+
+class MigrateTest(MigrationTestCase):
+
+    def test_fresh_db_gets_every_step_once(self):
+        conn = self.connect()
+        messages = []
+        self.assertEqual(migrate(conn, log=messages.append), list(range(1, SCHEMA_VERSION + 1)))
+        self.assertEqual(schema_version(conn), SCHEMA_VERSION)
+        self.assertEqual(len(messages), SCHEMA_VERSION)
+        self.assertLessEqual({'patients', 'sms_outbox', 'staff_users', 'patient_conditions'},
+                             self.names(conn, 'table'))
+        self.assertEqual(migrate(conn), [])
+
+    def test_pre_versioned_db_keeps_its_patients(self):
+        # the table as the app created it before schema versions existed (user_version 0)
+        conn = self.connect()
+        conn.execute('''
+            CREATE TABLE patients (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, age INTEGER, gender TEXT,
+                contact TEXT, address TEXT, conditions TEXT, medications TEXT,
+                doctor_name TEXT, last_visit TEXT, notes TEXT
+            )
+        ''')
+        conn.executemany('INSERT INTO patients (name, conditions, medications) VALUES (?, ?, ?)',
+                         [('Asha Patil', 'Diabetes (E11)', 'Metformin 500mg'), ('Ravi Kumar', 'Asthma', '')])
+        conn.commit()
+        self.assertEqual(schema_version(conn), 0)
+        migrate(conn)
+        self.assertEqual(schema_version(conn), SCHEMA_VERSION)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0], 2)
+        # existing rows are searchable, and their terms are left to the backfill
+        self.assertEqual(conn.execute(
+            "SELECT rowid FROM patients_fts WHERE patients_fts MATCH 'asha'").fetchall(), [(1,)])
+        self.assertEqual(conn.execute('SELECT done_id, until_id FROM patient_terms_backfill').fetchall(), [(0, 2)])
+        conn.close()
+
+        repo = open_repository(self.path)
+        try:
+            self.assertEqual([p.name for p in repo.cohort('e11')], ['Asha Patil'])
+        finally:
+            repo.close()
+
+    def test_newer_schema_is_refused_untouched(self):
+        conn = self.connect()
+        migrate(conn)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION + 1}')
+        with self.assertRaises(RuntimeError):
+            migrate(conn)
+        self.assertEqual(schema_version(conn), SCHEMA_VERSION + 1)
+        self.assertFalse(conn.in_transaction)
+
+    def test_failed_step_leaves_the_previous_version(self):
+        def broken(conn):
+            conn.execute('CREATE TABLE half_done (id INTEGER)')
+            raise sqlite3.OperationalError("disk full")
+
+        conn = self.connect()
+        steps = MIGRATIONS[:-1] + [("broken step", broken)]
+        with mock.patch.object(migrations, 'MIGRATIONS', steps):
+            with self.assertRaises(sqlite3.OperationalError):
+                migrate(conn)
+        self.assertEqual(schema_version(conn), SCHEMA_VERSION - 1)
+        self.assertNotIn('half_done', self.names(conn, 'table'))
+        # the real step applies on the next start
+        self.assertEqual(migrate(conn), [SCHEMA_VERSION])
+
+
+class BulkLoadTest(MigrationTestCase):
+
+    def test_interrupted_bulk_load_is_repaired_on_the_next_open(self):
+        repo = open_repository(self.path)
+        repo.add({'name': 'Before Load', 'conditions': 'Asthma'})
+        repo.close()
+        # a process that dies inside bulk_load(): its finally block never runs
+        script = textwrap.dedent(f'''
+            import os, sys
+            sys.path.insert(0, {ROOT!r})
+            from migrations import bulk_load
+            from patient_repository import open_repository
+            repo = open_repository({self.path!r})
+            with repo.pool.writer() as conn:
+                with bulk_load(conn):
+                    repo.add_many([{{'name': 'Loaded %d' % i, 'conditions': 'Gout'}} for i in range(50)])
+                    os._exit(0)
+        ''')
+        subprocess.run([sys.executable, '-c', script], check=True)
+
+        conn = self.connect()
+        self.assertNotIn('patients_fts_ai', self.names(conn, 'trigger'))
+        self.assertNotIn('idx_patients_name_id', self.names(conn, 'index'))
+        messages = []
+        migrate(conn, log=messages.append)
+        self.assertLessEqual({'patients_fts_ai', 'patients_fts_ad', 'patients_fts_au'}, self.names(conn, 'trigger'))
+        self.assertIn('idx_patients_name_id', self.names(conn, 'index'))
+        self.assertEqual(len(messages), 1)
+        self.assertIn('interrupted bulk load', messages[0])
+        conn.close()
+
+        repo = open_repository(self.path)
+        try:
+            # rows loaded while the triggers were gone are searchable, and new ones stay in sync
+            self.assertEqual(len(repo.search('Loaded')), 50)
+            repo.add({'name': 'After Repair'})
+            self.assertEqual([p.name for p in repo.search('After Repair')], ['After Repair'])
+        finally:
+            repo.close()
+
+    def test_current_db_is_left_alone(self):
+        open_repository(self.path).close()
+        conn = self.connect()
+        messages = []
+        self.assertEqual(migrate(conn, log=messages.append), [])
+        self.assertEqual(messages, [])
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual(conn.execute('PRAGMA user_version').fetchone()[0], SCHEMA_VERSION)
+
+
+if __name__ == '__main__':
+    unittest.main()
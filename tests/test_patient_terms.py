@@ -0,0 +1,191 @@
+"""
+patient_terms: parsing of the free text, the batched backfill and its
+resume, and cohort lookups, where the index path and the free-text scan
+used while a backfill is pending must find the same patients.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db_pool import ConnectionPool  # noqa: E402
+from migrations import MIGRATIONS, migrate  # noqa: E402
+from patient_import import INSERT_PATIENT_SQL  # noqa: E402
+from patient_repository import PatientRepository, open_repository  # noqa: E402
+from patient_terms import backfill, backfill_pending, normalize_term, parse_conditions, parse_medications  # noqa: E402
+
+
+def patient(name, conditions='', medications='', doctor='Dr. Rao'):
+    return {'name': name, 'age': '40', 'contact': '9800000000', 'conditions': conditions,
+            'medications': medications, 'doctor_name': doctor, 'last_visit': '2025-01-01'}
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_conditions_split_normalize_and_keep_codes(self):
+        self.assertEqual(
+            parse_conditions("Type 2  Diabetes (e11), Hypertension;\n;asthma.  [J45.9]"),
+            [('type 2 diabetes', 'E11'), ('hypertension', None), ('asthma', 'J45.9')],
+        )
+        self.assertEqual(parse_conditions("(E11)"), [('e11', 'E11')])
+        self.assertEqual(parse_conditions(""), [])
+        self.assertEqual(parse_conditions(None), [])
+
+    def test_medications_split_name_and_dose(self):
+        self.assertEqual(
+            parse_medications("Metformin 500mg twice daily (A10BA02), Vitamin B12 1000mcg, 5% dextrose, Insulin"),
+            [('metformin', '500mg twice daily', 'A10BA02'), ('vitamin b12', '1000mcg', None),
+             ('5% dextrose', None, None), ('insulin', None, None)],
+        )
+
+    def test_repeated_term_merges_what_the_first_left_out(self):
+        self.assertEqual(parse_conditions("Diabetes, diabetes (E11)"), [('diabetes', 'E11')])
+        self.assertEqual(parse_conditions("Diabetes (E11), diabetes (E12)"), [('diabetes', 'E11')])
+        self.assertEqual(parse_medications("Metformin, metformin 500mg (A10BA02)"),
+                         [('metformin', '500mg', 'A10BA02')])
+
+    def test_a_code_belongs_to_one_term_per_patient(self):
+        self.assertEqual(parse_conditions("Asthma (J45), Wheeze (J45)"), [('asthma', 'J45'), ('wheeze', None)])
+        # a code the merge did not keep is still free for the next term
+        self.assertEqual(parse_conditions("Gout (M10), gout (M11), Arthritis (M11)"),
+                         [('gout', 'M10'), ('arthritis', 'M11')])
+
+    def test_normalize_term(self):
+        self.assertEqual(normalize_term("  Chronic   Kidney Disease.: "), "chronic kidney disease")
+
+
+class BackfillTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pool = ConnectionPool(os.path.join(self.tmp, 'backfill.db'), readers=2)
+        # 25 patients written at v6, before the term tables existed
+        with self.pool.writer() as conn:
+            for i, (_, step) in enumerate(MIGRATIONS[:6]):
+                step(conn)
+                conn.execute(f'PRAGMA user_version = {i + 1}')
+            conn.executemany(INSERT_PATIENT_SQL, [
+                (f'P{i}', 40, '', '98000', '', 'Diabetes (E11)' if i % 2 else 'Asthma', 'Metformin', '', '', '')
+                for i in range(25)
+            ])
+            migrate(conn)
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def state(self):
+        with self.pool.reader() as conn:
+            return conn.execute('SELECT done_id, until_id FROM patient_terms_backfill').fetchall()
+
+    def test_migration_only_records_the_work(self):
+        self.assertEqual(self.state(), [(0, 25)])
+        with self.pool.reader() as conn:
+            self.assertTrue(backfill_pending(conn))
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM patient_conditions').fetchone()[0], 0)
+
+    def test_stopped_backfill_resumes_at_the_high_water_mark(self):
+        stop = threading.Event()
+        batches = []
+        real_writer = self.pool.writer
+
+        def writer():
+            # stop after the second committed batch
+            batches.append(1)
+            if len(batches) == 2:
+                stop.set()
+            return real_writer()
+
+        self.pool.writer = writer
+        self.assertEqual(backfill(self.pool, batch_size=10, stop=stop), 20)
+        del self.pool.writer
+        self.assertEqual(self.state(), [(20, 25)])
+
+        self.assertEqual(backfill(self.pool, batch_size=10), 5)
+        self.assertEqual(self.state(), [])
+        repo = PatientRepository(self.pool)
+        self.assertEqual(repo.count_cohort('e11'), 12)
+        self.assertEqual(repo.count_cohort('asthma', medication='metformin'), 13)
+        # nothing left to do
+        self.assertEqual(backfill(self.pool), 0)
+
+    def test_patients_added_during_the_backfill_are_indexed_once(self):
+        repo = PatientRepository(self.pool)
+        new_id = repo.add({'name': 'New', 'conditions': 'Gout'})
+        repo.update(3, {'conditions': 'Gout'})
+        backfill(self.pool, batch_size=7)
+        self.assertEqual([p.id for p in repo.cohort('gout')], [3, new_id])
+        with self.pool.reader() as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM patient_conditions').fetchone()[0], 26)
+
+
+class CohortTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.repo = open_repository(os.path.join(self.tmp, 'terms.db'))
+
+    def tearDown(self):
+        self.repo.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def set_backfill_pending(self, pending):
+        # a pending backfill row sends cohort lookups down the free-text scan
+        with self.repo.pool.writer() as conn:
+            conn.execute('DELETE FROM patient_terms_backfill')
+            if pending:
+                conn.execute('INSERT INTO patient_terms_backfill (id, done_id, until_id) VALUES (1, 0, 0)')
+
+    def both_paths(self, *args, **kwargs):
+        results = []
+        for pending in (False, True):
+            self.set_backfill_pending(pending)
+            results.append((
+                [p.id for p in self.repo.cohort(*args, **kwargs)],
+                self.repo.count_cohort(*args, **{k: v for k, v in kwargs.items() if k != 'limit'}),
+            ))
+        self.set_backfill_pending(False)
+        return results
+
+
+class TermOrCodeTest(CohortTestCase):
+
+    def test_value_matches_term_or_code_on_both_paths(self):
+        ids = [self.repo.add(patient(name, conditions)) for name, conditions in (
+            ('Code only', '(E11)'), ('Named', 'Diabetes (E11)'), ('Term only', 'E11'), ('Other', 'Asthma'))]
+        expected = (ids[:3], 3)
+        self.assertEqual(self.both_paths('E11'), [expected, expected])
+        self.assertEqual(self.both_paths('e11'), [expected, expected])
+
+    def test_union_pages_and_other_filters(self):
+        ids = [self.repo.add(patient(str(i), ['(E11)', 'Diabetes (E11)', 'E11'][i % 3],
+                                     'Metformin' if i % 2 else 'Insulin', doctor=f'Dr. {i % 2}'))
+               for i in range(12)]
+        index, scan = self.both_paths('E11', doctor='dr. 1', medication='metformin', limit=100)
+        self.assertEqual(index, scan)
+        self.assertEqual(index[0], ids[1::2])
+
+        self.assertEqual(self.both_paths('diabetes', medication='metformin'), [([ids[1], ids[7]], 2)] * 2)
+        first = self.repo.cohort('E11', limit=5)
+        rest = self.repo.cohort('E11', after_id=first[-1].id, limit=100)
+        self.assertEqual([p.id for p in first + rest], ids)
+
+    def test_medication_code_matches_both_paths(self):
+        ids = [self.repo.add(patient(name, medications=medications)) for name, medications in (
+            ('A', 'Metformin 500mg (A10BA02)'), ('B', 'a10ba02'), ('C', 'Insulin'))]
+        expected = (ids[:2], 2)
+        self.assertEqual(self.both_paths(medication='A10BA02'), [expected, expected])
+
+    def test_unknown_value_matches_nobody(self):
+        self.repo.add(patient('A', 'Asthma'))
+        self.assertEqual(self.both_paths('gout'), [([], 0), ([], 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+LRUCache: eviction order, the generation guard against caching stale rows,
+peek() and the repository's write invalidation.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from patient_repository import PatientRepository, open_repository  # noqa: E402
+from record_cache import LRUCache  # noqa: E402
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(2)
+        cache.put(1, 'a')
+        cache.put(2, 'b')
+        self.assertEqual(cache.get(1), 'a')
+        cache.put(3, 'c')
+        self.assertIsNone(cache.get(2))
+        self.assertEqual((cache.get(1), cache.get(3)), ('a', 'c'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_put_after_an_invalidation_is_dropped(self):
+        cache = LRUCache(4)
+        generation = cache.generation  # taken before the DB read
+        cache.invalidate(7)  # a write commits meanwhile
+        self.assertFalse(cache.put(7, 'stale', generation))
+        self.assertIsNone(cache.get(7))
+        self.assertTrue(cache.put(7, 'fresh', cache.generation))
+        self.assertEqual(cache.get(7), 'fresh')
+
+    def test_invalidate_many_and_clear_also_bump_the_generation(self):
+        cache = LRUCache(4)
+        for action in (lambda: cache.invalidate_many([1, 2]), cache.clear):
+            generation = cache.generation
+            action()
+            self.assertFalse(cache.put(1, 'stale', generation))
+
+    def test_peek_changes_neither_recency_nor_stats(self):
+        cache = LRUCache(2)
+        cache.put(1, 'a')
+        cache.put(2, 'b')
+        self.assertEqual(cache.peek(1), 'a')
+        self.assertIsNone(cache.peek(9))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+        # 1 is still the oldest entry
+        cache.put(3, 'c')
+        self.assertIsNone(cache.peek(1))
+        self.assertEqual(cache.peek(2), 'b')
+
+    def test_peek_under_concurrent_invalidation(self):
+        cache = LRUCache(8)
+        stop = threading.Event()
+
+        def churn():
+            while not stop.is_set():
+                cache.put(1, 'a')
+                cache.invalidate(1)
+
+        worker = threading.Thread(target=churn)
+        worker.start()
+        try:
+            seen = {cache.peek(1) for _ in range(20000)}
+        finally:
+            stop.set()
+            worker.join()
+        self.assertLessEqual(seen, {None, 'a'})
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+
+
+class RepositoryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        repo = open_repository(os.path.join(self.tmp, 'cache.db'))
+        self.repo = PatientRepository(repo.pool, cache=LRUCache(16))
+
+    def tearDown(self):
+        self.repo.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_writes_invalidate_the_cached_record(self):
+        patient_id = self.repo.add({'name': 'Asha', 'conditions': 'Asthma'})
+        self.assertEqual(self.repo.get(patient_id).name, 'Asha')
+        self.assertEqual(self.repo.get_cached(patient_id).name, 'Asha')
+        self.repo.update(patient_id, {'name': 'Asha Patil'})
+        self.assertIsNone(self.repo.get_cached(patient_id))
+        self.assertEqual(self.repo.get(patient_id).name, 'Asha Patil')
+        self.repo.delete(patient_id)
+        self.assertIsNone(self.repo.get_cached(patient_id))
+        self.assertIsNone(self.repo.get(patient_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
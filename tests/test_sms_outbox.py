@@ -0,0 +1,250 @@
+"""
+Outbox delivery behaviour against a temporary DB and LocalTransport:
+wake-ups, retries with backoff, the attempt limit, rate limiting and
+re-queueing of messages caught mid-send.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from db_pool import ConnectionPool  # noqa: E402
+from migrations import migrate  # noqa: E402
+from sms_outbox import (  # noqa: E402
+    FAILED, QUEUED, SENDING, SENT, IntentTransport, LocalTransport, Outbox, TokenBucket, TransportError,
+)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class OutboxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pool = ConnectionPool(os.path.join(self.tmp, 'outbox.db'), readers=2)
+        with self.pool.writer() as conn:
+            migrate(conn)
+        self.outboxes = []
+
+    def tearDown(self):
+        for outbox in self.outboxes:
+            outbox.stop()
+        self.pool.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def make_outbox(self, transport=None, cls=Outbox, **kwargs):
+        # fast defaults: no rate limit to speak of, short backoff, long poll so wake-ups must work
+        options = dict(rate_per_minute=6000, burst=100, base_delay=0.05, max_delay=0.2, poll_interval=30.0)
+        options.update(kwargs)
+        outbox = cls(self.pool, transport or LocalTransport(), **options)
+        self.outboxes.append(outbox)
+        return outbox
+
+
+class WakeUpTest(OutboxTestCase):
+
+    def test_enqueue_wakes_an_idle_worker(self):
+        transport = LocalTransport()
+        outbox = self.make_outbox(transport)
+        outbox.start()
+        time.sleep(0.1)  # let the worker find the queue empty and go to sleep
+        started = time.monotonic()
+        message_id = outbox.enqueue('+911', 'hello')
+        self.assertTrue(wait_for(lambda: outbox.get(message_id).status == SENT, timeout=2.0))
+        self.assertLess(time.monotonic() - started, 2.0)
+        self.assertEqual(transport.delivered, [('+911', 'hello')])
+
+    def test_enqueue_between_empty_claim_and_wait_is_not_lost(self):
+        # enqueue (and notify) after the worker's empty claim, before it waits
+        test = self
+
+        class RacyOutbox(Outbox):
+            raced = False
+
+            def _claim_next(self):
+                result = super()._claim_next()
+                if result[0] is None and not self.raced:
+                    self.raced = True
+                    producer = threading.Thread(target=lambda: test.ids.append(self.enqueue('+912', 'race')))
+                    producer.start()
+                    producer.join()
+                return result
+
+        self.ids = []
+        outbox = self.make_outbox(cls=RacyOutbox)
+        outbox.start()
+        self.assertTrue(wait_for(lambda: self.ids and outbox.get(self.ids[0]).status == SENT, timeout=2.0))
+
+
+class RetryTest(OutboxTestCase):
+
+    def test_failed_sends_are_retried_with_backoff(self):
+        transport = LocalTransport(fail_first=2)
+        outbox = self.make_outbox(transport, base_delay=0.2, max_delay=1.0, max_attempts=5)
+        statuses = []
+        outbox.start()
+        started = time.monotonic()
+        message_id = outbox.enqueue('+913', 'retry me', on_status=lambda m: statuses.append(m.status))
+        self.assertTrue(wait_for(lambda: outbox.get(message_id).status == SENT))
+        elapsed = time.monotonic() - started
+
+        message = outbox.get(message_id)
+        self.assertEqual(message.attempts, 3)
+        self.assertIsNone(message.last_error)
+        self.assertEqual(transport.delivered, [('+913', 'retry me')])
+        # two backoffs of 0.2 and 0.4 s, each with at most 20% jitter
+        self.assertGreaterEqual(elapsed, 0.6 * 0.8)
+        self.assertEqual(statuses[-1], SENT)
+        self.assertIn(QUEUED, statuses)
+
+    def test_backoff_doubles_up_to_max_delay(self):
+        outbox = self.make_outbox(base_delay=1.0, max_delay=10.0)
+        for attempts, expected in ((1, 1.0), (2, 2.0), (3, 4.0), (4, 8.0), (5, 10.0), (9, 10.0)):
+            delay = outbox._backoff(attempts)
+            self.assertGreaterEqual(delay, expected * 0.8)
+            self.assertLessEqual(delay, expected * 1.2)
+
+    def test_gives_up_after_max_attempts(self):
+        transport = LocalTransport(fail_first=100)
+        outbox = self.make_outbox(transport, max_attempts=3, base_delay=0.01, max_delay=0.02)
+        final = []
+        outbox.start()
+        message_id = outbox.enqueue('+914', 'never', on_status=lambda m: final.append(m.status))
+        self.assertTrue(wait_for(lambda: outbox.get(message_id).status == FAILED))
+        time.sleep(0.1)
+
+        message = outbox.get(message_id)
+        self.assertEqual(message.attempts, 3)
+        self.assertEqual(message.last_error, "simulated delivery failure")
+        self.assertEqual(transport._attempts, 3)
+        self.assertEqual(final[-1], FAILED)
+
+    def test_retry_requeues_a_failed_message(self):
+        transport = LocalTransport(fail_first=1)
+        outbox = self.make_outbox(transport, max_attempts=1)
+        outbox.start()
+        message_id = outbox.enqueue('+915', 'again')
+        self.assertTrue(wait_for(lambda: outbox.get(message_id).status == FAILED))
+        self.assertTrue(outbox.retry(message_id))
+        self.assertTrue(wait_for(lambda: outbox.get(message_id).status == SENT))
+
+
+class RateLimitTest(OutboxTestCase):
+
+    def test_token_bucket_spaces_sends_after_the_burst(self):
+        bucket = TokenBucket(rate=20, per=1.0, burst=2)
+        started = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        # 2 from the burst, then 4 at 20/s
+        self.assertGreaterEqual(time.monotonic() - started, 4 / 20.0 * 0.9)
+
+    def test_outbox_sends_at_the_configured_rate(self):
+        transport = LocalTransport()
+        outbox = self.make_outbox(transport, rate_per_minute=600, burst=1)
+        outbox.start()
+        started = time.monotonic()
+        ids = outbox.enqueue_many([('+91%d' % i, 'rate') for i in range(5)])
+        self.assertTrue(wait_for(lambda: all(outbox.get(i).status == SENT for i in ids)))
+        # one from the burst, then 4 at 10/s
+        self.assertGreaterEqual(time.monotonic() - started, 0.4 * 0.9)
+
+    def test_stop_while_rate_limited_hands_the_message_back(self):
+        outbox = self.make_outbox(rate_per_minute=1, burst=1)
+        outbox.start()
+        first, second = outbox.enqueue_many([('+916', 'a'), ('+917', 'b')])
+        self.assertTrue(wait_for(lambda: outbox.get(first).status == SENT))
+        self.assertTrue(wait_for(lambda: outbox.get(second).status == SENDING))
+        outbox.stop()
+        message = outbox.get(second)
+        self.assertEqual(message.status, QUEUED)
+        self.assertEqual(message.attempts, 0)
+
+
+class RestartTest(OutboxTestCase):
+
+    def test_start_requeues_messages_caught_mid_send(self):
+        now = time.time()
+        with self.pool.writer() as conn:
+            message_id = conn.execute(
+                'INSERT INTO sms_outbox (recipient, body, status, attempts, next_attempt_at, created_at) '
+                'VALUES (?, ?, ?, 1, ?, ?)',
+                ('+918', 'crashed', SENDING, now, now),
+            ).lastrowid
+        transport = LocalTransport()
+        outbox = self.make_outbox(transport)
+        outbox.start()
+        self.assertTrue(wait_for(lambda: outbox.get(message_id).status == SENT))
+        self.assertEqual(transport.delivered, [('+918', 'crashed')])
+
+    def test_queued_messages_survive_a_restart(self):
+        outbox = self.make_outbox(LocalTransport(fail_first=100), max_attempts=10, base_delay=30.0, max_delay=30.0)
+        outbox.start()
+        message_id = outbox.enqueue('+919', 'later')
+        self.assertTrue(wait_for(lambda: outbox.get(message_id).attempts == 1))
+        outbox.stop()
+
+        transport = LocalTransport()
+        restarted = self.make_outbox(transport)
+        # due now, as if the backoff had run out while the app was closed
+        with self.pool.writer() as conn:
+            conn.execute('UPDATE sms_outbox SET next_attempt_at = ? WHERE id = ?', (time.time(), message_id))
+        restarted.start()
+        self.assertTrue(wait_for(lambda: restarted.get(message_id).status == SENT))
+        self.assertEqual(restarted.get(message_id).attempts, 2)
+
+
+class IntentTransportTest(OutboxTestCase):
+
+    def test_recipient_is_passed_as_one_argument_without_a_shell(self):
+        with mock.patch('subprocess.run') as run:
+            run.return_value.returncode = 0
+            IntentTransport().send('+911234567890', 'a & b "c"')
+        argv = run.call_args[0][0]
+        self.assertEqual(argv[:5], ['am', 'start', '-a', 'android.intent.action.VIEW', '-d'])
+        self.assertEqual(argv[5], 'https://wa.me/911234567890?text=a%20%26%20b%20%22c%22')
+        self.assertNotIn('shell', run.call_args[1])
+
+    def test_invalid_recipients_are_rejected_before_any_process_starts(self):
+        for recipient in ('9112"; rm -rf / #', '91 12345 67890', '12345', '+' + '1' * 16, '', None):
+            with mock.patch('subprocess.run') as run:
+                with self.assertRaises(TransportError) as raised:
+                    IntentTransport().send(recipient, 'hello')
+            self.assertTrue(raised.exception.permanent)
+            run.assert_not_called()
+
+    def test_non_zero_exit_is_a_retryable_failure(self):
+        with mock.patch('subprocess.run') as run:
+            run.return_value.returncode = 1
+            with self.assertRaises(TransportError) as raised:
+                IntentTransport().send('911234567890', 'hello')
+        self.assertFalse(raised.exception.permanent)
+
+    def test_outbox_does_not_retry_a_bad_recipient(self):
+        outbox = self.make_outbox(IntentTransport(), max_attempts=5)
+        outbox.start()
+        with mock.patch('subprocess.run') as run:
+            message_id = outbox.enqueue('"; reboot', 'hello')
+            self.assertTrue(wait_for(lambda: outbox.get(message_id).status == FAILED))
+        self.assertEqual(outbox.get(message_id).attempts, 1)
+        self.assertIn('not a phone number', outbox.get(message_id).last_error)
+        run.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+"""
+Staff accounts: password hashing, login against the staff_users table,
+the legacy K/k accounts and their retirement.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import staff_accounts  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+from migrations import migrate  # noqa: E402
+from staff_accounts import StaffDirectory, hash_password, needs_rehash, verify_password  # noqa: E402
+
+
+class PasswordHashTest(unittest.TestCase):
+
+    def test_pbkdf2_round_trip_with_a_fresh_salt(self):
+        first, second = hash_password('s3cret pass'), hash_password('s3cret pass')
+        self.assertTrue(first.startswith(f'pbkdf2_sha256${staff_accounts.PBKDF2_ITERATIONS}$'))
+        self.assertNotEqual(first, second)
+        self.assertNotIn('s3cret', first)
+        self.assertTrue(verify_password('s3cret pass', first))
+        self.assertFalse(verify_password('s3cret pasS', first))
+
+    def test_scrypt_round_trip(self):
+        encoded = hash_password('another one', method='scrypt')
+        self.assertTrue(encoded.startswith('scrypt$'))
+        self.assertTrue(verify_password('another one', encoded))
+        self.assertFalse(verify_password('another two', encoded))
+        self.assertFalse(needs_rehash(encoded))
+
+    def test_unknown_or_broken_hashes_never_verify(self):
+        with self.assertRaises(ValueError):
+            hash_password('x', method='md5')
+        for encoded in ('', 'plain', 'md5$abc', 'pbkdf2_sha256$nope$xx$yy', 'pbkdf2_sha256$1000'):
+            self.assertFalse(verify_password('x', encoded))
+
+    def test_cheaper_pbkdf2_hashes_need_a_rehash(self):
+        with mock.patch.object(staff_accounts, 'PBKDF2_ITERATIONS', 1000):
+            cheap = hash_password('pw')
+        self.assertTrue(needs_rehash(cheap))
+        self.assertFalse(needs_rehash(hash_password('pw')))
+
+    def test_legacy_hashes_verify_their_old_passwords(self):
+        passwords = {'K': '17', 'k': '18'}
+        for username, encoded, _ in staff_accounts.LEGACY_ACCOUNTS:
+            self.assertTrue(verify_password(passwords[username], encoded))
+            self.assertFalse(verify_password(passwords[username] + '0', encoded))
+
+
+class StaffTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # cheap hashes keep the suite fast; the format and checks are the same
+        patcher = mock.patch.object(staff_accounts, 'PBKDF2_ITERATIONS', 1000)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmp = tempfile.mkdtemp()
+        self.pool = ConnectionPool(os.path.join(self.tmp, 'staff.db'), readers=2)
+        with self.pool.writer() as conn:
+            migrate(conn)
+        self.deactivated = []
+        self.staff = StaffDirectory(self.pool, on_deactivated=self.deactivated.extend)
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+class AuthenticateTest(StaffTestCase):
+
+    def test_active_account_with_the_right_password(self):
+        self.staff.add('asha', 'password1', 'doctor')
+        self.assertEqual(self.staff.authenticate('asha', 'password1'), 'doctor')
+        self.assertIsNone(self.staff.authenticate('asha', 'password2'))
+        self.assertIsNone(self.staff.authenticate('Asha', 'password1'))
+        self.assertIsNone(self.staff.authenticate('nobody', 'password1'))
+
+    def test_repeat_login_is_served_from_the_verified_cache(self):
+        self.staff.add('asha', 'password1', 'doctor')
+        self.staff.authenticate('asha', 'password1')
+        with mock.patch.object(staff_accounts, 'verify_password', wraps=verify_password) as verify:
+            self.assertEqual(self.staff.authenticate('asha', 'password1'), 'doctor')
+            verify.assert_not_called()
+            # a wrong password is not in the cache: it goes to the stored hash
+            self.assertIsNone(self.staff.authenticate('asha', 'wrong pass'))
+            verify.assert_called_once()
+
+    def test_password_change_and_deactivation_end_cached_logins(self):
+        self.staff.add('asha', 'password1', 'doctor')
+        self.staff.authenticate('asha', 'password1')
+        self.staff.set_password('asha', 'password2')
+        self.assertIsNone(self.staff.authenticate('asha', 'password1'))
+        self.assertEqual(self.staff.authenticate('asha', 'password2'), 'doctor')
+        self.staff.set_active('asha', False)
+        self.assertIsNone(self.staff.authenticate('asha', 'password2'))
+        self.assertFalse(self.staff.is_active('asha'))
+        self.assertEqual(self.deactivated, ['asha'])
+
+    def test_old_hashes_are_upgraded_on_login(self):
+        self.staff.add('asha', 'password1', 'doctor')
+        with mock.patch.object(staff_accounts, 'PBKDF2_ITERATIONS', 2000):
+            self.assertEqual(self.staff.authenticate('asha', 'password1'), 'doctor')
+            with self.pool.reader() as conn:
+                encoded = conn.execute("SELECT password_hash FROM staff_users WHERE username = 'asha'").fetchone()[0]
+            self.assertFalse(needs_rehash(encoded))
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$2000$'))
+
+    def test_provision_rejects_bad_rows_and_reports_deactivations(self):
+        stats = self.staff.provision([
+            ('asha', 'password1', 'doctor'),
+            ('ravi', 'password2', 'nurse', 'false'),
+            ('', 'password3', 'nurse'),
+            ('meera', 'password4', 'surgeon'),
+        ])
+        self.assertEqual((stats['written'], stats['rejected']), (2, 2))
+        self.assertTrue(self.staff.is_active('asha'))
+        self.assertFalse(self.staff.is_active('ravi'))
+        self.assertEqual(self.deactivated, ['ravi'])
+
+
+class LegacyAccountsTest(StaffTestCase):
+
+    def test_first_admin_on_a_fresh_install(self):
+        self.assertTrue(self.staff.needs_setup())
+        with self.assertRaises(ValueError):
+            self.staff.create_first_admin('admin', 'short')
+        with self.assertRaises(ValueError):
+            self.staff.create_first_admin('  ', 'long enough')
+        self.assertEqual(self.staff.create_first_admin('admin', 'long enough'), 'admin')
+        self.assertFalse(self.staff.needs_setup())
+        with self.assertRaises(ValueError):
+            self.staff.create_first_admin('second', 'long enough')
+        # there is nothing to seed once an account exists
+        self.assertFalse(self.staff.seed_legacy_accounts())
+        self.assertIsNone(self.staff.get('K'))
+
+    def test_legacy_logins_work_until_a_real_account_exists(self):
+        self.assertTrue(self.staff.seed_legacy_accounts())
+        self.assertFalse(self.staff.seed_legacy_accounts())
+        self.assertEqual(self.staff.retire_defaults(), 0)
+        self.assertEqual(self.staff.authenticate('K', '17'), 'nurse')
+        self.assertEqual(self.staff.authenticate('k', '18'), 'doctor')
+        self.assertTrue(self.staff.get('K').is_default)
+
+        self.staff.add('asha', 'password1', 'admin')
+        self.assertIsNone(self.staff.authenticate('K', '17'))
+        self.assertIsNone(self.staff.authenticate('k', '18'))
+        self.assertFalse(self.staff.is_active('K'))
+        self.assertEqual(sorted(self.deactivated), ['K', 'k'])
+        self.assertEqual(self.staff.authenticate('asha', 'password1'), 'admin')
+
+    def test_provisioning_a_legacy_name_makes_it_a_real_account(self):
+        self.staff.seed_legacy_accounts()
+        self.staff.add('K', 'a real password', 'nurse')
+        self.assertFalse(self.staff.get('K').is_default)
+        self.assertEqual(self.staff.authenticate('K', 'a real password'), 'nurse')
+        self.assertIsNone(self.staff.authenticate('K', '17'))
+        # k was the only default left, and K is a real account now
+        self.assertFalse(self.staff.is_active('k'))
+        self.assertEqual(self.deactivated, ['k'])
+
+
+if __name__ == '__main__':
+    unittest.main()